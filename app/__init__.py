@@ -1,7 +1,25 @@
 from flask import Flask
 from flask_cors import CORS
+import atexit
 import os
+import threading
 from app.config import load_config, load_google_client
+from app.services.calendar_service import (
+    DEFAULT_MAX_WORKERS, DEFAULT_CALENDAR_TIMEOUT, DEFAULT_PAGE_SIZE, DEFAULT_EVENT_FIELDS,
+    DEFAULT_FETCH_THREADS, configure_fetch_threads
+)
+from app.services.async_calendar_service import DEFAULT_MAX_CONNECTIONS
+from app.services.event_cache import create_event_cache, DEFAULT_SYNC_INTERVAL
+from app.services.event_index import EventIndexCache, DEFAULT_INDEX_ENTRIES
+from app.services.search_index import SearchIndexCache, DEFAULT_SEARCH_ENTRIES
+from app.services.calendar_list import DEFAULT_CALENDAR_LIST_INTERVAL
+from app.responses import DEFAULT_COMPRESS_MIN_SIZE, DEFAULT_COMPRESS_LEVEL
+from app.services.token_store import create_token_store, CredentialManager, DEFAULT_REFRESH_MARGIN
+from app.services.prefetch import create_prefetcher
+from app.services.channels import create_channel_manager
+from app.services.scheduler import configure_scheduler
+from app.services import scheduler
+from app import metrics
 
 # Allow OAuth to work in development environment
 if os.environ.get('FLASK_ENV') == 'development' or os.environ.get('DEBUG'):
@@ -35,6 +53,59 @@ def create_app(config_path=None, google_client_path=None):
         app.config["APP_TITLE"] = config.get("app", {}).get("title", "The Big A$$ Calendar")
         app.config["DEFAULT_YEAR"] = config.get("app", {}).get("default_year", 2025)
         
+        # Configure Google Calendar API settings
+        calendar_api = config.get("calendar_api", {})
+        app.config["FETCH_MAX_WORKERS"] = calendar_api.get("max_workers", DEFAULT_MAX_WORKERS)
+        app.config["FETCH_TIMEOUT"] = calendar_api.get("timeout", DEFAULT_CALENDAR_TIMEOUT)
+        app.config["FETCH_PAGE_SIZE"] = calendar_api.get("page_size", DEFAULT_PAGE_SIZE)
+        app.config["FETCH_FIELDS"] = calendar_api.get("fields", DEFAULT_EVENT_FIELDS)
+        app.config["ASYNC_MAX_CONNECTIONS"] = calendar_api.get("max_connections", DEFAULT_MAX_CONNECTIONS)
+        
+        # Threads shared by all requests for fetching calendars
+        configure_fetch_threads(calendar_api.get("fetch_threads", DEFAULT_FETCH_THREADS))
+        
+        # Rate limits, retries and the concurrency cap for calls to Google
+        configure_scheduler(calendar_api)
+        
+        # Configure the server-side event cache
+        cache_config = config.get("cache", {})
+        app.config["CACHE_SYNC_INTERVAL"] = cache_config.get("sync_interval", DEFAULT_SYNC_INTERVAL)
+        app.config["CALENDAR_LIST_INTERVAL"] = cache_config.get(
+            "calendar_list_interval", DEFAULT_CALENDAR_LIST_INTERVAL
+        )
+        app.config["CACHE_SHARED_CALENDARS"] = cache_config.get("shared_calendars", True)
+        app.extensions["event_cache"] = create_event_cache(cache_config)
+        app.extensions["event_index"] = EventIndexCache(cache_config.get("max_entries", DEFAULT_INDEX_ENTRIES))
+        app.extensions["search_index"] = SearchIndexCache(cache_config.get("max_entries", DEFAULT_SEARCH_ENTRIES))
+        
+        # Configure response compression
+        compression = config.get("compression", {})
+        app.config["COMPRESS_MIN_SIZE"] = compression.get("min_size", DEFAULT_COMPRESS_MIN_SIZE)
+        app.config["COMPRESS_LEVEL"] = compression.get("level", DEFAULT_COMPRESS_LEVEL)
+        
+        # Configure the server-side credential store
+        token_store = config.get("token_store", {})
+        app.extensions["credentials"] = CredentialManager(
+            create_token_store(token_store),
+            refresh_margin=token_store.get("refresh_margin", DEFAULT_REFRESH_MARGIN)
+        )
+        
+        # Configure background prefetching of adjacent years
+        app.extensions["prefetcher"] = create_prefetcher(config.get("prefetch", {}))
+        
+        # Configure push notifications keeping cached calendars fresh
+        app.extensions["channels"] = create_channel_manager(
+            config.get("push", {}), app.extensions["event_cache"], app.config["SECRET_KEY"]
+        )
+        
+        # Configure request instrumentation
+        metrics_config = config.get("metrics", {})
+        # Off unless asked for; /metrics reveals traffic and usage
+        app.config["METRICS_ENABLED"] = metrics_config.get("enabled", False)
+        app.config["METRICS_TOKEN"] = metrics_config.get("token") or None
+        app.config["SERVER_TIMING"] = metrics_config.get("server_timing", True)
+        app.config["PROFILE_DIR"] = metrics_config.get("profile_dir") or None
+        
     except FileNotFoundError as e:
         app.logger.warning(f"Configuration error: {e}")
         app.logger.warning("Using default configuration values")
@@ -44,6 +115,31 @@ def create_app(config_path=None, google_client_path=None):
         app.config["DEBUG"] = True
         app.config["APP_TITLE"] = "The Big A$$ Calendar"
         app.config["DEFAULT_YEAR"] = 2025
+        app.config["FETCH_MAX_WORKERS"] = DEFAULT_MAX_WORKERS
+        app.config["FETCH_TIMEOUT"] = DEFAULT_CALENDAR_TIMEOUT
+        app.config["FETCH_PAGE_SIZE"] = DEFAULT_PAGE_SIZE
+        app.config["FETCH_FIELDS"] = DEFAULT_EVENT_FIELDS
+        app.config["ASYNC_MAX_CONNECTIONS"] = DEFAULT_MAX_CONNECTIONS
+        configure_fetch_threads(DEFAULT_FETCH_THREADS)
+        configure_scheduler({})
+        app.config["CACHE_SYNC_INTERVAL"] = DEFAULT_SYNC_INTERVAL
+        app.config["CALENDAR_LIST_INTERVAL"] = DEFAULT_CALENDAR_LIST_INTERVAL
+        app.config["CACHE_SHARED_CALENDARS"] = True
+        app.extensions["event_cache"] = create_event_cache({})
+        app.extensions["event_index"] = EventIndexCache()
+        app.extensions["search_index"] = SearchIndexCache()
+        app.config["COMPRESS_MIN_SIZE"] = DEFAULT_COMPRESS_MIN_SIZE
+        app.config["COMPRESS_LEVEL"] = DEFAULT_COMPRESS_LEVEL
+        app.extensions["credentials"] = CredentialManager(create_token_store({}))
+        app.extensions["prefetcher"] = create_prefetcher({})
+        app.extensions["channels"] = None
+        app.config["METRICS_ENABLED"] = False
+        app.config["METRICS_TOKEN"] = None
+        app.config["SERVER_TIMING"] = True
+        app.config["PROFILE_DIR"] = None
+    
+    # Identical requests in flight share one load
+    scheduler.init_app(app)
     
     # Load Google client configuration
     google_client_config, from_file = load_google_client(google_client_path)
@@ -72,6 +168,9 @@ def create_app(config_path=None, google_client_path=None):
             }
         }
     
+    # Cancel queued background work instead of finishing it at exit
+    register_shutdown(shutdown_background_work, app.extensions)
+    
     # Register blueprints
     from app.routes.auth import auth_bp
     from app.routes.calendar import calendar_bp
@@ -79,4 +178,37 @@ def create_app(config_path=None, google_client_path=None):
     app.register_blueprint(auth_bp)
     app.register_blueprint(calendar_bp)
     
-    return app
\ No newline at end of file
+    if app.config["METRICS_ENABLED"]:
+        from app.routes.metrics import metrics_bp
+        
+        metrics.init_app(app, server_timing=app.config["SERVER_TIMING"],
+                         profile_dir=app.config["PROFILE_DIR"], token=app.config["METRICS_TOKEN"])
+        app.register_blueprint(metrics_bp)
+    
+    return app
+
+def register_shutdown(callback, *args):
+    """
+    Run a callback when the interpreter exits, before it waits for worker
+    threads; plain atexit handlers only run after non-daemon threads, and
+    the queued jobs of their executors, have finished.
+    
+    Args:
+        callback: Callable to run
+        args: Arguments passed to the callback
+    """
+    # concurrent.futures registers its own exit handler the same way
+    register = getattr(threading, "_register_atexit", atexit.register)
+    register(callback, *args)
+
+def shutdown_background_work(extensions):
+    """
+    Stop the background workers of an app.
+    
+    Args:
+        extensions: The app's extensions dict
+    """
+    for name in ("prefetcher", "channels"):
+        worker = extensions.get(name)
+        if worker is not None:
+            worker.shutdown()
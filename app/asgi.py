@@ -0,0 +1,240 @@
+from app import create_app, shutdown_background_work
+from app.routes import async_calendar
+from app.services.async_calendar_service import (
+    create_http_client, CALENDAR_API_URL, DEFAULT_MAX_CONNECTIONS
+)
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+import asyncio
+import contextvars
+import io
+import re
+import sys
+
+class AsgiApp:
+    """
+    ASGI entry point serving the hot API routes natively with asyncio.
+
+    Year fetches, calendar listing and note writes (see
+    routes/async_calendar.py) await Google on the event loop, so a single
+    process can hold hundreds of them in flight without a thread each.
+    Every other route, including OAuth, pages, static files and the
+    streaming events endpoint, is passed to the Flask app on a worker
+    thread.
+
+    Args:
+        flask_app: Flask application built by create_app
+        threads: Size of the thread pool running Flask routes, or None for
+                 asyncio's default
+    """
+
+    def __init__(self, flask_app, threads=None):
+        self.flask_app = flask_app
+        self.threads = threads
+        self.routes = [
+            (method, re.compile(pattern + "$"), handler)
+            for method, pattern, handler in async_calendar.ROUTES
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+
+        if scope["type"] != "http":
+            return
+
+        body = await read_body(receive)
+        environ = build_environ(scope, body)
+
+        handler, kwargs = self.match(scope, environ)
+        if handler is None:
+            await self.call_wsgi(environ, send)
+        else:
+            await self.call_async(handler, kwargs, environ, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if self.threads:
+                    asyncio.get_running_loop().set_default_executor(
+                        ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="flask")
+                    )
+                self.http_client()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                http = self.flask_app.extensions.pop("async_http", None)
+                if http is not None:
+                    await http.aclose()
+                shutdown_background_work(self.flask_app.extensions)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def http_client(self):
+        # Created on first use when the server does not send lifespan events
+        extensions = self.flask_app.extensions
+        if "async_http" not in extensions:
+            extensions["async_http"] = create_http_client(
+                max_connections=self.flask_app.config.get("ASYNC_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS),
+                timeout=self.flask_app.config.get("FETCH_TIMEOUT")
+            )
+        return extensions["async_http"]
+
+    def match(self, scope, environ):
+        path = scope["path"]
+
+        # Streamed year loads and date ranges stay on the Flask implementation
+        if path == "/api/events":
+            query = parse_qs(environ["QUERY_STRING"])
+            if query.get("stream", [""])[0] in ("1", "true") or "start" in query or "end" in query:
+                return None, None
+
+        for method, pattern, handler in self.routes:
+            found = pattern.match(path)
+            if found and scope["method"] == method:
+                return handler, found.groupdict()
+        return None, None
+
+    async def call_async(self, handler, kwargs, environ, send):
+        self.http_client()
+        app = self.flask_app
+
+        with app.request_context(environ):
+            try:
+                # before_request hooks (request timing) may answer on their own
+                result = app.preprocess_request()
+                if result is None:
+                    result = await handler(**kwargs)
+            except Exception as e:
+                result = app.handle_exception(e)
+            # Runs after_request hooks (CORS) and saves the session cookie
+            response = app.process_response(app.make_response(result))
+            body = b"" if environ["REQUEST_METHOD"] == "HEAD" else response.get_data()
+
+        await send({
+            "type": "http.response.start",
+            "status": response.status_code,
+            "headers": encode_headers(response.headers.items())
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def call_wsgi(self, environ, send):
+        loop = asyncio.get_running_loop()
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = headers
+
+        # Every step runs in the same context: Flask pushes its request
+        # context when a streamed body starts and pops it when it ends
+        context = contextvars.copy_context()
+
+        def run(func, *args):
+            return loop.run_in_executor(None, context.run, func, *args)
+
+        result = await run(self.flask_app, environ, start_response)
+        chunks = iter(result)
+
+        # Forward the body chunk by chunk so streamed responses stay streamed
+        sent_start = False
+        try:
+            while True:
+                chunk = await run(next, chunks, None)
+                if not sent_start:
+                    await send({
+                        "type": "http.response.start",
+                        "status": started["status"],
+                        "headers": encode_headers(started["headers"])
+                    })
+                    sent_start = True
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        finally:
+            if hasattr(result, "close"):
+                await run(result.close)
+
+        await send({"type": "http.response.body", "body": b""})
+
+async def read_body(receive):
+    """Read the complete request body of an ASGI HTTP request"""
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    return body
+
+def build_environ(scope, body):
+    """
+    Translate an ASGI HTTP scope into a WSGI environ.
+
+    Args:
+        scope: ASGI connection scope
+        body: Complete request body
+
+    Returns:
+        WSGI environ dictionary
+    """
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        # WSGI carries the raw path bytes as a latin-1 string
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False
+    }
+
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name == "CONTENT_LENGTH":
+            continue
+        else:
+            key = "HTTP_" + name
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+
+    return environ
+
+def encode_headers(headers):
+    """Encode (name, value) header pairs for an ASGI response"""
+    return [(name.lower().encode("latin-1"), str(value).encode("latin-1")) for name, value in headers]
+
+def create_asgi_app(config_path=None, google_client_path=None, threads=None):
+    """
+    Create the ASGI application
+
+    Args:
+        config_path: Optional path to the config.yaml file
+        google_client_path: Optional path to the google_client.json file
+        threads: Size of the thread pool running Flask routes
+
+    Returns:
+        ASGI application, e.g. for `uvicorn --factory app.asgi:create_asgi_app`
+    """
+    flask_app = create_app(config_path, google_client_path)
+    flask_app.config.setdefault("CALENDAR_API_URL", CALENDAR_API_URL)
+    return AsgiApp(flask_app, threads=threads)
@@ -0,0 +1,344 @@
+from contextlib import contextmanager
+import bisect
+import contextvars
+import hmac
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Prefix of every exported metric name
+METRIC_PREFIX = "bigasscalendar_"
+
+# Histogram buckets for durations (seconds) and payload sizes (bytes)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+class Counter:
+    """
+    Monotonic counter with labels.
+
+    Args:
+        name: Metric name
+        documentation: Help text
+        labelnames: Names of the labels every sample carries
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Return the current value for a label set"""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name + "_total", key, value
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+class Histogram(Counter):
+    """
+    Histogram with cumulative buckets, a sum and a count per label set.
+
+    Args:
+        name: Metric name
+        documentation: Help text
+        labelnames: Names of the labels every sample carries
+        buckets: Upper bounds of the buckets, ascending
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One slot per bucket, then +Inf, then the sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            counts[position] += 1
+            counts[-1] += value
+
+    def count(self, **labels):
+        """Return the number of observations for a label set"""
+        with self._lock:
+            counts = self._values.get(self._key(labels))
+            return sum(counts[:-1]) if counts else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(counts)) for key, counts in self._values.items())
+        for key, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts[:-1]):
+                cumulative += count
+                yield self.name + "_bucket", key + (("le", bound),), cumulative
+            yield self.name + "_sum", key, counts[-1]
+            yield self.name + "_count", key, cumulative
+
+class Registry:
+    """Collection of metrics rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(METRIC_PREFIX + name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(METRIC_PREFIX + name, documentation, labelnames, buckets))
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Returns:
+            String for a /metrics response body
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                labels = list(zip(metric.labelnames, key))
+                if len(key) > len(metric.labelnames):
+                    labels.append(key[-1])
+                rendered = ",".join(f'{label}="{_escape(label_value)}"' for label, label_value in labels)
+                lines.append(f"{name}{{{rendered}}} {_number(value)}" if rendered else f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time spent handling HTTP requests.",
+    ("endpoint", "method", "status")
+)
+HTTP_RESPONSE_BYTES = REGISTRY.histogram(
+    "http_response_size_bytes", "Size of HTTP response bodies as sent.",
+    ("endpoint",), buckets=SIZE_BUCKETS
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "stage_duration_seconds", "Time spent in each stage of building a response.",
+    ("stage",)
+)
+GOOGLE_REQUESTS = REGISTRY.counter(
+    "google_requests", "Calendar API calls by method and HTTP status.",
+    ("method", "status")
+)
+GOOGLE_REQUEST_SECONDS = REGISTRY.histogram(
+    "google_request_duration_seconds", "Latency of Calendar API calls.",
+    ("method",)
+)
+CALENDAR_FETCH_SECONDS = REGISTRY.histogram(
+    "calendar_fetch_duration_seconds", "Time to fetch all pages of one calendar year.",
+    ("outcome",)
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "event_cache_lookups", "Event cache lookups: fresh (served as is), sync (incremental) or miss.",
+    ("result",)
+)
+SHARED_CACHE_READS = REGISTRY.counter(
+    "shared_cache_reads", "Calendar years read through the cache tier shared between users."
+)
+
+class RequestTimings:
+    """
+    Stage durations of one request, shared with the worker threads that
+    fetch calendars for it.
+
+    Stages run concurrently across calendars are summed, so for example the
+    "google" stage can exceed the wall time of the request.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def server_timing(self):
+        """
+        Build a Server-Timing header value.
+
+        Returns:
+            e.g. "google;dur=412.0, notes;dur=1.2, total;dur=430.5"
+        """
+        with self._lock:
+            stages = list(self.stages.items())
+        stages.append(("total", time.perf_counter() - self.started))
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages)
+
+_timings = contextvars.ContextVar("request_timings", default=None)
+
+def start_request():
+    """Start collecting stage timings for the current request"""
+    timings = RequestTimings()
+    _timings.set(timings)
+    return timings
+
+def current_timings():
+    """Return the timings of the current request, or None outside one"""
+    return _timings.get()
+
+@contextmanager
+def stage(name):
+    """
+    Time a block as a named stage of the current request.
+
+    The duration is added to the request's Server-Timing breakdown and to
+    the stage histogram; outside a request only the histogram is updated.
+
+    Args:
+        name: Stage name, e.g. "notes" or "serialize"
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        timings = _timings.get()
+        if timings is not None:
+            timings.add(name, elapsed)
+
+def record_google_call(method, status, seconds):
+    """
+    Record one Calendar API call.
+
+    Args:
+        method: API method, e.g. "events.list"
+        status: HTTP status, or "error" when no response arrived
+        seconds: Duration of the call
+    """
+    GOOGLE_REQUESTS.inc(method=method, status=status)
+    GOOGLE_REQUEST_SECONDS.observe(seconds, method=method)
+    STAGE_SECONDS.observe(seconds, stage="google")
+    timings = _timings.get()
+    if timings is not None:
+        timings.add("google", seconds)
+
+def bearer_token_matches(authorization, token):
+    """
+    Check an Authorization header against the metrics token.
+
+    Args:
+        authorization: Value of the Authorization header, or None
+        token: The configured metrics token
+
+    Returns:
+        True if the header is "Bearer <token>"
+    """
+    supplied = (authorization or "").encode("utf-8")
+    return hmac.compare_digest(supplied, f"Bearer {token}".encode("utf-8"))
+
+def init_app(app, server_timing=True, profile_dir=None, token=None):
+    """
+    Install request instrumentation on a Flask app.
+
+    Every request is timed by endpoint, method and status and its response
+    size recorded. With server_timing, responses carry a Server-Timing
+    header with the stage breakdown. With profile_dir and a token, requests
+    with ?profile=1 that carry the token run under cProfile and write a
+    .prof file there.
+
+    Args:
+        app: Flask application
+        server_timing: Add Server-Timing headers to responses
+        profile_dir: Directory for per-request profiles, or None to disable
+        token: Metrics token profiled requests must send; profiling stays
+               off without one
+    """
+    from flask import request
+
+    @app.before_request
+    def start_timing():
+        start_request()
+
+    @app.after_request
+    def record_request(response):
+        timings = current_timings() or start_request()
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - timings.started,
+            endpoint=endpoint, method=request.method, status=response.status_code
+        )
+
+        # Streamed bodies have no length yet
+        if not response.is_streamed:
+            HTTP_RESPONSE_BYTES.observe(response.calculate_content_length() or 0, endpoint=endpoint)
+
+        if server_timing:
+            response.headers["Server-Timing"] = timings.server_timing()
+        return response
+
+    if profile_dir and token:
+        app.wsgi_app = ProfileRequests(app.wsgi_app, profile_dir, token)
+    elif profile_dir:
+        # Anyone could fill the disk with profiles
+        logger.warning("metrics.profile_dir is ignored until metrics.token is set")
+
+class ProfileRequests:
+    """
+    WSGI middleware running requests that ask for it (?profile=1) under
+    cProfile, writing one .prof file per request for `python -m pstats`
+    or snakeviz. Only requests sending the metrics token as
+    `Authorization: Bearer <token>` are profiled.
+
+    Args:
+        wsgi_app: WSGI application to wrap
+        profile_dir: Directory receiving the profiles
+        token: Metrics token profiled requests must send
+    """
+
+    def __init__(self, wsgi_app, profile_dir, token):
+        from werkzeug.middleware.profiler import ProfilerMiddleware
+
+        os.makedirs(profile_dir, exist_ok=True)
+        self.wsgi_app = wsgi_app
+        self.token = token
+        self.profiled_app = ProfilerMiddleware(wsgi_app, stream=None, profile_dir=profile_dir)
+
+    def __call__(self, environ, start_response):
+        query = environ.get("QUERY_STRING", "")
+        if "profile=1" in query.split("&") and bearer_token_matches(environ.get("HTTP_AUTHORIZATION"), self.token):
+            return self.profiled_app(environ, start_response)
+        return self.wsgi_app(environ, start_response)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
@@ -0,0 +1,118 @@
+from flask import current_app, request
+from app.metrics import stage
+import hashlib
+import zlib
+
+try:
+    import brotli
+except ImportError:  # Optional dependency; gzip is always available
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed
+DEFAULT_COMPRESS_MIN_SIZE = 1024
+
+# zlib compression level (brotli uses its own default quality)
+DEFAULT_COMPRESS_LEVEL = 6
+
+def json_response(payload, status=200):
+    """
+    Serialize a payload to JSON with a strong ETag, answering 304 Not
+    Modified when the client already has it and compressing large bodies.
+
+    The ETag is a hash of the serialized JSON, so it changes whenever any
+    event, note or error in the payload changes. Compressed variants get
+    their own tags ("<hash>-gzip"), as a strong validator must identify the
+    exact bytes sent, but any variant's tag validates the others.
+
+    Args:
+        payload: JSON serializable object
+        status: HTTP status of the full response
+
+    Returns:
+        Flask response
+    """
+    with stage("serialize"):
+        body = current_app.json.dumps(payload).encode("utf-8")
+        digest = hashlib.sha256(body).hexdigest()[:32]
+
+    response = current_app.response_class(status=status, mimetype="application/json")
+    response.vary.add("Accept-Encoding")
+    # User specific data: browsers may keep it but must revalidate each time
+    response.headers["Cache-Control"] = "private, no-cache"
+
+    encoding = negotiate_encoding() if len(body) >= current_app.config.get(
+        "COMPRESS_MIN_SIZE", DEFAULT_COMPRESS_MIN_SIZE
+    ) else None
+    response.set_etag(f"{digest}-{encoding}" if encoding else digest)
+
+    if status == 200 and _etag_matches(request.headers.get("If-None-Match"), digest):
+        response.status_code = 304
+        return response
+
+    if encoding:
+        with stage("compress"):
+            body = compress(body, encoding)
+        response.headers["Content-Encoding"] = encoding
+
+    response.set_data(body)
+    return response
+
+def negotiate_encoding():
+    """
+    Pick the best content encoding the client accepts.
+
+    Returns:
+        "br", "gzip" or None for an uncompressed body
+    """
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"] > 0:
+        return "br"
+    if accepted["gzip"] > 0:
+        return "gzip"
+    return None
+
+def compress(body, encoding):
+    """Compress a complete body with the given content encoding"""
+    if encoding == "br":
+        return brotli.compress(body)
+
+    # wbits=31 writes the gzip container rather than raw zlib
+    level = current_app.config.get("COMPRESS_LEVEL", DEFAULT_COMPRESS_LEVEL)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+def gzip_stream(chunks, level=DEFAULT_COMPRESS_LEVEL):
+    """
+    Gzip a streamed body chunk by chunk.
+
+    Every chunk is flushed on its own, so the client can decompress and use
+    it as soon as it arrives instead of waiting for the whole stream.
+
+    Args:
+        chunks: Iterable of str or bytes chunks
+        level: zlib compression level
+
+    Yields:
+        Compressed bytes
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+def _etag_matches(if_none_match, digest):
+    # If-None-Match uses weak comparison; ignore W/ and encoding suffixes
+    if not if_none_match:
+        return False
+
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        tag = tag.removeprefix("W/").strip('"')
+        if tag.split("-", 1)[0] == digest:
+            return True
+
+    return False
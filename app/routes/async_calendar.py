@@ -0,0 +1,196 @@
+from flask import jsonify, request, current_app
+from app.routes.auth import current_credentials, current_user_key
+from app.routes.calendar import (
+    fetch_options, cached_description, prefetch_adjacent_years, watch_calendars, is_read_only,
+    events_request_key
+)
+from app.services.async_calendar_service import (
+    get_events_for_year, list_calendars, update_event_note
+)
+from app.services.calendar_list import cached_calendar_list, calendar_colors, DEFAULT_CALENDAR_LIST_INTERVAL
+from app.services.scheduler import set_current_user
+from app.responses import json_response
+from datetime import datetime
+import asyncio
+import json
+
+# Async versions of the hot API routes, served natively by the ASGI entry
+# point (app/asgi.py). Each handler runs inside a Flask request context and
+# returns a Flask response, so validation, sessions and the response
+# format are the same as in routes/calendar.py; only waiting on Google is
+# done without holding a thread.
+
+async def get_calendars():
+    """Get user's calendar list from Google Calendar API"""
+    credentials = await authenticate()
+    if credentials is None:
+        return jsonify({"error": "Not authenticated"}), 401
+
+    calendars = await list_calendars(
+        credentials, http_client(), base_url=api_base_url(),
+        cache=current_app.extensions.get("event_cache"),
+        user_key=current_user_key(),
+        refresh_interval=current_app.config.get("CALENDAR_LIST_INTERVAL", DEFAULT_CALENDAR_LIST_INTERVAL)
+    )
+    return json_response(calendars)
+
+async def get_events():
+    """Get events for a specific year from Google Calendar API"""
+    credentials = await authenticate()
+    if credentials is None:
+        return jsonify({"error": "Not authenticated"}), 401
+
+    # Get year from query params or use default from config
+    default_year = current_app.config.get("DEFAULT_YEAR", datetime.now().year)
+    year = request.args.get("year", default_year)
+    try:
+        year = int(year)
+    except ValueError:
+        return jsonify({"error": "Invalid year parameter"}), 400
+
+    calendar_ids = request.args.getlist("calendar_id")
+    if not calendar_ids:
+        return jsonify({"error": "No calendar IDs provided"}), 400
+
+    response_format = request.args.get("format", "compact")
+    if response_format not in ("compact", "legacy"):
+        return jsonify({"error": "Invalid format parameter"}), 400
+
+    errors = {}
+    # Reads the cached calendar list, which may block on sqlite
+    options = await asyncio.to_thread(fetch_options, credentials)
+    detail = request.args.get("detail") == "full"
+
+    async def load():
+        events = await get_events_for_year(
+            credentials, year, calendar_ids, http_client(), errors=errors,
+            compact=(response_format == "compact"), detail=detail, base_url=api_base_url(), **options
+        )
+        return events, errors
+
+    # Identical requests in flight (a double click, several tabs) share one load
+    key = events_request_key(options["user_key"], year, calendar_ids, response_format, detail)
+    flights = current_app.extensions.get("single_flight")
+    events, errors = await (flights.do_async(key, load) if flights is not None else load())
+
+    if errors:
+        current_app.logger.warning(f"Failed to fetch calendars: {errors}")
+
+        # Nothing to show if every calendar failed
+        if len(errors) == len(set(calendar_ids)):
+            return jsonify({"error": "Failed to fetch events", "calendars": errors}), 502
+
+    # Warm the previous and next year while the user looks at this one
+    await asyncio.to_thread(prefetch_adjacent_years, credentials, year, calendar_ids, options)
+    await asyncio.to_thread(
+        watch_calendars, credentials, [calendar_id for calendar_id in calendar_ids if calendar_id not in errors], options
+    )
+
+    if response_format == "compact":
+        # The shared result is not modified
+        events = dict(events, errors=errors)
+        events["calendars"] = await requested_calendars(credentials, calendar_ids, options)
+
+    # Serializing (and compressing) a year takes milliseconds; keep the loop free
+    response = await asyncio.to_thread(json_response, events)
+
+    # Report partially failed calendars without changing the legacy payload shape
+    if errors:
+        response.headers["X-Calendar-Errors"] = json.dumps(errors)
+
+    return response
+
+async def update_note(event_id):
+    """Update a note for a specific event"""
+    credentials = await authenticate()
+    if credentials is None:
+        return jsonify({"error": "Not authenticated"}), 401
+
+    data = request.get_json(silent=True)
+    if not data or "note" not in data:
+        return jsonify({"error": "Note data is required"}), 400
+
+    calendar_id = request.args.get("calendar_id")
+    if not calendar_id:
+        return jsonify({"error": "Calendar ID is required"}), 400
+
+    cache = current_app.extensions.get("event_cache")
+    user_key = current_user_key()
+
+    # Google would refuse the write; answer without the round trip
+    if await asyncio.to_thread(is_read_only, cache, user_key, calendar_id):
+        return jsonify({"error": "Calendar is read-only"}), 403
+
+    etag = data.get("etag")
+    description = await asyncio.to_thread(cached_description, cache, user_key, calendar_id, event_id, etag)
+    updated = await update_event_note(
+        credentials, calendar_id, event_id, data["note"], http_client(),
+        etag=etag, description=description, base_url=api_base_url()
+    )
+
+    # Keep cached copies of the event in step with Google
+    if updated and cache is not None:
+        await asyncio.to_thread(cache.update_event, user_key, calendar_id, event_id, {
+            "etag": updated.get("etag"),
+            "description": updated.get("description", "")
+        })
+
+    if updated:
+        return jsonify({"success": True, "etag": updated.get("etag")})
+    else:
+        return jsonify({"error": "Failed to update event note"}), 500
+
+async def requested_calendars(credentials, calendar_ids, options):
+    """Async counterpart of calendar.requested_calendars"""
+    cache = options["cache"]
+    if cache is None:
+        return {}
+
+    calendars = await asyncio.to_thread(cached_calendar_list, cache, options["user_key"])
+    if calendars is None:
+        def load():
+            return list_calendars(credentials, http_client(), base_url=api_base_url(),
+                                  cache=cache, user_key=options["user_key"])
+
+        # Concurrent first loads of several years share one listing
+        flights = current_app.extensions.get("single_flight")
+        try:
+            listed = await (flights.do_async(("calendars", options["user_key"]), load)
+                            if flights is not None else load())
+            calendars = {calendar["id"]: calendar for calendar in listed}
+        except Exception as e:
+            # Colors are optional; the events are still served without them
+            current_app.logger.warning(f"Failed to load the calendar list: {e}")
+            return {}
+
+    return calendar_colors(calendars, calendar_ids)
+
+async def authenticate():
+    """
+    Look up the session's credentials without blocking the event loop.
+
+    Returns:
+        Google OAuth credentials, or None if the user is not logged in
+    """
+    # A token store lookup or token refresh may block; the copied context
+    # keeps the request context available in the worker thread
+    credentials = await asyncio.to_thread(current_credentials)
+    if credentials is not None:
+        # The thread's context is a copy; charge Google calls here too
+        set_current_user(current_user_key())
+    return credentials
+
+def http_client():
+    """Return the shared async HTTP client of the ASGI app"""
+    return current_app.extensions["async_http"]
+
+def api_base_url():
+    """Return the Calendar REST API base URL (overridable for tests)"""
+    return current_app.config["CALENDAR_API_URL"]
+
+# Routes handled natively: (method, path pattern, handler)
+ROUTES = [
+    ("GET", r"/api/calendars", get_calendars),
+    ("GET", r"/api/events", get_events),
+    ("PUT", r"/api/events/(?P<event_id>[^/]+)/note", update_note),
+]
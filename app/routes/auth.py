@@ -1,7 +1,10 @@
-from flask import Blueprint, redirect, url_for, session, current_app, request, jsonify
+from flask import Blueprint, redirect, url_for, session, current_app, request, jsonify, g
 import google.oauth2.credentials
 import google_auth_oauthlib.flow
 from googleapiclient.discovery import build
+from app.services.token_store import credentials_from_dict
+from app.services.event_cache import user_cache_key
+from app.services.scheduler import set_current_user
 import os
 import copy
 
@@ -65,32 +68,84 @@ def oauth2callback():
     authorization_response = request.url
     flow.fetch_token(authorization_response=authorization_response)
     
-    # Store credentials in session
-    credentials = flow.credentials
-    session["credentials"] = {
-        "token": credentials.token,
-        "refresh_token": credentials.refresh_token,
-        "token_uri": credentials.token_uri,
-        "client_id": credentials.client_id,
-        "client_secret": credentials.client_secret,
-        "scopes": credentials.scopes
-    }
+    # Keep credentials server-side; the session only holds an opaque ID
+    manager = current_app.extensions["credentials"]
+    if "sid" in session:
+        manager.logout(session["sid"])
+    session["sid"] = manager.login(flow.credentials)
     
     return redirect(url_for("calendar.index"))
 
 @auth_bp.route("/logout")
 def logout():
-    if "credentials" in session:
-        del session["credentials"]
+    if "sid" in session:
+        session_id = session.pop("sid")
+        credentials = current_app.extensions["credentials"].logout(session_id)
+        if credentials is not None:
+            end_background_work(user_cache_key(session_id, credentials))
+    session.pop("credentials", None)
     
     return redirect(url_for("calendar.index"))
 
+def end_background_work(user_key):
+    """
+    Stop the work done in the background for a user who logged out.
+    
+    Args:
+        user_key: Cache key of the user (see user_cache_key)
+    """
+    prefetcher = current_app.extensions.get("prefetcher")
+    if prefetcher is not None:
+        prefetcher.forget(user_key)
+    
+    # Channels opened with the user's credentials must not be renewed with them
+    channels = current_app.extensions.get("channels")
+    if channels is not None:
+        channels.forget(user_key)
+
 @auth_bp.route("/check-auth")
 def check_auth():
-    if "credentials" in session:
+    if current_credentials() is not None:
         return jsonify({"authenticated": True})
     return jsonify({"authenticated": False})
 
+def current_credentials():
+    """
+    Return live Google credentials for the current session.
+    
+    Sessions from before credentials were stored server-side still carry
+    them in the cookie; they are moved into the store on first use.
+    
+    Returns:
+        Google OAuth credentials, or None if the user is not logged in
+    """
+    manager = current_app.extensions["credentials"]
+    
+    if "credentials" in session:
+        session["sid"] = manager.login(credentials_from_dict(session.pop("credentials")))
+    
+    if "sid" not in session:
+        return None
+    
+    credentials = manager.get(session["sid"])
+    if credentials is None:
+        # The login expired or was removed from the store
+        session.pop("sid")
+    else:
+        g.user_key = user_cache_key(session["sid"], credentials)
+        # Google calls made for this request count against the user's rate limit
+        set_current_user(g.user_key)
+    return credentials
+
+def current_user_key():
+    """
+    Return the cache key of the user authenticated by current_credentials.
+    
+    Returns:
+        Hex string identifying the user (see user_cache_key)
+    """
+    return g.user_key
+
 @auth_bp.route("/debug-oauth")
 def debug_oauth():
     """Debug endpoint to check OAuth configuration"""
@@ -1,8 +1,23 @@
-from flask import Blueprint, render_template, session, jsonify, request, current_app
-import google.oauth2.credentials
-from googleapiclient.discovery import build
-from app.services.calendar_service import get_events_for_year, update_event_note
-from datetime import datetime
+from flask import (
+    Blueprint, render_template, jsonify, request, current_app,
+    Response, stream_with_context
+)
+from app.routes.auth import current_credentials, current_user_key
+from app.services.calendar_service import (
+    get_events_for_year, get_events_for_day, get_events_for_range, stream_events_for_year, search_events,
+    update_event_note, update_event_notes,
+    DEFAULT_MAX_WORKERS, DEFAULT_CALENDAR_TIMEOUT, DEFAULT_PAGE_SIZE, DEFAULT_EVENT_FIELDS, MAX_RANGE_DAYS,
+    DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT
+)
+from app.services.google_client import get_calendar_service
+from app.services.calendar_list import (
+    get_calendar_list, cached_calendar_list, calendar_colors, find_calendar, shared_calendars,
+    WRITABLE_ROLES, DEFAULT_CALENDAR_LIST_INTERVAL
+)
+from app.responses import json_response, gzip_stream, DEFAULT_COMPRESS_LEVEL
+from app.services.event_cache import DEFAULT_SYNC_INTERVAL
+from datetime import date, datetime
+import json
 
 calendar_bp = Blueprint("calendar", __name__)
 
@@ -32,40 +47,25 @@ def get_app_config():
 @calendar_bp.route("/api/calendars")
 def get_calendars():
     """Get user's calendar list from Google Calendar API"""
-    if "credentials" not in session:
+    credentials = current_credentials()
+    if credentials is None:
         return jsonify({"error": "Not authenticated"}), 401
     
-    credentials = google.oauth2.credentials.Credentials(**session["credentials"])
-    service = build("calendar", "v3", credentials=credentials)
-    
-    calendar_list = service.calendarList().list().execute()
-    
-    calendars = []
-    for calendar in calendar_list.get("items", []):
-        calendars.append({
-            "id": calendar["id"],
-            "summary": calendar["summary"],
-            "backgroundColor": calendar.get("backgroundColor", "#4285F4"),
-            "foregroundColor": calendar.get("foregroundColor", "#FFFFFF"),
-            "selected": calendar.get("selected", True)
-        })
-    
-    # Update session credentials (they might have been refreshed)
-    session["credentials"] = {
-        "token": credentials.token,
-        "refresh_token": credentials.refresh_token,
-        "token_uri": credentials.token_uri,
-        "client_id": credentials.client_id,
-        "client_secret": credentials.client_secret,
-        "scopes": credentials.scopes
-    }
+    # Served from the event cache and refreshed incrementally with a sync token
+    calendars = get_calendar_list(
+        get_calendar_service(credentials),
+        cache=current_app.extensions.get("event_cache"),
+        user_key=current_user_key(),
+        refresh_interval=current_app.config.get("CALENDAR_LIST_INTERVAL", DEFAULT_CALENDAR_LIST_INTERVAL)
+    )
     
-    return jsonify(calendars)
+    return json_response(calendars)
 
 @calendar_bp.route("/api/events")
 def get_events():
     """Get events for a specific year from Google Calendar API"""
-    if "credentials" not in session:
+    credentials = current_credentials()
+    if credentials is None:
         return jsonify({"error": "Not authenticated"}), 401
     
     # Get year from query params or use default from config
@@ -80,26 +80,194 @@ def get_events():
     if not calendar_ids:
         return jsonify({"error": "No calendar IDs provided"}), 400
     
-    credentials = google.oauth2.credentials.Credentials(**session["credentials"])
+    # The compact format stores each event once; "legacy" keeps the old
+    # date -> event copies shape for older clients
+    response_format = request.args.get("format", "compact")
+    if response_format not in ("compact", "legacy"):
+        return jsonify({"error": "Invalid format parameter"}), 400
+    
+    # Any run of days instead of a year: ?start=2025-03-01&end=2026-03-01,
+    # with the end day excluded
+    date_range = None
+    if "start" in request.args or "end" in request.args:
+        try:
+            date_range = (
+                date.fromisoformat(request.args.get("start", "")),
+                date.fromisoformat(request.args.get("end", ""))
+            )
+        except ValueError:
+            return jsonify({"error": "Invalid date range, expected start and end as YYYY-MM-DD"}), 400
+        
+        if not 0 < (date_range[1] - date_range[0]).days <= MAX_RANGE_DAYS:
+            return jsonify({"error": f"Date ranges must cover 1 to {MAX_RANGE_DAYS} days"}), 400
+    
+    # Stream one NDJSON line per calendar as soon as it is ready
+    stream = request.args.get("stream") in ("1", "true")
+    if stream and response_format != "compact":
+        return jsonify({"error": "Streaming requires the compact format"}), 400
+    if stream and date_range is not None:
+        return jsonify({"error": "Streaming is only available for whole years"}), 400
+    
+    errors = {}
+    options = fetch_options(credentials)
+    
+    # The overview leaves out descriptions, notes and other details; they
+    # are loaded per day from /api/events/day/<date>
+    detail = request.args.get("detail") == "full"
+    
+    if stream:
+        def generate():
+            for chunk in stream_events_for_year(credentials, year, calendar_ids, errors,
+                                                detail=detail, **options):
+                if chunk["type"] == "done":
+                    chunk["calendars"] = requested_calendars(credentials, calendar_ids, options)
+                yield json.dumps(chunk) + "\n"
+            
+            if errors:
+                current_app.logger.warning(f"Failed to fetch calendars: {errors}")
+            
+            prefetch_adjacent_years(credentials, year, calendar_ids, options)
+            watch_calendars(credentials, [calendar_id for calendar_id in calendar_ids if calendar_id not in errors],
+                            options)
+        
+        # Ask proxies not to buffer the chunks
+        body = generate()
+        headers = {"X-Accel-Buffering": "no", "Vary": "Accept-Encoding"}
+        
+        if request.accept_encodings["gzip"] > 0:
+            body = gzip_stream(body, current_app.config.get("COMPRESS_LEVEL", DEFAULT_COMPRESS_LEVEL))
+            headers["Content-Encoding"] = "gzip"
+        
+        return Response(
+            stream_with_context(body), mimetype="application/x-ndjson", headers=headers
+        )
+    
+    def load():
+        if date_range is not None:
+            events = get_events_for_range(
+                credentials, *date_range, calendar_ids, errors=errors,
+                index_cache=current_app.extensions.get("event_index"),
+                compact=(response_format == "compact"), detail=detail, **options
+            )
+        else:
+            events = get_events_for_year(
+                credentials, year, calendar_ids, errors=errors,
+                compact=(response_format == "compact"), detail=detail, **options
+            )
+        return events, errors
+    
+    # Identical requests in flight (a double click, several tabs) share one load
+    events, errors = single_flight(events_request_key(
+        options["user_key"], date_range or year, calendar_ids, response_format, detail
+    ), load)
+    
+    if errors:
+        current_app.logger.warning(f"Failed to fetch calendars: {errors}")
+        
+        # Nothing to show if every calendar failed
+        if len(errors) == len(set(calendar_ids)):
+            return jsonify({"error": "Failed to fetch events", "calendars": errors}), 502
+    
+    # Warm the previous and next year while the user looks at this one
+    if date_range is None:
+        prefetch_adjacent_years(credentials, year, calendar_ids, options)
+    watch_calendars(credentials, [calendar_id for calendar_id in calendar_ids if calendar_id not in errors], options)
+    
+    if response_format == "compact":
+        # The shared result is not modified
+        events = dict(events, errors=errors)
+        events["calendars"] = requested_calendars(credentials, calendar_ids, options)
+    
+    response = json_response(events)
+    
+    # Report partially failed calendars without changing the legacy payload shape
+    if errors:
+        response.headers["X-Calendar-Errors"] = json.dumps(errors)
+    
+    return response
+
+@calendar_bp.route("/api/events/day/<day>")
+def get_day_events(day):
+    """Get the full events of a single day, served from the event cache"""
+    credentials = current_credentials()
+    if credentials is None:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    try:
+        day = date.fromisoformat(day)
+    except ValueError:
+        return jsonify({"error": "Invalid date, expected YYYY-MM-DD"}), 400
+    
+    calendar_ids = request.args.getlist("calendar_id")
+    if not calendar_ids:
+        return jsonify({"error": "No calendar IDs provided"}), 400
+    
+    errors = {}
+    events = get_events_for_day(credentials, day, calendar_ids, errors=errors, **fetch_options(credentials))
+    
+    if errors:
+        current_app.logger.warning(f"Failed to fetch calendars: {errors}")
+        
+        # Nothing to show if every calendar failed
+        if len(errors) == len(set(calendar_ids)):
+            return jsonify({"error": "Failed to fetch events", "calendars": errors}), 502
+    
+    return json_response({"date": day.isoformat(), "events": events, "errors": errors})
+
+@calendar_bp.route("/api/search")
+def search():
+    """Search the titles, locations, descriptions and notes of a year's events"""
+    credentials = current_credentials()
+    if credentials is None:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "Search query is required"}), 400
     
-    events = get_events_for_year(credentials, year, calendar_ids)
+    default_year = current_app.config.get("DEFAULT_YEAR", datetime.now().year)
+    try:
+        year = int(request.args.get("year", default_year))
+        limit = int(request.args.get("limit", DEFAULT_SEARCH_LIMIT))
+    except ValueError:
+        return jsonify({"error": "Invalid year or limit parameter"}), 400
     
-    # Update session credentials (they might have been refreshed)
-    session["credentials"] = {
-        "token": credentials.token,
-        "refresh_token": credentials.refresh_token,
-        "token_uri": credentials.token_uri,
-        "client_id": credentials.client_id,
-        "client_secret": credentials.client_secret,
-        "scopes": credentials.scopes
-    }
+    if not 0 < limit <= MAX_SEARCH_LIMIT:
+        return jsonify({"error": f"Limit must be between 1 and {MAX_SEARCH_LIMIT}"}), 400
     
-    return jsonify(events)
+    calendar_ids = request.args.getlist("calendar_id")
+    if not calendar_ids:
+        return jsonify({"error": "No calendar IDs provided"}), 400
+    
+    errors = {}
+    result = search_events(
+        credentials, year, calendar_ids, query, errors=errors,
+        search_cache=current_app.extensions.get("search_index"), limit=limit,
+        **fetch_options(credentials)
+    )
+    
+    if errors:
+        current_app.logger.warning(f"Failed to fetch calendars: {errors}")
+        
+        # Nothing to show if every calendar failed
+        if len(errors) == len(set(calendar_ids)):
+            return jsonify({"error": "Failed to fetch events", "calendars": errors}), 502
+    
+    # The client highlights the dates; the events fill the results list
+    return json_response({
+        "query": query,
+        "year": year,
+        "events": result["events"],
+        "total": result["total"],
+        "dates": [day.isoformat() for day in result["dates"]],
+        "errors": errors
+    })
 
 @calendar_bp.route("/api/events/<event_id>/note", methods=["PUT"])
 def update_note(event_id):
     """Update a note for a specific event"""
-    if "credentials" not in session:
+    credentials = current_credentials()
+    if credentials is None:
         return jsonify({"error": "Not authenticated"}), 401
     
     data = request.get_json()
@@ -110,21 +278,283 @@ def update_note(event_id):
     if not calendar_id:
         return jsonify({"error": "Calendar ID is required"}), 400
     
-    credentials = google.oauth2.credentials.Credentials(**session["credentials"])
+    cache = current_app.extensions.get("event_cache")
+    user_key = current_user_key()
     
-    success = update_event_note(credentials, calendar_id, event_id, data["note"])
+    # Google would refuse the write; answer without the round trip
+    if is_read_only(cache, user_key, calendar_id):
+        return jsonify({"error": "Calendar is read-only"}), 403
     
-    # Update session credentials (they might have been refreshed)
-    session["credentials"] = {
-        "token": credentials.token,
-        "refresh_token": credentials.refresh_token,
-        "token_uri": credentials.token_uri,
-        "client_id": credentials.client_id,
-        "client_secret": credentials.client_secret,
-        "scopes": credentials.scopes
-    }
+    etag = data.get("etag")
+    updated = update_event_note(
+        credentials, calendar_id, event_id, data["note"],
+        etag=etag, description=cached_description(cache, user_key, calendar_id, event_id, etag)
+    )
+    
+    # Keep cached copies of the event in step with Google
+    if updated and cache is not None:
+        cache.update_event(user_key, calendar_id, event_id, {
+            "etag": updated.get("etag"),
+            "description": updated.get("description", "")
+        })
     
-    if success:
-        return jsonify({"success": True})
+    if updated:
+        return jsonify({"success": True, "etag": updated.get("etag")})
     else:
-        return jsonify({"error": "Failed to update event note"}), 500
\ No newline at end of file
+        return jsonify({"error": "Failed to update event note"}), 500
+
+@calendar_bp.route("/api/notes:batch", methods=["POST"])
+def batch_update_notes():
+    """Update the notes of many events in one call"""
+    credentials = current_credentials()
+    if credentials is None:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    data = request.get_json(silent=True)
+    updates = data.get("notes") if isinstance(data, dict) else None
+    if not isinstance(updates, list) or not updates:
+        return jsonify({"error": "A list of notes is required"}), 400
+    
+    for update in updates:
+        if not isinstance(update, dict) or not all(
+            key in update for key in ("calendar_id", "event_id", "note")
+        ):
+            return jsonify({"error": "Each note needs calendar_id, event_id and note"}), 400
+    
+    cache = current_app.extensions.get("event_cache")
+    user_key = current_user_key()
+    
+    # Google would refuse writes to read-only calendars; leave them out
+    read_only = [is_read_only(cache, user_key, update["calendar_id"]) for update in updates]
+    writes = [update for update, skip in zip(updates, read_only) if not skip]
+    
+    written = iter(update_event_notes(credentials, [
+        {
+            "calendar_id": update["calendar_id"],
+            "event_id": update["event_id"],
+            "note": update["note"],
+            "etag": update.get("etag"),
+            "description": cached_description(
+                cache, user_key, update["calendar_id"], update["event_id"], update.get("etag")
+            )
+        }
+        for update in writes
+    ]) if writes else [])
+    
+    results = [
+        {
+            "calendar_id": update["calendar_id"], "event_id": update["event_id"], "success": False,
+            "error": "Calendar is read-only", "status": 403
+        } if skip else next(written)
+        for update, skip in zip(updates, read_only)
+    ]
+    
+    # Keep cached copies of the updated events in step with Google
+    if cache is not None:
+        for result in results:
+            if result["success"]:
+                cache.update_event(user_key, result["calendar_id"], result["event_id"], {
+                    "etag": result["etag"],
+                    "description": result.get("description") or ""
+                })
+    
+    # Descriptions are only needed server-side
+    results = [
+        {key: value for key, value in result.items() if key != "description"}
+        for result in results
+    ]
+    
+    return jsonify({"results": results})
+
+@calendar_bp.route("/api/notifications", methods=["POST"])
+def receive_notification():
+    """Receive a Calendar API push notification and resync the calendar that changed"""
+    channels = current_app.extensions.get("channels")
+    if channels is None:
+        return jsonify({"error": "Push notifications are disabled"}), 404
+    
+    # Google identifies the calendar only through the token we signed
+    accepted = channels.notify(
+        request.headers.get("X-Goog-Channel-Token"),
+        request.headers.get("X-Goog-Resource-State", "")
+    )
+    if not accepted:
+        return jsonify({"error": "Unknown channel"}), 403
+    
+    return "", 204
+
+def fetch_options(credentials):
+    """
+    Collect the event fetch and cache settings for the current user.
+    
+    Args:
+        credentials: Google OAuth credentials
+        
+    Returns:
+        Keyword arguments for the calendar service's event fetches
+    """
+    cache = current_app.extensions.get("event_cache")
+    user_key = current_user_key()
+    fields = current_app.config.get("FETCH_FIELDS", DEFAULT_EVENT_FIELDS) or None
+    
+    # Calendars the user can only read are cached once for all their
+    # readers; the user's cached calendar list is the access check
+    shared = None
+    if current_app.config.get("CACHE_SHARED_CALENDARS", True):
+        shared = shared_calendars(cached_calendar_list(cache, user_key), fields)
+    
+    # Calendars watched through push channels are kept fresh by Google's
+    # notifications instead of polling
+    channels = current_app.extensions.get("channels")
+    sync_intervals = channels.sync_intervals(user_key, shared) if channels is not None else None
+    
+    return dict(
+        max_workers=current_app.config.get("FETCH_MAX_WORKERS", DEFAULT_MAX_WORKERS),
+        timeout=current_app.config.get("FETCH_TIMEOUT", DEFAULT_CALENDAR_TIMEOUT),
+        page_size=current_app.config.get("FETCH_PAGE_SIZE", DEFAULT_PAGE_SIZE),
+        fields=fields,
+        cache=cache,
+        user_key=user_key,
+        sync_interval=current_app.config.get("CACHE_SYNC_INTERVAL", DEFAULT_SYNC_INTERVAL),
+        shared=shared,
+        sync_intervals=sync_intervals
+    )
+
+def events_request_key(user_key, period, calendar_ids, response_format, detail):
+    """
+    Build the key under which identical /api/events requests are coalesced.
+    
+    Args:
+        user_key: Key identifying the user
+        period: The year, or a (start, end) pair of dates
+        calendar_ids: Requested calendar IDs
+        response_format: "compact" or "legacy"
+        detail: Whether full event bodies were requested
+        
+    Returns:
+        Hashable key
+    """
+    return ("events", user_key, period, tuple(calendar_ids), response_format, detail)
+
+def single_flight(key, load):
+    """
+    Run load, or wait for an identical load already in flight and share
+    its result.
+    
+    Args:
+        key: Hashable identifying the load, e.g. from events_request_key
+        load: Callable producing the result
+        
+    Returns:
+        The result of load
+    """
+    flights = current_app.extensions.get("single_flight")
+    if flights is None:
+        return load()
+    return flights.do(key, load)
+
+def prefetch_adjacent_years(credentials, year, calendar_ids, options):
+    """
+    Hand the year just served to the background prefetcher, if enabled.
+    
+    Args:
+        credentials: Google OAuth credentials
+        year: The year that was served
+        calendar_ids: Calendars that were requested
+        options: Fetch options from fetch_options
+    """
+    prefetcher = current_app.extensions.get("prefetcher")
+    if prefetcher is not None:
+        prefetcher.year_viewed(credentials, year, calendar_ids, options)
+
+def watch_calendars(credentials, calendar_ids, options):
+    """
+    Open push channels for the calendars just served, if push
+    notifications are enabled.
+    
+    Args:
+        credentials: Google OAuth credentials
+        calendar_ids: Calendars that were requested
+        options: Fetch options from fetch_options
+    """
+    channels = current_app.extensions.get("channels")
+    if channels is not None:
+        channels.watch(credentials, calendar_ids, options)
+
+def requested_calendars(credentials, calendar_ids, options):
+    """
+    Resolve the colors and access roles of the requested calendars from
+    the user's calendar list.
+    
+    A cached list is used as is, even when it is due for a refresh, so an
+    events request costs at most one extra call to Google, and only when
+    the list was never loaded. Without an event cache nothing is resolved.
+    
+    Args:
+        credentials: Google OAuth credentials
+        calendar_ids: Calendars that were requested
+        options: Fetch options from fetch_options
+        
+    Returns:
+        Dict mapping calendar ID to its colors and access role
+    """
+    cache = options["cache"]
+    if cache is None:
+        return {}
+    
+    calendars = cached_calendar_list(cache, options["user_key"])
+    if calendars is None:
+        # Concurrent first loads of several years share one listing
+        try:
+            calendars = {
+                calendar["id"]: calendar
+                for calendar in single_flight(("calendars", options["user_key"]), lambda: get_calendar_list(
+                    get_calendar_service(credentials), cache, options["user_key"]
+                ))
+            }
+        except Exception as e:
+            # Colors are optional; the events are still served without them
+            current_app.logger.warning(f"Failed to load the calendar list: {e}")
+            return {}
+    
+    return calendar_colors(calendars, calendar_ids)
+
+def is_read_only(cache, user_key, calendar_id):
+    """
+    Tell from the cached calendar list whether the user cannot write to a
+    calendar. Unknown calendars are left for Google to decide.
+    
+    Args:
+        cache: EventCache instance or None
+        user_key: Key identifying the user
+        calendar_id: ID of the calendar
+        
+    Returns:
+        True if the calendar is known to be read-only
+    """
+    calendar = find_calendar(cached_calendar_list(cache, user_key) or {}, calendar_id)
+    return calendar is not None and calendar["accessRole"] not in WRITABLE_ROLES
+
+def cached_description(cache, user_key, calendar_id, event_id, etag):
+    """
+    Return the cached description of an event if the cached copy is the
+    version the client wrote its note against.
+    
+    Args:
+        cache: EventCache instance or None
+        user_key: Key identifying the user
+        calendar_id: ID of the calendar containing the event
+        event_id: ID of the event
+        etag: ETag the client saw, or None
+        
+    Returns:
+        Description string, or None if it has to be read from Google
+    """
+    if cache is None or etag is None:
+        return None
+    
+    event = cache.find_event(user_key, calendar_id, event_id)
+    if event is None or event.get("etag") != etag:
+        return None
+    
+    return event.get("description", "")
@@ -0,0 +1,13 @@
+from flask import Blueprint, Response, current_app, jsonify, request
+from app.metrics import REGISTRY, bearer_token_matches
+
+metrics_bp = Blueprint("metrics", __name__)
+
+@metrics_bp.route("/metrics")
+def metrics():
+    """Expose request, Google API and cache metrics for Prometheus"""
+    token = current_app.config.get("METRICS_TOKEN")
+    if token and not bearer_token_matches(request.headers.get("Authorization"), token):
+        return jsonify({"error": "Not authorized"}), 401
+    
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
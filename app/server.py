@@ -0,0 +1,218 @@
+import logging
+import os
+import sys
+
+try:
+    import gunicorn.app.base
+except ImportError:  # Optional dependency; waitress is tried next
+    gunicorn = None
+
+try:
+    import waitress
+except ImportError:  # Optional dependency
+    waitress = None
+
+try:
+    import uvicorn
+except ImportError:  # Optional dependency; only the asgi mode needs it
+    uvicorn = None
+
+try:
+    import httpx
+except ImportError:  # Optional dependency; only the asgi mode needs it
+    httpx = None
+
+SERVE_MODES = ("development", "production", "asgi")
+
+# Defaults for the `server` config section
+DEFAULT_SERVER_SETTINGS = {
+    "mode": "development",
+    "host": "127.0.0.1",
+    "port": 5000,
+    # Worker processes; each one builds its own app from the factory
+    "workers": 2,
+    # Threads per worker; Google API calls are I/O bound, so these overlap
+    "threads": 8,
+    # Seconds a request may run before gunicorn restarts its worker
+    "timeout": 60,
+    # Trust X-Forwarded-* headers from a TLS-terminating reverse proxy
+    "proxy_fix": False
+}
+
+def server_settings(server_config, overrides=None):
+    """
+    Combine the `server` config section with command line overrides.
+
+    Args:
+        server_config: Dict from the `server` config section (may be empty)
+        overrides: Dict of command line values; None values are ignored
+
+    Returns:
+        Dictionary with every key of DEFAULT_SERVER_SETTINGS
+
+    Raises:
+        ValueError: If the mode is unknown or a count is not positive
+    """
+    settings = dict(DEFAULT_SERVER_SETTINGS)
+    settings.update({key: value for key, value in (server_config or {}).items() if value is not None})
+    settings.update({key: value for key, value in (overrides or {}).items() if value is not None})
+
+    if settings["mode"] not in SERVE_MODES:
+        raise ValueError(f"Unknown serve mode: {settings['mode']}")
+
+    for key in ("port", "workers", "threads", "timeout"):
+        settings[key] = int(settings[key])
+        if settings[key] < 1:
+            raise ValueError(f"Server setting {key} must be at least 1")
+
+    return settings
+
+def configure_logging(mode):
+    """
+    Set up logging for a serve mode.
+
+    Development logs OAuth traffic at DEBUG level and allows OAuth over
+    plain HTTP. Production keeps library logging at WARNING so per-request
+    debug output stays off the hot path, and requires HTTPS for OAuth.
+
+    Args:
+        mode: "development", or "production"/"asgi"
+    """
+    logging.basicConfig(level=logging.INFO)
+
+    if mode == "development":
+        os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'  # Allow OAuth over HTTP for development
+        logging.getLogger('oauthlib').setLevel(logging.DEBUG)
+        logging.getLogger('google.auth.transport.requests').setLevel(logging.DEBUG)
+    else:
+        for name in ('oauthlib', 'google', 'googleapiclient', 'urllib3'):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+def prepare_app(app, settings):
+    """
+    Apply production settings to an app built by the factory.
+
+    Args:
+        app: Flask application
+        settings: Result of server_settings
+
+    Returns:
+        The same application
+    """
+    app.config["DEBUG"] = False
+
+    if settings["proxy_fix"]:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+
+        # OAuth redirect URLs must keep the https scheme the proxy received
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1)
+
+    return app
+
+def production_server():
+    """
+    Return the name of the production server that will be used.
+
+    Returns:
+        "gunicorn", "waitress" or None if neither is installed
+    """
+    # gunicorn forks worker processes and does not run on Windows
+    if gunicorn is not None and sys.platform != "win32":
+        return "gunicorn"
+    if waitress is not None:
+        return "waitress"
+    return None
+
+def missing_packages(mode):
+    """
+    Return the packages a serve mode needs that are not installed.
+
+    Args:
+        mode: "development", "production" or "asgi"
+
+    Returns:
+        List of pip package names, empty when the mode can run
+    """
+    if mode == "production" and production_server() is None:
+        return ["waitress" if sys.platform == "win32" else "gunicorn"]
+    if mode == "asgi":
+        return [name for name, module in (("uvicorn", uvicorn), ("httpx", httpx)) if module is None]
+    return []
+
+def serve_production(app_factory, settings):
+    """
+    Run the app under a multi-worker production server.
+
+    With gunicorn, every worker process calls app_factory after it is
+    forked, so caches, database connections and thread pools are never
+    shared across a fork; use the sqlite cache and token store backends so
+    workers share logins and synced events. waitress runs a single process
+    with a thread pool, so `workers` is ignored there.
+
+    Args:
+        app_factory: Callable returning the Flask application
+        settings: Result of server_settings
+
+    Raises:
+        RuntimeError: If neither gunicorn nor waitress is installed
+    """
+    server = production_server()
+
+    if server == "gunicorn":
+        class Application(gunicorn.app.base.BaseApplication):
+            def load_config(self):
+                self.cfg.set("bind", f"{settings['host']}:{settings['port']}")
+                self.cfg.set("workers", settings["workers"])
+                self.cfg.set("threads", settings["threads"])
+                self.cfg.set("worker_class", "gthread")
+                self.cfg.set("timeout", settings["timeout"])
+                self.cfg.set("preload_app", False)
+
+            def load(self):
+                return prepare_app(app_factory(), settings)
+
+        Application().run()
+
+    elif server == "waitress":
+        if settings["workers"] > 1:
+            logging.getLogger(__name__).warning("waitress runs a single process; ignoring workers")
+
+        waitress.serve(
+            prepare_app(app_factory(), settings),
+            host=settings["host"], port=settings["port"], threads=settings["threads"]
+        )
+
+    else:
+        raise RuntimeError(
+            "Production mode needs gunicorn (Linux/macOS) or waitress (any platform): "
+            "pip install gunicorn"
+        )
+
+def serve_asgi(app_factory, settings):
+    """
+    Run the ASGI entry point (see app/asgi.py) under uvicorn.
+
+    One process serves the hot API routes on its event loop; `threads`
+    sizes the thread pool for the routes handed to Flask. For several
+    processes, run gunicorn with uvicorn workers instead:
+    gunicorn -k uvicorn.workers.UvicornWorker "app.asgi:create_asgi_app()"
+
+    Args:
+        app_factory: Callable taking the thread count and returning the
+                     ASGI application
+        settings: Result of server_settings
+
+    Raises:
+        RuntimeError: If uvicorn or httpx is not installed
+    """
+    missing = missing_packages("asgi")
+    if missing:
+        raise RuntimeError(f"ASGI mode needs {' and '.join(missing)}: pip install {' '.join(missing)}")
+
+    asgi_app = app_factory(settings["threads"])
+    asgi_app.flask_app.config["DEBUG"] = False
+    
+    uvicorn.run(
+        asgi_app, host=settings["host"], port=settings["port"],
+        lifespan="on", proxy_headers=settings["proxy_fix"], log_level="warning"
+    )
@@ -0,0 +1,477 @@
+from app.services.calendar_service import (
+    add_page_to_bucket, assemble_year, apply_changes, year_bounds,
+    DEFAULT_MAX_WORKERS, DEFAULT_CALENDAR_TIMEOUT, DEFAULT_PAGE_SIZE, DEFAULT_EVENT_FIELDS,
+    MAX_NOTE_WRITE_ATTEMPTS, NOTE_WRITE_FIELDS
+)
+from app.services.calendar_list import (
+    apply_calendar_changes, store_calendar_list,
+    CALENDAR_LIST_FIELDS, CALENDAR_LIST_PAGE_SIZE
+)
+from app.services.note_codec import inject_note
+from app.services.event_cache import calendar_cache_key, is_shared_key
+from app.services.scheduler import get_scheduler, SingleFlight
+from app.metrics import record_google_call, CALENDAR_FETCH_SECONDS, CACHE_LOOKUPS, SHARED_CACHE_READS
+from datetime import date
+from urllib.parse import quote
+import asyncio
+import google_auth_httplib2
+import httplib2
+import logging
+import time
+
+try:
+    import httpx
+except ImportError:  # Optional dependency; only the async entry point needs it
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+# Base URL of the Calendar REST API
+CALENDAR_API_URL = "https://www.googleapis.com/calendar/v3"
+
+# Connections kept open to Google by one process
+DEFAULT_MAX_CONNECTIONS = 100
+
+# Syncs of shared calendar years on the event loop
+_shared_syncs = SingleFlight()
+
+class CalendarApiError(Exception):
+    """
+    Error response from the Calendar REST API.
+
+    Args:
+        status: HTTP status code
+        message: Error message from the response body
+    """
+
+    def __init__(self, status, message=""):
+        super().__init__(message or f"HTTP {status}")
+        self.status = status
+
+def create_http_client(max_connections=DEFAULT_MAX_CONNECTIONS, timeout=DEFAULT_CALENDAR_TIMEOUT):
+    """
+    Create the shared async HTTP client for talking to Google.
+
+    One client per process multiplexes every in-flight request over a
+    bounded pool of keep-alive connections.
+
+    Args:
+        max_connections: Maximum number of open connections
+        timeout: Seconds a single HTTP request may take
+
+    Returns:
+        httpx.AsyncClient
+    """
+    if httpx is None:
+        raise RuntimeError("The async calendar service requires httpx to be installed")
+
+    return httpx.AsyncClient(
+        timeout=timeout,
+        limits=httpx.Limits(max_connections=max_connections,
+                            max_keepalive_connections=max_connections)
+    )
+
+class AsyncCalendarClient:
+    """
+    Minimal asyncio client for the parts of the Calendar REST API the app
+    uses.
+
+    Requests carry the user's access token. A 401 refreshes the token once
+    (in a worker thread, as google-auth is synchronous) and retries.
+
+    Args:
+        credentials: Google OAuth credentials
+        http: httpx.AsyncClient used for the requests
+        base_url: Base URL of the Calendar REST API
+    """
+
+    def __init__(self, credentials, http, base_url=CALENDAR_API_URL):
+        self.credentials = credentials
+        self.http = http
+        self.base_url = base_url.rstrip("/")
+
+    async def request(self, method, path, params=None, body=None, headers=None, name="request"):
+        """
+        Send an API request and return the decoded JSON response.
+
+        Args:
+            method: HTTP method
+            path: Path below the API base URL
+            params: Query parameters
+            body: JSON body
+            headers: Additional request headers
+            name: API method name for the metrics, e.g. "events.list"
+
+        Raises:
+            CalendarApiError: If Google answers with an error status that
+                              is not retried, or still fails after retries
+        """
+        scheduler = get_scheduler()
+        attempt = 0
+        while True:
+            await scheduler.throttle()
+
+            started = time.perf_counter()
+            status = "error"
+            try:
+                response = await self._send(method, path, params, body, headers)
+                status = response.status_code
+            finally:
+                record_google_call(name, status, time.perf_counter() - started)
+
+            if response.status_code < 400:
+                return response.json()
+
+            # Rate limits and server errors are retried with backoff
+            delay = scheduler.retry_delay(response.status_code, response.content, attempt,
+                                          response.headers.get("retry-after"))
+            if delay is None:
+                raise CalendarApiError(response.status_code, _error_message(response))
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _send(self, method, path, params, body, headers):
+        for attempt in range(2):
+            request_headers = dict(headers or {})
+            request_headers["Authorization"] = f"Bearer {self.credentials.token}"
+
+            response = await self.http.request(
+                method, self.base_url + path, params=params, json=body, headers=request_headers
+            )
+
+            if response.status_code == 401 and attempt == 0 and self.credentials.refresh_token:
+                await asyncio.to_thread(
+                    self.credentials.refresh, google_auth_httplib2.Request(httplib2.Http(timeout=30))
+                )
+                continue
+
+            return response
+
+    async def iter_pages(self, path, params, name="list"):
+        """Yield the result pages of a list call, following nextPageToken"""
+        params = dict(params)
+        while True:
+            page = await self.request("GET", path, params=params, name=name)
+            yield page
+
+            if not page.get("nextPageToken"):
+                break
+            params["pageToken"] = page["nextPageToken"]
+
+    def iter_event_pages(self, calendar_id, page_size=DEFAULT_PAGE_SIZE,
+                         fields=DEFAULT_EVENT_FIELDS, **params):
+        """Async counterpart of calendar_service.iter_event_pages"""
+        params.update(singleEvents="true", maxResults=page_size)
+        if fields:
+            params["fields"] = fields
+        return self.iter_pages(f"/calendars/{_quote(calendar_id)}/events", params, name="events.list")
+
+async def list_calendars(credentials, http, base_url=CALENDAR_API_URL,
+                         cache=None, user_key=None, refresh_interval=0):
+    """
+    Async counterpart of calendar_list.get_calendar_list.
+
+    Args:
+        credentials: Google OAuth credentials
+        http: httpx.AsyncClient used for the requests
+        base_url: Base URL of the Calendar REST API
+        cache: Optional EventCache the list is kept in
+        user_key: Key identifying the user in the cache
+        refresh_interval: Seconds a cached list is served without asking
+                          Google for changes
+
+    Returns:
+        List of calendar dictionaries in the shape of /api/calendars
+    """
+    client = AsyncCalendarClient(credentials, http, base_url)
+
+    async def fetch(calendars, sync_token=None):
+        params = {"maxResults": CALENDAR_LIST_PAGE_SIZE, "fields": CALENDAR_LIST_FIELDS}
+        if sync_token:
+            params["syncToken"] = sync_token
+        async for page in client.iter_pages("/users/me/calendarList", params, name="calendarList.list"):
+            apply_calendar_changes(calendars, page.get("items", []))
+            sync_token = page.get("nextSyncToken", sync_token)
+        return sync_token
+
+    if cache is None:
+        calendars = {}
+        await fetch(calendars)
+        return list(calendars.values())
+
+    entry = await asyncio.to_thread(cache.get_calendar_list, user_key)
+
+    if entry is not None:
+        if time.time() - entry["synced_at"] < refresh_interval:
+            CACHE_LOOKUPS.inc(result="fresh")
+            return list(entry["calendars"].values())
+
+        if entry.get("sync_token"):
+            CACHE_LOOKUPS.inc(result="sync")
+            calendars = dict(entry["calendars"])
+            try:
+                sync_token = await fetch(calendars, entry["sync_token"])
+            except CalendarApiError as e:
+                # 410 Gone: the sync token expired, so start over
+                if e.status != 410:
+                    raise
+            else:
+                await asyncio.to_thread(store_calendar_list, cache, user_key, calendars, sync_token)
+                return list(calendars.values())
+
+    CACHE_LOOKUPS.inc(result="miss")
+    calendars = {}
+    sync_token = await fetch(calendars)
+    await asyncio.to_thread(store_calendar_list, cache, user_key, calendars, sync_token)
+    return list(calendars.values())
+
+async def get_events_for_year(credentials, year, calendar_ids, http, errors=None,
+                              max_workers=DEFAULT_MAX_WORKERS,
+                              timeout=DEFAULT_CALENDAR_TIMEOUT,
+                              page_size=DEFAULT_PAGE_SIZE,
+                              fields=DEFAULT_EVENT_FIELDS,
+                              cache=None, user_key=None, sync_interval=0, shared=None,
+                              sync_intervals=None, compact=False, detail=True,
+                              base_url=CALENDAR_API_URL):
+    """
+    Async counterpart of calendar_service.get_events_for_year.
+
+    Calendars are fetched as tasks on the running event loop instead of
+    worker threads, so a request waiting on Google holds no thread. Event
+    cache reads and writes (sqlite may block on disk) and bucketing run in
+    the loop's default executor, so other requests keep being served
+    meanwhile. The result has exactly the same format as the threaded
+    version.
+
+    Args:
+        credentials: Google OAuth credentials
+        year: The year to fetch events for (integer)
+        calendar_ids: List of calendar IDs to fetch events from
+        http: httpx.AsyncClient used for the requests
+        errors: Optional dict that receives an error message per failed calendar
+        max_workers: Maximum number of calendars fetched at the same time
+        timeout: Seconds allowed for each calendar fetch
+        page_size: Number of events requested per page
+        fields: Partial response field selector, or None for full events
+        cache: Optional EventCache used for incremental sync
+        user_key: Key identifying the user in the cache
+        sync_interval: Seconds a cached calendar is served without asking
+                       Google for changes
+        shared: Optional dict mapping calendar ID to the shared user key
+                its years are cached under
+        sync_intervals: Optional dict mapping calendar ID to a sync interval
+                        replacing sync_interval
+        compact: Build the compact format instead of date -> events
+        detail: Keep full event bodies instead of overview events
+        base_url: Base URL of the Calendar REST API
+
+    Returns:
+        Compact year dictionary, or dictionary of date to events
+    """
+    if errors is None:
+        errors = {}
+
+    client = AsyncCalendarClient(credentials, http, base_url)
+    start_date, end_date = year_bounds(year)
+    first_day = date(year, 1, 1)
+    limit = asyncio.Semaphore(max(1, max_workers))
+
+    async def list_pages(calendar_id):
+        if cache is None:
+            async for page in client.iter_event_pages(calendar_id, page_size, fields,
+                                                      timeMin=start_date, timeMax=end_date,
+                                                      orderBy="startTime"):
+                yield page.get("items", [])
+            return
+
+        key = calendar_cache_key(user_key, calendar_id, year, shared)
+        interval = (sync_intervals or {}).get(calendar_id, sync_interval)
+        if is_shared_key(key):
+            entry = await synced_shared_entry(client, cache, key, page_size, fields, interval)
+            yield await asyncio.to_thread(_copy_events, entry["events"].values())
+        else:
+            async for events in iter_synced_events(
+                client, cache, key, start_date, end_date,
+                page_size=page_size, fields=fields, sync_interval=interval
+            ):
+                yield events
+
+    async def fetch(calendar_id):
+        started = time.monotonic()
+        bucket = [] if compact else {}
+        try:
+            async for events in list_pages(calendar_id):
+                await asyncio.to_thread(add_page_to_bucket, calendar_id, events, bucket, first_day, compact)
+        except Exception:
+            CALENDAR_FETCH_SECONDS.observe(time.monotonic() - started, outcome="error")
+            raise
+        CALENDAR_FETCH_SECONDS.observe(time.monotonic() - started, outcome="ok")
+        return bucket
+
+    async def fetch_limited(calendar_id):
+        # The timeout starts once the calendar gets its turn
+        async with limit:
+            try:
+                return await asyncio.wait_for(fetch(calendar_id), timeout)
+            except asyncio.TimeoutError:
+                errors[calendar_id] = f"Timed out after {timeout} seconds"
+            except Exception as e:
+                errors[calendar_id] = str(e) or type(e).__name__
+
+    unique_ids = list(dict.fromkeys(calendar_ids))
+    buckets = await asyncio.gather(*(fetch_limited(calendar_id) for calendar_id in unique_ids))
+
+    calendar_buckets = {
+        calendar_id: bucket
+        for calendar_id, bucket in zip(unique_ids, buckets)
+        if calendar_id not in errors
+    }
+    return await asyncio.to_thread(
+        assemble_year, year, calendar_ids, calendar_buckets, compact=compact, detail=detail
+    )
+
+async def synced_shared_entry(client, cache, key, page_size=DEFAULT_PAGE_SIZE,
+                              fields=DEFAULT_EVENT_FIELDS, sync_interval=0):
+    """
+    Return the cache entry of a shared calendar year, syncing it first when
+    it is missing or older than sync_interval. Readers asking at the same
+    time share one sync.
+
+    Returns:
+        Cache entry dictionary
+    """
+    SHARED_CACHE_READS.inc()
+    entry = await asyncio.to_thread(cache.get, key)
+    if entry is not None and time.time() - entry["synced_at"] < sync_interval:
+        CACHE_LOOKUPS.inc(result="fresh")
+        return entry
+
+    async def sync():
+        events = {}
+        async for page in iter_synced_events(client, cache, key, *year_bounds(key[2]),
+                                             page_size=page_size, fields=fields):
+            events.update((event["id"], event) for event in page)
+        entry = await asyncio.to_thread(cache.get, key)
+        return entry or {"events": events, "sync_token": None, "synced_at": time.time()}
+
+    return await _shared_syncs.do_async(key, sync)
+
+async def iter_synced_events(client, cache, key, time_min, time_max,
+                             page_size=DEFAULT_PAGE_SIZE, fields=DEFAULT_EVENT_FIELDS,
+                             sync_interval=0):
+    """
+    Async counterpart of calendar_service.iter_synced_events, sharing its
+    cache entries. The cache is read and written, and cached events are
+    copied, off the event loop.
+
+    Yields:
+        Lists of events (copies that callers may modify)
+    """
+    calendar_id = key[1]
+    entry = await asyncio.to_thread(cache.get, key)
+
+    if entry is not None:
+        if time.time() - entry["synced_at"] < sync_interval:
+            CACHE_LOOKUPS.inc(result="fresh")
+            yield await asyncio.to_thread(_copy_events, entry["events"].values())
+            return
+
+        if entry.get("sync_token"):
+            CACHE_LOOKUPS.inc(result="sync")
+            events = await asyncio.to_thread(dict, entry["events"])
+            sync_token = entry["sync_token"]
+            try:
+                async for page in client.iter_event_pages(calendar_id, page_size, fields,
+                                                          syncToken=sync_token):
+                    await asyncio.to_thread(apply_changes, events, page.get("items", []), time_min, time_max)
+                    sync_token = page.get("nextSyncToken", sync_token)
+            except CalendarApiError as e:
+                # 410 Gone: the sync token expired, so start over
+                if e.status != 410:
+                    raise
+            else:
+                await asyncio.to_thread(
+                    cache.set, key, {"events": events, "sync_token": sync_token, "synced_at": time.time()}
+                )
+                yield await asyncio.to_thread(_copy_events, events.values())
+                return
+
+    CACHE_LOOKUPS.inc(result="miss")
+    events = {}
+    sync_token = None
+
+    async for page in client.iter_event_pages(calendar_id, page_size, fields,
+                                              timeMin=time_min, timeMax=time_max):
+        items = [event for event in page.get("items", []) if event.get("status") != "cancelled"]
+        for event in items:
+            events[event["id"]] = event
+
+        sync_token = page.get("nextSyncToken", sync_token)
+        yield [dict(event) for event in items]
+
+    await asyncio.to_thread(cache.set, key, {"events": events, "sync_token": sync_token, "synced_at": time.time()})
+
+async def update_event_note(credentials, calendar_id, event_id, note, http,
+                            etag=None, description=None, base_url=CALENDAR_API_URL):
+    """
+    Async counterpart of calendar_service.update_event_note: a PATCH of the
+    description with If-Match, re-read and retried if the event changed.
+
+    Args:
+        credentials: Google OAuth credentials
+        calendar_id: ID of the calendar containing the event
+        event_id: ID of the event to update
+        note: New note content
+        http: httpx.AsyncClient used for the requests
+        etag: Optional ETag of the version the note was written against
+        description: Optional current description matching etag
+        base_url: Base URL of the Calendar REST API
+
+    Returns:
+        The updated event (id, etag and description), or None on failure
+    """
+    client = AsyncCalendarClient(credentials, http, base_url)
+    path = f"/calendars/{_quote(calendar_id)}/events/{_quote(event_id)}"
+
+    try:
+        for attempt in range(MAX_NOTE_WRITE_ATTEMPTS):
+            if etag is None or description is None:
+                event = await client.request("GET", path, params={"fields": NOTE_WRITE_FIELDS},
+                                             name="events.get")
+                etag = event["etag"]
+                description = event.get("description", "")
+
+            # Update only the description, and only if nobody changed it
+            try:
+                return await client.request(
+                    "PATCH", path, params={"fields": NOTE_WRITE_FIELDS},
+                    body={"description": inject_note(description, note)},
+                    headers={"If-Match": etag}, name="events.patch"
+                )
+            except CalendarApiError as e:
+                if e.status != 412:
+                    raise
+
+                # Someone else changed the event; merge into the latest version
+                etag = description = None
+
+        logger.error(f"Error updating event note: {event_id} kept changing, giving up")
+        return None
+
+    except Exception as e:
+        logger.error(f"Error updating event note: {e}")
+        return None
+
+def _copy_events(events):
+    # Callers may modify what they are given; cached events stay untouched
+    return [dict(event) for event in events]
+
+def _quote(value):
+    # Calendar IDs are e-mail addresses and may contain '#' or '/'
+    return quote(value, safe="")
+
+def _error_message(response):
+    try:
+        return response.json()["error"]["message"]
+    except (ValueError, KeyError, TypeError):
+        return response.text or f"HTTP {response.status_code}"
@@ -0,0 +1,237 @@
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:  # Optional dependency; the pure Python engine is used instead
+    np = None
+
+# Below this many events the fixed cost of building arrays outweighs NumPy's gains
+NUMPY_MIN_EVENTS = 256
+
+def event_day_span(event):
+    """
+    Return the first and last day an event covers.
+
+    Args:
+        event: Event resource from the Google Calendar API
+
+    Returns:
+        Tuple of (first_day, last_day) dates, or None if the event has no date
+    """
+    start = event.get("start", {})
+    end = event.get("end", {})
+
+    # Handle all-day events
+    if "date" in start:
+        start_date = datetime.fromisoformat(start["date"])
+
+        # For end date, subtract 1 day if using Google Calendar convention
+        # Google stores end date as the day after the actual end
+        if "date" in end:
+            end_date = datetime.fromisoformat(end["date"]) - timedelta(days=1)
+        else:
+            end_date = start_date  # Single day event
+
+    else:
+        # Timed events
+        event_datetime = start.get("dateTime", "")
+        if not event_datetime:
+            return None  # Skip events with no date
+
+        start_date = datetime.fromisoformat(event_datetime.replace("Z", "+00:00"))
+
+        # Get end date/time if available
+        end_datetime = end.get("dateTime", "")
+        if end_datetime:
+            end_date = datetime.fromisoformat(end_datetime.replace("Z", "+00:00"))
+        else:
+            end_date = start_date  # Use start date if no end date
+
+    return start_date.date(), end_date.date()
+
+def day_spans(events, first_day, engine=None):
+    """
+    Return the days each event covers as day indexes relative to a date.
+
+    Args:
+        events: List of event resources
+        first_day: Date that is day 0 (normally January 1st of the year)
+        engine: "numpy", "python" or None to pick by availability and size
+
+    Returns:
+        List with a [first, last] pair per event, or None for events
+        without a date
+    """
+    if _use_numpy(len(events), engine):
+        return _day_spans_numpy(events, first_day)
+
+    spans = []
+    for event in events:
+        span = event_day_span(event)
+        if span is None:
+            spans.append(None)
+        else:
+            spans.append([(span[0] - first_day).days, (span[1] - first_day).days])
+    return spans
+
+def index_days(spans, days_in_year, engine=None):
+    """
+    Map every day of a year to the indexes of the events covering it.
+
+    Days outside [0, days_in_year) are left out. Each day lists its events
+    in index order, and days appear in the order the event list first
+    reaches them, so both engines produce the same dictionary, key order
+    included.
+
+    Args:
+        spans: List of [first, last] day index pairs, one per event
+        days_in_year: Number of days in the year
+        engine: "numpy", "python" or None to pick by availability and size
+
+    Returns:
+        Dictionary of day index to list of event indexes
+    """
+    if _use_numpy(len(spans), engine):
+        return _index_days_numpy(spans, days_in_year)
+
+    days = {}
+    for index, (first, last) in enumerate(spans):
+        for day in range(max(first, 0), min(last, days_in_year - 1) + 1):
+            if day not in days:
+                days[day] = []
+            days[day].append(index)
+    return days
+
+def _use_numpy(count, engine):
+    if engine == "python":
+        return False
+    if engine == "numpy":
+        if np is None:
+            raise RuntimeError("The numpy bucketing engine requires numpy to be installed")
+        return True
+    return np is not None and count >= NUMPY_MIN_EVENTS
+
+def _day_spans_numpy(events, first_day):
+    # Collect the date part of every start and end; the calendar date of a
+    # timed event in its own offset is its first ten characters, which is
+    # what .date() returns for it too
+    starts = []
+    ends = []
+    # 1 for all-day events, whose end date is exclusive
+    exclusive = []
+    undated = []
+
+    for position, event in enumerate(events):
+        start = event.get("start", {})
+        end = event.get("end", {})
+
+        if "date" in start:
+            starts.append(start["date"])
+            if "date" in end:
+                ends.append(end["date"])
+                exclusive.append(1)
+                continue
+            ends.append(start["date"])
+        elif start.get("dateTime"):
+            starts.append(start["dateTime"])
+            ends.append(end.get("dateTime") or start["dateTime"])
+        else:
+            starts.append("1970-01-01")
+            ends.append("1970-01-01")
+            undated.append(position)
+        exclusive.append(0)
+
+    origin = first_day.toordinal()
+    first = (_ordinals(starts) - origin).tolist()
+    last = (_ordinals(ends) - origin - np.array(exclusive, dtype=np.int64)).tolist()
+
+    spans = list(map(list, zip(first, last)))
+    for position in undated:
+        spans[position] = None
+    return spans
+
+def _ordinals(dates):
+    # Parse "YYYY-MM-DD" strings straight from their digits, which is much
+    # faster than going through datetime64 string parsing
+    digits = np.array(dates, dtype="S10").view(np.uint8).reshape(-1, 10).astype(np.int64) - ord("0")
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month = digits[:, 5] * 10 + digits[:, 6]
+    day = digits[:, 8] * 10 + digits[:, 9]
+
+    # Proleptic Gregorian ordinal, the same numbering as date.toordinal()
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 305
+
+def _index_days_numpy(spans, days_in_year):
+    if not spans:
+        return {}
+
+    pairs = np.asarray(spans, dtype=np.int64).reshape(-1, 2)
+    first = np.maximum(pairs[:, 0], 0)
+    last = np.minimum(pairs[:, 1], days_in_year - 1)
+    lengths = np.maximum(last - first + 1, 0)
+    total = int(lengths.sum())
+    if total == 0:
+        return {}
+
+    # One (day, event) row per day an event covers, in event order
+    events = np.repeat(np.arange(len(pairs)), lengths)
+    row_starts = np.cumsum(lengths) - lengths
+    days = np.repeat(first, lengths) + (np.arange(total) - np.repeat(row_starts, lengths))
+
+    # Group rows by day; the stable sort keeps each day's events in order
+    order = np.argsort(days, kind="stable")
+    days = days[order]
+    events = events[order]
+    boundaries = np.flatnonzero(np.diff(days)) + 1
+    group_starts = np.concatenate(([0], boundaries))
+
+    # List days in the order the event list first reaches them
+    group_order = np.lexsort((days[group_starts], events[group_starts]))
+    groups = np.split(events, boundaries)
+    group_days = days[group_starts].tolist()
+
+    return {group_days[group]: groups[group].tolist() for group in group_order.tolist()}
+
+def summarize_days(events, days):
+    """
+    Precompute what the year view draws for each day.
+
+    Every day gets a flat row [total, multi_day, calendar, count, ...]:
+    the number of events, how many of them span several days, then a
+    (calendar index, event count) pair per calendar with events that day.
+    Calendar indexes point into the returned calendar list, which is in the
+    order the calendars appear in the event table.
+
+    Args:
+        events: Event table; every event has a calendarId and a span
+        days: Dictionary of day index to list of event table indexes
+
+    Returns:
+        Dictionary with "calendars" (list of calendar IDs) and "days"
+        (day index to summary row)
+    """
+    calendars = list(dict.fromkeys(event["calendarId"] for event in events))
+    positions = {calendar_id: index for index, calendar_id in enumerate(calendars)}
+    event_calendars = [positions[event["calendarId"]] for event in events]
+    multi_day = [event["span"][0] != event["span"][1] for event in events]
+
+    summary = {}
+    for day, refs in days.items():
+        counts = {}
+        multi_day_count = 0
+        for ref in refs:
+            calendar = event_calendars[ref]
+            counts[calendar] = counts.get(calendar, 0) + 1
+            multi_day_count += multi_day[ref]
+
+        row = [len(refs), multi_day_count]
+        for calendar, count in counts.items():
+            row += (calendar, count)
+        summary[day] = row
+
+    return {"calendars": calendars, "days": summary}
@@ -0,0 +1,238 @@
+from googleapiclient.errors import HttpError
+from app.services.calendar_service import execute_request
+from app.services.event_cache import SHARED_USER_PREFIX
+from app.metrics import CACHE_LOOKUPS
+import time
+
+# Seconds a cached calendar list is served before Google is asked for changes
+DEFAULT_CALENDAR_LIST_INTERVAL = 300
+
+# Calendar list entries requested per page (the Calendar API allows up to 250)
+CALENDAR_LIST_PAGE_SIZE = 250
+
+# Partial response projection for calendarList.list
+CALENDAR_LIST_FIELDS = (
+    "nextPageToken,nextSyncToken,"
+    "items(id,summary,summaryOverride,backgroundColor,foregroundColor,selected,accessRole,primary,deleted)"
+)
+
+# Access roles that allow writing notes into event descriptions
+WRITABLE_ROLES = ("owner", "writer")
+
+# Access roles under which every user sees the same events; free/busy
+# readers only get busy blocks, so each role is cached apart
+SHARED_ROLES = ("reader", "freeBusyReader")
+
+# Event fields whose content depends on the user reading them
+PER_USER_FIELDS = ("attendees",)
+
+def calendar_entry(calendar):
+    """
+    Convert a calendarList resource into the shape served by /api/calendars.
+
+    Args:
+        calendar: Calendar list entry from the API
+
+    Returns:
+        Calendar dictionary
+    """
+    return {
+        "id": calendar["id"],
+        "summary": calendar.get("summaryOverride") or calendar.get("summary", calendar["id"]),
+        "backgroundColor": calendar.get("backgroundColor", "#4285F4"),
+        "foregroundColor": calendar.get("foregroundColor", "#FFFFFF"),
+        "selected": calendar.get("selected", True),
+        "accessRole": calendar.get("accessRole", "reader"),
+        "primary": calendar.get("primary", False)
+    }
+
+def apply_calendar_changes(calendars, items):
+    """
+    Apply a page of calendar list entries to calendars by ID, in place.
+    Entries Google reports as deleted are removed.
+
+    Args:
+        calendars: Dict mapping calendar ID to calendar dictionary
+        items: Calendar list entries from the API
+    """
+    for calendar in items:
+        if calendar.get("deleted"):
+            calendars.pop(calendar["id"], None)
+        else:
+            calendars[calendar["id"]] = calendar_entry(calendar)
+
+def fetch_calendar_list(service, calendars, sync_token=None):
+    """
+    Read every page of the calendar list into calendars.
+
+    Args:
+        service: Google Calendar API service
+        calendars: Dict mapping calendar ID to calendar dictionary; updated in place
+        sync_token: Token from an earlier listing to fetch only what changed
+
+    Returns:
+        The next sync token
+
+    Raises:
+        HttpError: If a request fails (410 if the sync token expired)
+    """
+    params = {"maxResults": CALENDAR_LIST_PAGE_SIZE, "fields": CALENDAR_LIST_FIELDS}
+    if sync_token:
+        params["syncToken"] = sync_token
+
+    page_token = None
+    while True:
+        page = execute_request(
+            service.calendarList().list(pageToken=page_token, **params), "calendarList.list"
+        )
+        apply_calendar_changes(calendars, page.get("items", []))
+
+        page_token = page.get("nextPageToken")
+        if not page_token:
+            return page.get("nextSyncToken", sync_token)
+
+def get_calendar_list(service, cache=None, user_key=None,
+                      refresh_interval=DEFAULT_CALENDAR_LIST_INTERVAL):
+    """
+    Return the user's calendar list, through the cache when there is one.
+
+    A cached list is served as is for refresh_interval seconds, then
+    brought up to date with Google's sync token, which only returns the
+    calendars that were added, changed or removed. Without a cached list,
+    or when Google rejects the token with HTTP 410, the list is read in
+    full.
+
+    Args:
+        service: Google Calendar API service
+        cache: Optional EventCache the list is kept in
+        user_key: Key identifying the user in the cache
+        refresh_interval: Seconds a cached list is served without asking
+                          Google for changes
+
+    Returns:
+        List of calendar dictionaries in Google's order
+    """
+    if cache is None:
+        calendars = {}
+        fetch_calendar_list(service, calendars)
+        return list(calendars.values())
+
+    entry = cache.get_calendar_list(user_key)
+
+    if entry is not None:
+        if time.time() - entry["synced_at"] < refresh_interval:
+            CACHE_LOOKUPS.inc(result="fresh")
+            return list(entry["calendars"].values())
+
+        if entry.get("sync_token"):
+            CACHE_LOOKUPS.inc(result="sync")
+            calendars = dict(entry["calendars"])
+            try:
+                sync_token = fetch_calendar_list(service, calendars, entry["sync_token"])
+            except HttpError as e:
+                # 410 Gone: the sync token expired, so start over
+                if e.resp.status != 410:
+                    raise
+            else:
+                store_calendar_list(cache, user_key, calendars, sync_token)
+                return list(calendars.values())
+
+    CACHE_LOOKUPS.inc(result="miss")
+    calendars = {}
+    sync_token = fetch_calendar_list(service, calendars)
+    store_calendar_list(cache, user_key, calendars, sync_token)
+    return list(calendars.values())
+
+def cached_calendar_list(cache, user_key):
+    """
+    Return the user's cached calendar list without contacting Google.
+
+    Args:
+        cache: EventCache instance or None
+        user_key: Key identifying the user
+
+    Returns:
+        Dict mapping calendar ID to calendar dictionary, or None if the
+        list is not cached
+    """
+    if cache is None:
+        return None
+
+    entry = cache.get_calendar_list(user_key)
+    return entry["calendars"] if entry is not None else None
+
+def store_calendar_list(cache, user_key, calendars, sync_token):
+    """Cache a user's calendar list along with its sync token"""
+    cache.set_calendar_list(user_key, {
+        "calendars": calendars, "sync_token": sync_token, "synced_at": time.time()
+    })
+
+def find_calendar(calendars, calendar_id):
+    """
+    Look a calendar up in the list, resolving the "primary" alias.
+
+    Args:
+        calendars: Dict mapping calendar ID to calendar dictionary
+        calendar_id: Calendar ID, or "primary"
+
+    Returns:
+        Calendar dictionary, or None if it is not in the list
+    """
+    calendar = calendars.get(calendar_id)
+    if calendar is None and calendar_id == "primary":
+        calendar = next((entry for entry in calendars.values() if entry.get("primary")), None)
+    return calendar
+
+def calendar_colors(calendars, calendar_ids):
+    """
+    Pick the display settings of the requested calendars.
+
+    Args:
+        calendars: Dict mapping calendar ID to calendar dictionary
+        calendar_ids: Calendars the events were requested for
+
+    Returns:
+        Dict mapping each requested calendar ID to its colors and access
+        role; calendars missing from the list are left out
+    """
+    colors = {}
+    for calendar_id in calendar_ids:
+        calendar = find_calendar(calendars, calendar_id)
+        if calendar is not None:
+            colors[calendar_id] = {
+                "backgroundColor": calendar["backgroundColor"],
+                "foregroundColor": calendar["foregroundColor"],
+                "accessRole": calendar["accessRole"]
+            }
+    return colors
+
+def shared_calendars(calendars, fields):
+    """
+    Pick the calendars whose years can be cached once for all users.
+
+    Every reader of a calendar (a company holiday calendar, an on-call
+    rota) sees the same events, so its years are cached under a key shared
+    by all of them. The user's own calendar list is the access check: only
+    calendars it holds with a read-only role are shared, so a user is never
+    served a calendar they could not read from Google. Calendars they can
+    write to stay per user, as does everything when the requested fields
+    include per-user data such as attendees. Notes and other annotations
+    are added to copies of the cached events for each request.
+
+    Args:
+        calendars: Dict mapping calendar ID to calendar dictionary from the
+                   user's calendar list, or None if it is not loaded
+        fields: Partial response field selector, or None for full events
+
+    Returns:
+        Dict mapping calendar ID to the shared user key its years are
+        cached under (see calendar_cache_key)
+    """
+    if not calendars or not fields or any(field in fields for field in PER_USER_FIELDS):
+        return {}
+
+    return {
+        calendar_id: SHARED_USER_PREFIX + calendar["accessRole"]
+        for calendar_id, calendar in calendars.items()
+        if calendar["accessRole"] in SHARED_ROLES
+    }
@@ -1,181 +1,1207 @@
-from googleapiclient.discovery import build
-from datetime import datetime, timedelta
-import re
+from googleapiclient.errors import HttpError
+from app.services.google_client import get_calendar_service
+from app.services.bucketing import event_day_span, day_spans, index_days, summarize_days
+from app.services.note_codec import extract_note, extract_notes, inject_note
+from app.services.event_index import EventIndex
+from app.services.search_index import SearchIndex
+from app.services.event_cache import calendar_cache_key, is_shared_key
+from app.services.scheduler import get_scheduler, SingleFlight
+from app.metrics import stage, record_google_call, CALENDAR_FETCH_SECONDS, CACHE_LOOKUPS, SHARED_CACHE_READS
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+import contextvars
+import logging
+import queue
+import threading
+import time
 
-def get_events_for_year(credentials, year, calendar_ids):
+logger = logging.getLogger(__name__)
+
+# Maximum number of calendars fetched from Google at the same time
+DEFAULT_MAX_WORKERS = 8
+
+# Seconds a single calendar fetch may take before it is reported as failed
+DEFAULT_CALENDAR_TIMEOUT = 30
+
+# Threads fetching calendars for all requests of the process
+DEFAULT_FETCH_THREADS = 32
+
+# Events requested per page (the Calendar API allows up to 2500)
+DEFAULT_PAGE_SIZE = 250
+
+# Maximum number of calls the Calendar API accepts in one batch request
+BATCH_SIZE = 50
+
+# Attempts made to write a note while the event keeps changing underneath
+MAX_NOTE_WRITE_ATTEMPTS = 3
+
+# Fields read and returned when writing a note
+NOTE_WRITE_FIELDS = "id,etag,description"
+
+# Longest date range answered by one get_events_for_range call
+MAX_RANGE_DAYS = 3 * 366
+
+# Search results returned when the caller does not ask for a number, and
+# the most a caller may ask for
+DEFAULT_SEARCH_LIMIT = 100
+MAX_SEARCH_LIMIT = 1000
+
+# Event fields kept in the year overview; full bodies are loaded per day
+OVERVIEW_FIELDS = ("id", "calendarId", "summary", "start", "end", "span")
+
+# Partial response projection: only the event fields the app actually uses
+DEFAULT_EVENT_FIELDS = (
+    "nextPageToken,nextSyncToken,"
+    "items(id,etag,status,summary,description,location,start,end,htmlLink,recurringEventId)"
+)
+
+# Syncs of shared calendar years; the readers asking at the same time wait
+# for one sync instead of each asking Google
+_shared_syncs = SingleFlight()
+
+def get_events_for_year(credentials, year, calendar_ids, errors=None,
+                        max_workers=DEFAULT_MAX_WORKERS,
+                        timeout=DEFAULT_CALENDAR_TIMEOUT,
+                        page_size=DEFAULT_PAGE_SIZE,
+                        fields=DEFAULT_EVENT_FIELDS,
+                        cache=None, user_key=None, sync_interval=0, shared=None,
+                        sync_intervals=None, compact=False, detail=True):
     """
     Fetch all events for the specified year from the given Google calendars.
     
+    Calendars are fetched concurrently and every page of results is
+    bucketed into days as soon as it arrives, while later pages are still
+    in flight. A calendar that fails or times out is left out of the
+    result instead of failing the whole year.
+    
+    With a cache, each calendar's year is stored together with Google's
+    sync token and later loads only fetch what changed since then.
+    Calendars listed in shared are read from and stored in the cache tier
+    shared by all their readers (see shared_calendars).
+    
+    The compact format stores every event once instead of copying it into
+    each day it covers (see build_compact_year).
+    
     Args:
         credentials: Google OAuth credentials
         year: The year to fetch events for (integer)
         calendar_ids: List of calendar IDs to fetch events from
+        errors: Optional dict that receives an error message per failed calendar
+        max_workers: Maximum number of calendars fetched at the same time
+        timeout: Seconds allowed for each calendar fetch
+        page_size: Number of events requested per page
+        fields: Partial response field selector, or None for full events
+        cache: Optional EventCache used for incremental sync
+        user_key: Key identifying the user in the cache
+        sync_interval: Seconds a cached calendar is served without asking
+                       Google for changes
+        shared: Optional dict mapping calendar ID to the shared user key
+                its years are cached under
+        sync_intervals: Optional dict mapping calendar ID to a sync interval
+                        replacing sync_interval, for calendars kept fresh
+                        by push notifications
+        compact: Return the compact format instead of per-day event copies
+        detail: With compact, keep full event bodies; otherwise the event
+                table only holds what the year view needs (see
+                overview_event), and bodies are fetched per day with
+                get_events_for_day
+        
+    Returns:
+        Dictionary of events organized by date, or the compact year
+        dictionary if compact is set
+    """
+    if errors is None:
+        errors = {}
+    
+    calendar_buckets = dict(iter_calendar_years(
+        credentials, year, calendar_ids, errors,
+        max_workers=max_workers, timeout=timeout, page_size=page_size, fields=fields,
+        cache=cache, user_key=user_key, sync_interval=sync_interval, shared=shared,
+        sync_intervals=sync_intervals, compact=compact
+    ))
+    
+    return assemble_year(year, calendar_ids, calendar_buckets, compact=compact, detail=detail)
+
+def assemble_year(year, calendar_ids, calendar_buckets, compact=False, detail=True):
+    """
+    Merge per-calendar buckets into the /api/events payload.
+    
+    Args:
+        year: The year (integer)
+        calendar_ids: Requested calendar IDs, in display order
+        calendar_buckets: Dict of calendar ID to the bucket filled by
+                          add_page_to_bucket; failed calendars are missing
+        compact: Build the compact format instead of date -> events
+        detail: Keep full event bodies instead of overview events
+        
+    Returns:
+        Compact year dictionary, or dictionary of date to events
+    """
+    result = assemble_days(date(year, 1, 1), date(year + 1, 1, 1), calendar_ids, calendar_buckets,
+                           compact=compact, detail=detail)
+    return {"year": year, **result} if compact else result
+
+def assemble_days(first_day, end, calendar_ids, calendar_buckets, compact=False, detail=True):
+    """
+    Merge per-calendar buckets of a run of days into one payload.
+    
+    Args:
+        first_day: First day (date); day 0 of the compact spans
+        end: Day after the last one (date)
+        calendar_ids: Requested calendar IDs, in display order
+        calendar_buckets: Dict of calendar ID to the bucket filled by
+                          add_page_to_bucket; failed calendars are missing
+        compact: Build the compact format instead of date -> events
+        detail: Keep full event bodies instead of overview events
         
     Returns:
-        Dictionary of events organized by date
+        Compact dictionary without its "year", or dictionary of date to events
     """
-    service = build("calendar", "v3", credentials=credentials)
+    if compact:
+        compact_days = build_compact_days(first_day, (end - first_day).days, [
+            calendar_buckets[calendar_id]
+            for calendar_id in dict.fromkeys(calendar_ids)
+            if calendar_id in calendar_buckets
+        ])
+        if not detail:
+            compact_days["events"] = [overview_event(event) for event in compact_days["events"]]
+        return compact_days
+    
+    # Organize events by date for easier frontend processing. Calendars are
+    # merged in the order they were requested, not the order the fetches
+    # happened to finish, so the output is deterministic.
+    events_by_date = {}
+    
+    for calendar_id in dict.fromkeys(calendar_ids):
+        for event_date, day_events in calendar_buckets.get(calendar_id, {}).items():
+            # Pages and cache entries are not in start time order
+            day_events.sort(key=event_sort_key)
+            events_by_date.setdefault(event_date, []).extend(day_events)
+    
+    return events_by_date
+
+def stream_events_for_year(credentials, year, calendar_ids, errors=None, detail=True, **options):
+    """
+    Fetch a year of events and yield it one calendar at a time, as soon as
+    each calendar is complete.
+    
+    Every chunk is a compact year (see build_compact_year) holding a single
+    calendar, with event indexes local to the chunk. The last chunk reports
+    the calendars that failed.
+    
+    Args:
+        credentials: Google OAuth credentials
+        year: The year to fetch events for (integer)
+        calendar_ids: List of calendar IDs to fetch events from
+        errors: Optional dict that receives an error message per failed calendar
+        detail: Keep full event bodies instead of overview events
+        options: Fetch and cache options accepted by get_events_for_year
+                 (compact is implied)
+        
+    Yields:
+        {"type": "calendar", "calendarId", "year", "events", "days"} per
+        calendar in completion order, then {"type": "done", "year", "errors"}
+    """
+    if errors is None:
+        errors = {}
+    
+    options["compact"] = True
+    for calendar_id, events in iter_calendar_years(credentials, year, calendar_ids, errors, **options):
+        chunk = build_compact_year(year, [events])
+        if not detail:
+            chunk["events"] = [overview_event(event) for event in chunk["events"]]
+        yield dict(chunk, type="calendar", calendarId=calendar_id)
+    
+    yield {"type": "done", "year": year, "errors": errors}
+
+def get_events_for_day(credentials, day, calendar_ids, errors=None, cache=None, **options):
+    """
+    Return the full events covering a single day.
+    
+    With a cache, the day is cut out of the cached years the overview was
+    built from, so opening a day does not ask Google again; a year that is
+    not cached (or was evicted) is fetched and cached as usual. Without a
+    cache, only a window around the day is fetched.
+    
+    Args:
+        credentials: Google OAuth credentials
+        day: The day (date)
+        calendar_ids: List of calendar IDs to read events from
+        errors: Optional dict that receives an error message per failed calendar
+        cache: Optional EventCache holding synced years
+        options: Fetch options accepted by get_events_for_year
+        
+    Returns:
+        List of events in calendar order, then start time, each with a
+        "span" relative to January 1st of the day's year
+    """
+    if errors is None:
+        errors = {}
+    
+    day_index = (day - date(day.year, 1, 1)).days
+    
+    if cache is not None:
+        # Cached years are served as they are; loading the overview is what
+        # keeps them in sync with Google
+        options["sync_interval"] = float("inf")
+        options.pop("sync_intervals", None)
+    else:
+        # Events are bucketed by their local date, which can be up to 14
+        # hours away from UTC, so ask for a day of margin on both sides
+        window_start = datetime(day.year, day.month, day.day) - timedelta(days=1)
+        options["bounds"] = (
+            window_start.isoformat() + "Z",
+            (window_start + timedelta(days=3)).isoformat() + "Z"
+        )
+    
+    calendar_events = dict(iter_calendar_years(
+        credentials, day.year, calendar_ids, errors, cache=cache, compact=True, **options
+    ))
+    
+    events = []
+    for calendar_id in dict.fromkeys(calendar_ids):
+        covering = [
+            event for event in calendar_events.get(calendar_id, [])
+            if event["span"][0] <= day_index <= event["span"][1]
+        ]
+        events.extend(sorted(covering, key=event_sort_key))
+    
+    return events
+
+def get_events_for_range(credentials, start, end, calendar_ids, errors=None,
+                         max_workers=DEFAULT_MAX_WORKERS,
+                         timeout=DEFAULT_CALENDAR_TIMEOUT,
+                         page_size=DEFAULT_PAGE_SIZE,
+                         fields=DEFAULT_EVENT_FIELDS,
+                         cache=None, user_key=None, sync_interval=0, shared=None,
+                         sync_intervals=None, index_cache=None, compact=False, detail=True):
+    """
+    Return the events covering any run of days, such as a quarter, a
+    rolling year or a single week.
+    
+    With a cache, the range is cut out of the cached years it touches
+    with an interval index (see EventIndex), so a window inside years that
+    are already synced costs no Google requests and events crossing New
+    Year are returned once. Years that are missing or due for a sync are
+    synced first, exactly as a year load does. Without a cache, only the
+    range (plus a day of margin for time zones) is fetched.
+    
+    Args:
+        credentials: Google OAuth credentials
+        start: First day of the range (date)
+        end: Day after the last day of the range (date)
+        calendar_ids: List of calendar IDs to fetch events from
+        errors: Optional dict that receives an error message per failed calendar
+        index_cache: Optional EventIndexCache reusing indexes across calls
+        compact: Build the compact format, with spans counted from start
+        detail: With compact, keep full event bodies
+        Other arguments are as for get_events_for_year.
+        
+    Returns:
+        Compact dictionary with "start" and "end", or dictionary of date
+        to events
+    """
+    if errors is None:
+        errors = {}
+    
+    last_day = end - timedelta(days=1)
+    
+    def service_factory():
+        return get_calendar_service(credentials)
+    
+    def list_pages(service, calendar_id):
+        if cache is None:
+            # Events are bucketed by their local date, which can be up to
+            # 14 hours away from UTC, so ask for a day of margin on both sides
+            time_min = (datetime(start.year, start.month, start.day) - timedelta(days=1)).isoformat() + "Z"
+            time_max = (datetime(end.year, end.month, end.day) + timedelta(days=1)).isoformat() + "Z"
+            for page in iter_event_pages(service, calendar_id, page_size, fields,
+                                         timeMin=time_min, timeMax=time_max,
+                                         orderBy="startTime"):
+                yield [event for event in page.get("items", []) if _covers_days(event, start, last_day)]
+            return
+        
+        # An event on the first or last local day can be cached under the
+        # neighbouring year when its UTC time falls there
+        seen = set()
+        for year in range((start - timedelta(days=1)).year, end.year + 1):
+            key = calendar_cache_key(user_key, calendar_id, year, shared)
+            entry = synced_entry(service, cache, key, page_size, fields,
+                                 (sync_intervals or {}).get(calendar_id, sync_interval))
+            index = index_cache.get(key, entry) if index_cache is not None else EventIndex(entry["events"].values())
+            
+            events = [event for event in index.overlapping(start, last_day) if event["id"] not in seen]
+            seen.update(event["id"] for event in events)
+            yield [dict(event) for event in events]
+    
+    calendar_buckets = {}
+    finished = {}
+    
+    for calendar_id, events in stream_calendar_pages(
+        service_factory, calendar_ids, list_pages, errors,
+        max_workers=max_workers, timeout=timeout, report_finished=True
+    ):
+        bucket = calendar_buckets.setdefault(calendar_id, [] if compact else {})
+        if events is None:
+            finished[calendar_id] = calendar_buckets.pop(calendar_id)
+            continue
+        add_page_to_bucket(calendar_id, events, bucket, start, compact)
+    
+    result = assemble_days(start, end, calendar_ids, finished, compact=compact, detail=detail)
+    return {"start": start.isoformat(), "end": end.isoformat(), **result} if compact else result
+
+def search_events(credentials, year, calendar_ids, query, errors=None,
+                  max_workers=DEFAULT_MAX_WORKERS,
+                  timeout=DEFAULT_CALENDAR_TIMEOUT,
+                  page_size=DEFAULT_PAGE_SIZE,
+                  fields=DEFAULT_EVENT_FIELDS,
+                  cache=None, user_key=None, sync_interval=0, shared=None,
+                  sync_intervals=None, search_cache=None, limit=DEFAULT_SEARCH_LIMIT):
+    """
+    Find a year's events whose title, location, description or note
+    contains every word of a query, each word also matching longer words
+    it starts (so "dent" finds "Dentist").
+    
+    With a cache, each cached calendar year keeps a search index (see
+    SearchIndex) that is updated with the events a sync changed rather
+    than rebuilt, and years due for a sync are synced first, exactly as a
+    year load does. Without a cache, the year is fetched and indexed for
+    this call only.
+    
+    Args:
+        credentials: Google OAuth credentials
+        year: The year to search (integer)
+        calendar_ids: List of calendar IDs to search
+        query: Search text
+        errors: Optional dict that receives an error message per failed calendar
+        search_cache: Optional SearchIndexCache keeping indexes across calls
+        limit: Maximum number of events returned
+        Other arguments are as for get_events_for_year.
+    
+    Returns:
+        Dictionary with "events" (the first matches in start time order,
+        each with calendarId and a span relative to January 1st), "total"
+        (the number of matches) and "dates" (every day of the year covered
+        by a match, as sorted dates)
+    """
+    if errors is None:
+        errors = {}
+    
+    first_day = date(year, 1, 1)
+    last_day = date(year, 12, 31)
+    
+    def service_factory():
+        return get_calendar_service(credentials)
+    
+    def list_pages(service, calendar_id):
+        if cache is None:
+            time_min, time_max = year_bounds(year)
+            events = {}
+            for page in iter_event_pages(service, calendar_id, page_size, fields,
+                                         timeMin=time_min, timeMax=time_max):
+                events.update((event["id"], event) for event in page.get("items", [])
+                              if event.get("status") != "cancelled")
+            index = SearchIndex(events)
+        else:
+            key = calendar_cache_key(user_key, calendar_id, year, shared)
+            entry = synced_entry(service, cache, key, page_size, fields,
+                                 (sync_intervals or {}).get(calendar_id, sync_interval))
+            index = search_cache.get(key, entry) if search_cache is not None else SearchIndex(entry["events"])
+        
+        with stage("search"):
+            events, dates, total = index.search(query, first_day, last_day, limit)
+        yield [dict(event) for event in events], dates, total
+    
+    matches = []
+    dates = set()
+    total = 0
+    
+    for calendar_id, (events, calendar_dates, calendar_total) in stream_calendar_pages(
+        service_factory, calendar_ids, list_pages, errors,
+        max_workers=max_workers, timeout=timeout
+    ):
+        bucket = []
+        add_page_to_bucket(calendar_id, events, bucket, first_day, compact=True)
+        matches.extend(bucket)
+        dates.update(calendar_dates)
+        total += calendar_total
+    
+    # Each calendar sent its own first matches; keep the first overall
+    matches.sort(key=event_sort_key)
+    return {"events": matches[:limit], "total": total, "dates": sorted(dates)}
+
+def synced_entry(service, cache, key, page_size=DEFAULT_PAGE_SIZE, fields=DEFAULT_EVENT_FIELDS,
+                 sync_interval=0):
+    """
+    Return a calendar year's cache entry, syncing it with Google first
+    when it is missing or older than sync_interval. Readers of a shared
+    calendar asking at the same time share one sync.
+    
+    Args:
+        service: Google Calendar API service
+        cache: EventCache storing the calendar's events and sync token
+        key: Cache key of the form (user_key, calendar_id, year)
+        page_size: Number of events requested per page
+        fields: Partial response field selector, or None for full events
+        sync_interval: Seconds a cached entry is used without asking
+                       Google for changes
+        
+    Returns:
+        Cache entry dictionary
+    """
+    shared = is_shared_key(key)
+    if shared:
+        SHARED_CACHE_READS.inc()
+    
+    entry = cache.get(key)
+    if entry is not None and time.time() - entry["synced_at"] < sync_interval:
+        CACHE_LOOKUPS.inc(result="fresh")
+        return entry
+    
+    if shared:
+        # Every reader of a shared calendar may be asking for it right now
+        return _shared_syncs.do(key, lambda: _sync_entry(service, cache, key, page_size, fields))
+    return _sync_entry(service, cache, key, page_size, fields)
+
+def _sync_entry(service, cache, key, page_size, fields):
+    events = {}
+    for page in iter_synced_events(service, cache, key, *year_bounds(key[2]),
+                                   page_size=page_size, fields=fields):
+        events.update((event["id"], event) for event in page)
+    
+    # Evicted already by a small cache; serve what was just synced
+    return cache.get(key) or {"events": events, "sync_token": None, "synced_at": time.time()}
+
+def _covers_days(event, first_day, last_day):
+    span = event_day_span(event)
+    return span is not None and span[0] <= last_day and span[1] >= first_day
+
+def overview_event(event):
+    """
+    Reduce an event to what the year view and its day list need.
+    
+    Args:
+        event: Event with calendarId and span
+        
+    Returns:
+        New dictionary with only the OVERVIEW_FIELDS of the event
+    """
+    return {field: event[field] for field in OVERVIEW_FIELDS if field in event}
+
+def iter_calendar_years(credentials, year, calendar_ids, errors,
+                        max_workers=DEFAULT_MAX_WORKERS,
+                        timeout=DEFAULT_CALENDAR_TIMEOUT,
+                        page_size=DEFAULT_PAGE_SIZE,
+                        fields=DEFAULT_EVENT_FIELDS,
+                        cache=None, user_key=None, sync_interval=0, shared=None,
+                        sync_intervals=None, compact=False, bounds=None):
+    """
+    Fetch a year of events from several calendars concurrently and yield
+    each calendar once all of its pages have been processed.
+    
+    Takes the same arguments as get_events_for_year; failed calendars are
+    reported in errors and never yielded. Without a cache, bounds may
+    narrow the request to part of the year as an RFC3339
+    (time_min, time_max) pair; cached calendars are always synced whole.
+    
+    Yields:
+        Tuples of (calendar_id, bucket) in completion order, where bucket is
+        a list of events with a "span" if compact is set, otherwise a dict
+        of date to events
+    """
+    # Each worker thread gets its own pooled service and transport
+    def service_factory():
+        return get_calendar_service(credentials)
     
     # Set time boundaries for the year
-    start_date = datetime(year, 1, 1, 0, 0, 0).isoformat() + "Z"
-    end_date = datetime(year, 12, 31, 23, 59, 59).isoformat() + "Z"
+    start_date, end_date = year_bounds(year)
     
-    all_events = []
+    def list_pages(service, calendar_id):
+        if cache is None:
+            time_min, time_max = bounds or (start_date, end_date)
+            for page in iter_event_pages(service, calendar_id, page_size, fields,
+                                         timeMin=time_min, timeMax=time_max,
+                                         orderBy="startTime"):
+                yield page.get("items", [])
+            return
+        
+        key = calendar_cache_key(user_key, calendar_id, year, shared)
+        interval = (sync_intervals or {}).get(calendar_id, sync_interval)
+        if is_shared_key(key):
+            entry = synced_entry(service, cache, key, page_size, fields, interval)
+            yield [dict(event) for event in entry["events"].values()]
+        else:
+            yield from iter_synced_events(
+                service, cache, key, start_date, end_date,
+                page_size=page_size, fields=fields, sync_interval=interval
+            )
     
-    for calendar_id in calendar_ids:
-        events_result = service.events().list(
-            calendarId=calendar_id,
-            timeMin=start_date,
-            timeMax=end_date,
-            singleEvents=True,
-            orderBy="startTime"
-        ).execute()
+    # Each calendar is bucketed separately so a calendar that fails halfway
+    # through its pages can be dropped as a whole
+    calendar_buckets = {}
+    first_day = date(year, 1, 1)
+    
+    pages = stream_calendar_pages(
+        service_factory, calendar_ids, list_pages, errors,
+        max_workers=max_workers, timeout=timeout, report_finished=True
+    )
+    
+    for calendar_id, events in pages:
+        bucket = calendar_buckets.setdefault(calendar_id, [] if compact else {})
+        
+        if events is None:
+            # Every page of this calendar has arrived
+            yield calendar_id, calendar_buckets.pop(calendar_id)
+            continue
         
-        events = events_result.get("items", [])
+        add_page_to_bucket(calendar_id, events, bucket, first_day, compact)
+
+def add_page_to_bucket(calendar_id, events, bucket, first_day, compact=False):
+    """
+    Tag a page of a calendar's events and add them to its bucket.
+    
+    Args:
+        calendar_id: ID of the calendar the page belongs to
+        events: List of events (modified in place)
+        bucket: List of events if compact is set, otherwise a dict of date
+                to events
+        first_day: January 1st of the year, day 0 of the spans
+        compact: Store events once with a "span" instead of per-day copies
+    """
+    # Extract the notes and day spans of the whole page in one pass
+    with stage("notes"):
+        notes = extract_notes([event.get("description") for event in events])
+    
+    with stage("bucketing"):
+        spans = day_spans(events, first_day) if compact else None
         
-        for event in events:
+        for position, (event, note) in enumerate(zip(events, notes)):
             # Add calendar ID to each event for reference
             event["calendarId"] = calendar_id
             
-            # Extract the note if it exists in the description
-            note = extract_note_from_description(event.get("description", ""))
             if note:
                 event["note"] = note
             
-            all_events.append(event)
+            if compact:
+                if spans[position] is None:
+                    continue  # Skip events with no date
+                
+                # Days covered, as day-of-year indexes (0 is January 1st)
+                event["span"] = spans[position]
+                bucket.append(event)
+            else:
+                add_event_to_days(event, bucket)
+
+def year_bounds(year):
+    """
+    Return the RFC3339 time boundaries of a year.
     
-    # Organize events by date for easier frontend processing
-    events_by_date = {}
+    Args:
+        year: The year (integer)
+        
+    Returns:
+        Tuple of (time_min, time_max)
+    """
+    return (
+        datetime(year, 1, 1, 0, 0, 0).isoformat() + "Z",
+        datetime(year, 12, 31, 23, 59, 59).isoformat() + "Z"
+    )
+
+def event_sort_key(event):
+    """Order events by start time, then ID, the same way for fresh and cached data"""
+    start = event.get("start", {})
+    return (start.get("dateTime") or start.get("date") or "", event.get("id", ""))
+
+def event_in_range(event, time_min, time_max):
+    """
+    Check whether an event overlaps the given time range.
     
-    for event in all_events:
-        start = event.get("start", {})
-        end = event.get("end", {})
+    Args:
+        event: Event resource from the Google Calendar API
+        time_min: Lower bound (RFC3339) for the event's end time
+        time_max: Upper bound (RFC3339) for the event's start time
         
-        # Handle all-day events
-        if "date" in start:
-            start_date = datetime.fromisoformat(start["date"])
-            
-            # For end date, subtract 1 day if using Google Calendar convention
-            # Google stores end date as the day after the actual end
-            if "date" in end:
-                end_date = datetime.fromisoformat(end["date"]) - timedelta(days=1)
+    Returns:
+        Boolean indicating overlap
+    """
+    start = _parse_event_time(event.get("start", {}))
+    end = _parse_event_time(event.get("end", {})) or start
+    if start is None:
+        return False
+    
+    range_start = datetime.fromisoformat(time_min.replace("Z", "+00:00"))
+    range_end = datetime.fromisoformat(time_max.replace("Z", "+00:00"))
+    return start <= range_end and end > range_start
+
+def _parse_event_time(value):
+    # All-day events carry a date; compare them as midnight UTC
+    if value.get("dateTime"):
+        parsed = datetime.fromisoformat(value["dateTime"].replace("Z", "+00:00"))
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    if value.get("date"):
+        return datetime.fromisoformat(value["date"]).replace(tzinfo=timezone.utc)
+    return None
+
+def build_compact_year(year, calendar_events):
+    """
+    Build the compact representation of a year of events.
+    
+    Every event is stored once in an event table. Each event carries its
+    span as day-of-year indexes (0 is January 1st), and days only hold
+    indexes into the event table. For a day index d and an event span
+    [first, last], isFirstDay is d == first and isMultiDay is first != last.
+    Days outside the year are not listed. The summary holds the per-day
+    counts the year view draws (see summarize_days).
+    
+    Args:
+        year: The year (integer)
+        calendar_events: Lists of events with a "span", one list per
+                         calendar in display order
+        
+    Returns:
+        Dictionary with "year", "events" (the event table), "days"
+        (day-of-year index to list of event table indexes) and "summary"
+    """
+    days_in_year = (date(year + 1, 1, 1) - date(year, 1, 1)).days
+    return {"year": year, **build_compact_days(date(year, 1, 1), days_in_year, calendar_events)}
+
+def build_compact_days(first_day, day_count, calendar_events):
+    """
+    Build the compact representation of any run of days; see
+    build_compact_year, with day indexes counted from first_day.
+    
+    Args:
+        first_day: Date that is day 0 of the spans
+        day_count: Number of days listed
+        calendar_events: Lists of events with a "span" relative to
+                         first_day, one list per calendar in display order
+        
+    Returns:
+        Dictionary with "events", "days" and "summary"
+    """
+    events = []
+    
+    for calendar in calendar_events:
+        # Pages and cache entries are not in start time order
+        calendar.sort(key=event_sort_key)
+        events.extend(calendar)
+    
+    with stage("bucketing"):
+        days = index_days([event["span"] for event in events], day_count)
+        summary = summarize_days(events, days)
+    return {"events": events, "days": days, "summary": summary}
+
+def add_event_to_days(event, events_by_date):
+    """
+    Add a copy of an event to every day it covers.
+    
+    Args:
+        event: Event resource from the Google Calendar API
+        events_by_date: Dictionary of events organized by date, updated in place
+    """
+    span = event_day_span(event)
+    if span is None:
+        return
+    
+    # Generate all dates between start and end (inclusive)
+    start_date, end_date = span
+    current_date = start_date
+    
+    # For each day in the event's duration
+    while current_date <= end_date:
+        event_date = current_date.isoformat()
+        
+        # Add event to the appropriate date
+        if event_date not in events_by_date:
+            events_by_date[event_date] = []
+        
+        # Clone the event for each day to avoid modifying the original
+        event_copy = event.copy()
+        
+        # Add a flag to indicate if this is the first day of a multi-day event
+        event_copy["isFirstDay"] = (current_date == start_date)
+        
+        # Add a flag to indicate this is a multi-day event
+        event_copy["isMultiDay"] = (start_date != end_date)
+        
+        events_by_date[event_date].append(event_copy)
+        
+        # Move to the next day
+        current_date += timedelta(days=1)
+
+def iter_event_pages(service, calendar_id, page_size=DEFAULT_PAGE_SIZE,
+                     fields=DEFAULT_EVENT_FIELDS, **params):
+    """
+    Yield the result pages of an events.list call one at a time.
+    
+    Follows nextPageToken until the last page, so only one page of results
+    is held by the generator at any moment. The last page carries
+    nextSyncToken when Google provides one.
+    
+    Args:
+        service: Google Calendar API service
+        calendar_id: ID of the calendar to list
+        page_size: Number of events requested per page
+        fields: Partial response field selector, or None for full events
+        params: Additional events.list parameters (timeMin, syncToken, ...)
+        
+    Yields:
+        Each events.list response
+    """
+    params.update(calendarId=calendar_id, singleEvents=True, maxResults=page_size)
+    if fields:
+        params["fields"] = fields
+    
+    page_token = None
+    while True:
+        if page_token:
+            params["pageToken"] = page_token
+        
+        events_result = execute_request(service.events().list(**params), "events.list")
+        yield events_result
+        
+        page_token = events_result.get("nextPageToken")
+        if not page_token:
+            break
+
+def iter_synced_events(service, cache, key, time_min, time_max,
+                       page_size=DEFAULT_PAGE_SIZE, fields=DEFAULT_EVENT_FIELDS,
+                       sync_interval=0):
+    """
+    Yield a calendar's events for a time range, kept in sync through a cache.
+    
+    A cached entry is brought up to date with an incremental sync using
+    Google's sync token, applying only changed and cancelled events. When
+    there is no entry, or Google rejects the token with HTTP 410, the range
+    is fetched in full and its pages are yielded as they arrive.
+    
+    Args:
+        service: Google Calendar API service
+        cache: EventCache storing the calendar's events and sync token
+        key: Cache key of the form (user_key, calendar_id, year)
+        time_min: Lower bound (RFC3339) for an event's end time
+        time_max: Upper bound (RFC3339) for an event's start time
+        page_size: Number of events requested per page
+        fields: Partial response field selector, or None for full events
+        sync_interval: Seconds a cached entry is served without asking
+                       Google for changes
+        
+    Yields:
+        Lists of events (copies that callers may modify)
+    """
+    calendar_id = key[1]
+    entry = cache.get(key)
+    
+    if entry is not None:
+        if time.time() - entry["synced_at"] < sync_interval:
+            CACHE_LOOKUPS.inc(result="fresh")
+            yield [dict(event) for event in entry["events"].values()]
+            return
+        
+        if entry.get("sync_token"):
+            CACHE_LOOKUPS.inc(result="sync")
+            try:
+                events, sync_token = _incremental_sync(
+                    service, calendar_id, entry, time_min, time_max, page_size, fields
+                )
+            except HttpError as e:
+                # 410 Gone: the sync token expired, so start over
+                if e.resp.status != 410:
+                    raise
             else:
-                end_date = start_date  # Single day event
-                
+                cache.set(key, {"events": events, "sync_token": sync_token, "synced_at": time.time()})
+                yield [dict(event) for event in events.values()]
+                return
+    
+    CACHE_LOOKUPS.inc(result="miss")
+    events = {}
+    sync_token = None
+    
+    for page in iter_event_pages(service, calendar_id, page_size, fields,
+                                 timeMin=time_min, timeMax=time_max):
+        items = [event for event in page.get("items", []) if event.get("status") != "cancelled"]
+        for event in items:
+            events[event["id"]] = event
+        
+        sync_token = page.get("nextSyncToken", sync_token)
+        yield [dict(event) for event in items]
+    
+    cache.set(key, {"events": events, "sync_token": sync_token, "synced_at": time.time()})
+
+def _incremental_sync(service, calendar_id, entry, time_min, time_max, page_size, fields):
+    # Sync requests may not carry timeMin/timeMax, so changes are reported
+    # for the whole calendar and filtered to the cached range here
+    events = dict(entry["events"])
+    sync_token = entry["sync_token"]
+    
+    for page in iter_event_pages(service, calendar_id, page_size, fields,
+                                 syncToken=sync_token):
+        apply_changes(events, page.get("items", []), time_min, time_max)
+        sync_token = page.get("nextSyncToken", sync_token)
+    
+    return events, sync_token
+
+def apply_changes(events, changes, time_min, time_max):
+    """
+    Apply changed events reported by an incremental sync to cached events.
+    
+    Args:
+        events: Dict of event ID to event, updated in place
+        changes: Changed and cancelled events from a sync page
+        time_min: Lower bound (RFC3339) of the cached range
+        time_max: Upper bound (RFC3339) of the cached range
+    """
+    for event in changes:
+        if event.get("status") == "cancelled" or not event_in_range(event, time_min, time_max):
+            events.pop(event["id"], None)
         else:
-            # Timed events
-            event_datetime = start.get("dateTime", "")
-            if not event_datetime:
-                continue  # Skip events with no date
-                
-            start_date = datetime.fromisoformat(event_datetime.replace("Z", "+00:00"))
-            
-            # Get end date/time if available
-            end_datetime = end.get("dateTime", "")
-            if end_datetime:
-                end_date = datetime.fromisoformat(end_datetime.replace("Z", "+00:00"))
-            else:
-                end_date = start_date  # Use start date if no end date
+            events[event["id"]] = event
+
+_fetch_executor = None
+_fetch_threads = DEFAULT_FETCH_THREADS
+_fetch_executor_lock = threading.Lock()
+
+def configure_fetch_threads(threads):
+    """
+    Set the number of threads fetching calendars for all requests.
+
+    Args:
+        threads: Maximum number of fetch threads in the process
+    """
+    global _fetch_executor, _fetch_threads
+    threads = max(1, threads)
+    with _fetch_executor_lock:
+        # Keep the running threads, and the connections they hold, if nothing changed
+        if threads == _fetch_threads:
+            return
+        previous = _fetch_executor
+        _fetch_threads = threads
+        _fetch_executor = None
+    if previous is not None:
+        previous.shutdown(wait=False)
+
+def get_fetch_executor():
+    """
+    Return the process-wide executor calendars are fetched on.
+
+    Its threads outlive the requests they work for, so the Calendar API
+    services and keep-alive connections each thread holds per login (see
+    get_calendar_service) are reused by later requests of the same user.
+
+    Returns:
+        ThreadPoolExecutor shared by all requests
+    """
+    global _fetch_executor
+    executor = _fetch_executor
+    if executor is None:
+        with _fetch_executor_lock:
+            if _fetch_executor is None:
+                _fetch_executor = ThreadPoolExecutor(
+                    max_workers=_fetch_threads, thread_name_prefix="calendar-fetch"
+                )
+            executor = _fetch_executor
+    return executor
+
+def stream_calendar_pages(service_factory, calendar_ids, list_pages, errors,
+                          max_workers=DEFAULT_MAX_WORKERS,
+                          timeout=DEFAULT_CALENDAR_TIMEOUT,
+                          report_finished=False):
+    """
+    Fetch several calendars concurrently and yield pages as they arrive.
+    
+    Calendars are fetched on the shared fetch executor, at most max_workers
+    at a time for this call. Each calendar gets its own timeout, measured
+    from the moment a worker starts on it, so calendars queued behind the
+    concurrency limit are not penalized for waiting. Pages of a calendar that later fails have
+    already been yielded; callers should discard calendars found in errors.
+    
+    Args:
+        service_factory: Callable returning a Calendar API service for the
+                         current thread
+        calendar_ids: List of calendar IDs to fetch events from
+        list_pages: Callable taking (service, calendar_id) and yielding
+                    lists of events
+        errors: Dict that receives an error message per failed calendar
+        max_workers: Maximum number of calendars fetched at the same time
+        timeout: Seconds allowed for each calendar fetch
+        report_finished: Also yield (calendar_id, None) once a calendar has
+                         delivered all of its pages without error
         
-        # Generate all dates between start and end (inclusive)
-        current_date = start_date.date()
-        end_date = end_date.date()
+    Yields:
+        Tuples of (calendar_id, events) for each page
+    """
+    calendar_ids = list(dict.fromkeys(calendar_ids))
+    if not calendar_ids:
+        return
+    
+    pages = queue.Queue()
+    started = {}
+    abandoned = set()
+    
+    def fetch(calendar_id):
+        started[calendar_id] = time.monotonic()
+        try:
+            service = service_factory()
+            for events in list_pages(service, calendar_id):
+                # Stop paging once the consumer has given up on this calendar
+                if calendar_id in abandoned:
+                    return
+                pages.put((calendar_id, events, None))
+        except Exception as e:
+            CALENDAR_FETCH_SECONDS.observe(time.monotonic() - started[calendar_id], outcome="error")
+            pages.put((calendar_id, None, e))
+        else:
+            CALENDAR_FETCH_SECONDS.observe(time.monotonic() - started[calendar_id], outcome="ok")
+            pages.put((calendar_id, None, None))
+    
+    executor = get_fetch_executor()
+    remaining = set(calendar_ids)
+    waiting = list(reversed(calendar_ids))
+    futures = []
+    
+    def submit_next():
+        # Workers report their timings to the request that started them
+        if waiting:
+            futures.append(executor.submit(contextvars.copy_context().run, fetch, waiting.pop()))
+    
+    try:
+        for _ in range(max(1, max_workers)):
+            submit_next()
         
-        # For each day in the event's duration
-        while current_date <= end_date:
-            event_date = current_date.isoformat()
-            
-            # Add event to the appropriate date
-            if event_date not in events_by_date:
-                events_by_date[event_date] = []
-            
-            # Clone the event for each day to avoid modifying the original
-            event_copy = event.copy()
-            
-            # Add a flag to indicate if this is the first day of a multi-day event
-            event_copy["isFirstDay"] = (current_date == start_date.date())
+        while remaining:
+            # Wake up when a page arrives or the earliest deadline passes
+            now = time.monotonic()
+            deadlines = [started[calendar_id] + timeout
+                         for calendar_id in remaining if calendar_id in started]
+            wait_for = min(deadlines) - now if deadlines else timeout
             
-            # Add a flag to indicate this is a multi-day event
-            event_copy["isMultiDay"] = (start_date.date() != end_date)
-            
-            events_by_date[event_date].append(event_copy)
+            try:
+                calendar_id, events, error = pages.get(timeout=max(wait_for, 0.01))
+            except queue.Empty:
+                pass
+            else:
+                if calendar_id in remaining:
+                    if events is not None:
+                        yield calendar_id, events
+                    else:
+                        # A worker posts no events once it is finished
+                        remaining.discard(calendar_id)
+                        submit_next()
+                        if error is not None:
+                            errors[calendar_id] = str(error) or type(error).__name__
+                        elif report_finished:
+                            yield calendar_id, None
             
-            # Move to the next day
-            current_date += timedelta(days=1)
-    
-    return events_by_date
+            now = time.monotonic()
+            for calendar_id in list(remaining):
+                if calendar_id in started and now - started[calendar_id] >= timeout:
+                    remaining.discard(calendar_id)
+                    abandoned.add(calendar_id)
+                    errors[calendar_id] = f"Timed out after {timeout} seconds"
+                    submit_next()
+    finally:
+        # Do not block on fetches that timed out or were not consumed
+        abandoned.update(remaining)
+        for future in futures:
+            future.cancel()
 
-def update_event_note(credentials, calendar_id, event_id, note):
+def update_event_note(credentials, calendar_id, event_id, note, etag=None, description=None):
     """
     Update the note section of an event's description.
     
+    When the caller knows the event's ETag and current description (from
+    the /api/events payload or the server cache), a single PATCH carrying
+    only the description is sent with If-Match. If the event changed in the
+    meantime (412), the latest version is fetched, the note is merged into
+    it and the write is retried.
+    
     Args:
         credentials: Google OAuth credentials
         calendar_id: ID of the calendar containing the event
         event_id: ID of the event to update
         note: New note content
+        etag: Optional ETag of the version the note was written against
+        description: Optional current description matching etag
         
     Returns:
-        Boolean indicating success
+        The updated event (id, etag and description), or None on failure
     """
-    service = build("calendar", "v3", credentials=credentials)
+    service = get_calendar_service(credentials)
     
     try:
-        # Get the current event
-        event = service.events().get(
-            calendarId=calendar_id,
-            eventId=event_id
-        ).execute()
-        
-        # Update the description with the new note
-        description = event.get("description", "")
-        
-        # Check if there's already a note section
-        note_pattern = r"(<!-- BIGASSCALENDAR_NOTE_START -->.*<!-- BIGASSCALENDAR_NOTE_END -->)"
-        note_section = f"<!-- BIGASSCALENDAR_NOTE_START -->{note}<!-- BIGASSCALENDAR_NOTE_END -->"
-        
-        if re.search(note_pattern, description, re.DOTALL):
-            # Replace existing note
-            updated_description = re.sub(note_pattern, note_section, description, flags=re.DOTALL)
-        else:
-            # Add new note at the end
-            if description:
-                updated_description = description + "\n\n" + note_section
+        for attempt in range(MAX_NOTE_WRITE_ATTEMPTS):
+            if etag is None or description is None:
+                # Get the current event
+                event = execute_request(service.events().get(
+                    calendarId=calendar_id,
+                    eventId=event_id,
+                    fields=NOTE_WRITE_FIELDS
+                ), "events.get")
+                etag = event["etag"]
+                description = event.get("description", "")
+            
+            # Update only the description, and only if nobody changed it
+            request = service.events().patch(
+                calendarId=calendar_id,
+                eventId=event_id,
+                body={"description": inject_note(description, note)},
+                fields=NOTE_WRITE_FIELDS
+            )
+            request.headers["If-Match"] = etag
+            
+            try:
+                return execute_request(request, "events.patch")
+            except HttpError as e:
+                if e.resp.status != 412:
+                    raise
+                
+                # Someone else changed the event; merge into the latest version
+                etag = description = None
+        
+        logger.error(f"Error updating event note: {event_id} kept changing, giving up")
+        return None
+        
+    except Exception as e:
+        logger.error(f"Error updating event note: {e}")
+        return None
+
+def update_event_notes(credentials, updates):
+    """
+    Update the notes of many events with a few batched HTTP round trips.
+    
+    Updates that come with an ETag and the matching description are written
+    right away; the others first have their description and ETag read with
+    batched GETs. Writes are batched PATCH requests that send only the
+    description with the ETag in If-Match. Events that changed in the
+    meantime (412) are re-read and retried; an event that keeps changing is
+    reported as a conflict instead of being overwritten.
+    
+    Args:
+        credentials: Google OAuth credentials
+        updates: List of dicts with calendar_id, event_id and note, and
+                 optionally etag and description
+        
+    Returns:
+        List of per-item results in the order of updates, each with
+        calendar_id, event_id and success, plus etag and description on
+        success or error and status on failure
+    """
+    service = get_calendar_service(credentials)
+    results = [
+        {"calendar_id": update["calendar_id"], "event_id": update["event_id"], "success": False}
+        for update in updates
+    ]
+    
+    known = {
+        index: (update["etag"], update["description"])
+        for index, update in enumerate(updates)
+        if update.get("etag") is not None and update.get("description") is not None
+    }
+    pending = list(range(len(updates)))
+    
+    for attempt in range(MAX_NOTE_WRITE_ATTEMPTS):
+        # Read the current descriptions we do not know yet
+        missing = [index for index in pending if index not in known]
+        fetched = _execute_batched(service, [
+            service.events().get(
+                calendarId=updates[index]["calendar_id"],
+                eventId=updates[index]["event_id"],
+                fields=NOTE_WRITE_FIELDS
+            )
+            for index in missing
+        ])
+        
+        for index, (event, error) in zip(missing, fetched):
+            if error is not None:
+                results[index].update(_batch_error(error))
             else:
-                updated_description = note_section
+                known[index] = (event["etag"], event.get("description", ""))
         
-        # Update the event
-        event["description"] = updated_description
+        pending = [index for index in pending if index in known]
         
-        service.events().update(
-            calendarId=calendar_id,
-            eventId=event_id,
-            body=event
-        ).execute()
+        # Write only the descriptions back
+        writes = []
+        for index in pending:
+            etag, description = known[index]
+            request = service.events().patch(
+                calendarId=updates[index]["calendar_id"],
+                eventId=updates[index]["event_id"],
+                body={"description": inject_note(description, updates[index]["note"])},
+                fields=NOTE_WRITE_FIELDS
+            )
+            request.headers["If-Match"] = etag
+            writes.append(request)
         
-        return True
+        conflicts = []
+        for index, (event, error) in zip(pending, _execute_batched(service, writes)):
+            if error is None:
+                results[index].update(
+                    success=True, etag=event.get("etag"), description=event.get("description")
+                )
+            elif isinstance(error, HttpError) and error.resp.status == 412:
+                # Changed by someone else; re-read and merge on the next round
+                known.pop(index)
+                conflicts.append(index)
+                results[index].update(_batch_error(error))
+            else:
+                results[index].update(_batch_error(error))
         
-    except Exception as e:
-        print(f"Error updating event note: {e}")
-        return False
+        pending = conflicts
+        if not pending:
+            break
+    
+    return results
 
-def extract_note_from_description(description):
+def execute_request(request, method):
     """
-    Extract the note section from an event description.
+    Execute a Calendar API request through the scheduler (see
+    GoogleScheduler), recording the latency and status of every attempt.
     
     Args:
-        description: Event description text
+        request: HttpRequest or BatchHttpRequest
+        method: API method name for the metrics, e.g. "events.list"
         
     Returns:
-        Note text if found, otherwise None
+        The response of request.execute()
     """
-    if not description:
-        return None
+    def attempt():
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = request.execute()
+            status = 200
+            return response
+        except HttpError as e:
+            status = e.resp.status
+            raise
+        finally:
+            record_google_call(method, status, time.perf_counter() - started)
     
-    note_pattern = r"<!-- BIGASSCALENDAR_NOTE_START -->(.*?)<!-- BIGASSCALENDAR_NOTE_END -->"
-    match = re.search(note_pattern, description, re.DOTALL)
+    return get_scheduler().run(attempt)
+
+def _execute_batched(service, requests):
+    # Returns (response, exception) per request, in order
+    responses = [None] * len(requests)
+    
+    def callback(request_id, response, exception):
+        responses[int(request_id)] = (response, exception)
     
-    if match:
-        return match.group(1)
+    for offset in range(0, len(requests), BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=callback)
+        for index in range(offset, min(offset + BATCH_SIZE, len(requests))):
+            batch.add(requests[index], request_id=str(index))
+        execute_request(batch, "batch")
     
-    return None
\ No newline at end of file
+    return responses
+
+def _batch_error(error):
+    status = error.resp.status if isinstance(error, HttpError) else None
+    if status == 412:
+        message = "Event was modified by someone else"
+    else:
+        message = str(error) or type(error).__name__
+    return {"success": False, "error": message, "status": status}
+
+# Kept for callers of the original helpers
+inject_note_into_description = inject_note
+extract_note_from_description = extract_note
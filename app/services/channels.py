@@ -0,0 +1,460 @@
+from app.services.google_client import get_calendar_service
+from app.services.calendar_service import (
+    execute_request, iter_synced_events, year_bounds, DEFAULT_PAGE_SIZE, DEFAULT_EVENT_FIELDS
+)
+from app.services.event_cache import calendar_cache_key
+from app.services.scheduler import acting_for
+from app.metrics import REGISTRY
+from concurrent.futures import ThreadPoolExecutor
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Seconds a channel is asked to stay open (Google caps it, at about a week
+# for events.watch)
+DEFAULT_CHANNEL_TTL = 7 * 24 * 60 * 60
+
+# Seconds before a channel expires at which it is reopened
+DEFAULT_RENEW_MARGIN = 60 * 60
+
+# Seconds a watched calendar is served from the cache without asking Google;
+# only a safety net for lost notifications
+DEFAULT_PUSH_SYNC_INTERVAL = 60 * 60
+
+# Channels one process keeps open
+DEFAULT_MAX_CHANNELS = 1000
+
+# Threads opening channels and resyncing notified calendars
+DEFAULT_CHANNEL_WORKERS = 2
+
+# Seconds between checks for channels to renew
+RENEW_CHECK_INTERVAL = 60
+
+# Longest channel token Google accepts
+MAX_TOKEN_LENGTH = 256
+
+PUSH_NOTIFICATIONS = REGISTRY.counter(
+    "push_notifications", "Calendar push notifications received, by resource state.", ("state",)
+)
+
+def channel_token(secret, owner_key, calendar_id):
+    """
+    Sign the cache owner and calendar of a channel into its token.
+
+    Google sends the token back with every notification, so any worker
+    process can tell which cached calendar changed, including workers
+    that did not open the channel.
+
+    Args:
+        secret: Signing key (the app's secret key)
+        owner_key: User key (or shared user key) the calendar is cached under
+        calendar_id: ID of the watched calendar
+
+    Returns:
+        Token string, or None if it would be longer than Google allows
+    """
+    payload = base64.urlsafe_b64encode(json.dumps([owner_key, calendar_id]).encode("utf-8"))
+    payload = payload.decode("ascii").rstrip("=")
+    token = f"{payload}.{_signature(secret, payload)}"
+    return token if len(token) <= MAX_TOKEN_LENGTH else None
+
+def read_channel_token(secret, token):
+    """
+    Check a channel token and read the calendar it names.
+
+    Args:
+        secret: Signing key the token was made with
+        token: Value of the X-Goog-Channel-Token header
+
+    Returns:
+        Tuple of (owner_key, calendar_id), or None if the token was not
+        issued by us
+    """
+    payload, _, signature = (token or "").partition(".")
+    if not payload or not hmac.compare_digest(signature, _signature(secret, payload)):
+        return None
+
+    try:
+        owner_key, calendar_id = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    except (TypeError, ValueError):
+        return None
+    return owner_key, calendar_id
+
+def _signature(secret, payload):
+    digest = hmac.new(secret.encode("utf-8"), payload.encode("ascii"), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:16]).decode("ascii").rstrip("=")
+
+class ChannelManager:
+    """
+    Keeps Calendar API push channels (events.watch) open for the calendars
+    users are served from the event cache, so a change reaches the cache
+    without polling Google.
+
+    A channel is opened per cached calendar, under the key its years are
+    cached under, so readers of a shared calendar share one channel. When
+    Google reports a change, every cached year of that calendar is marked
+    due for a sync. The process holding the channel then resyncs those
+    years in the background with an incremental sync. Watched calendars
+    are served from the cache for sync_interval instead of the normal
+    cache sync interval. Channels are reopened shortly before they expire
+    while the calendar is still cached, and are closed once it is not or
+    once the user whose credentials keep them open logs out.
+
+    Channels live in the process that opened them. With several worker
+    processes, use the sqlite cache: any worker marks the notified years
+    stale, and a calendar may end up with one channel per worker.
+
+    Args:
+        cache: EventCache holding the watched calendars
+        address: Public HTTPS URL of the /api/notifications webhook
+        secret: Key signing the channel tokens
+        ttl: Seconds each channel is asked to stay open
+        renew_margin: Seconds before expiry at which channels are reopened
+        sync_interval: Seconds a watched calendar is served without asking
+                       Google for changes
+        max_channels: Maximum number of open channels
+        max_workers: Threads opening channels and resyncing calendars
+    """
+
+    def __init__(self, cache, address, secret, ttl=DEFAULT_CHANNEL_TTL,
+                 renew_margin=DEFAULT_RENEW_MARGIN, sync_interval=DEFAULT_PUSH_SYNC_INTERVAL,
+                 max_channels=DEFAULT_MAX_CHANNELS, max_workers=DEFAULT_CHANNEL_WORKERS):
+        self.cache = cache
+        self.address = address
+        self.secret = secret
+        self.ttl = ttl
+        self.renew_margin = renew_margin
+        self.sync_interval = sync_interval
+        self.max_channels = max_channels
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers),
+                                            thread_name_prefix="push-channels")
+        # owner_key -> calendar_id -> channel
+        self._channels = {}
+        # (owner_key, calendar_id) -> user key of the opener
+        self._opening = {}
+        # Channels being opened for users who logged out meanwhile
+        self._dropped = set()
+        # (owner_key, calendar_id) -> True if notified again while resyncing
+        self._resyncs = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._renewer = None
+
+    def watch(self, credentials, calendar_ids, options):
+        """
+        Open channels in the background for calendars just served to a
+        user that are not watched yet.
+
+        Args:
+            credentials: Google OAuth credentials of the user
+            calendar_ids: Calendars that were served
+            options: Fetch and cache options used for the request
+        """
+        if self._stopped.is_set():
+            return
+
+        for calendar_id in dict.fromkeys(calendar_ids):
+            owner_key = calendar_cache_key(options["user_key"], calendar_id, 0, options.get("shared"))[0]
+            target = (owner_key, calendar_id)
+
+            with self._lock:
+                if (calendar_id in self._channels.get(owner_key, {}) or target in self._opening
+                        or self._count() + len(self._opening) >= self.max_channels):
+                    continue
+                self._opening[target] = options["user_key"]
+
+            self._submit(self._open, credentials, target, options)
+
+        self._start_renewer()
+
+    def sync_intervals(self, user_key, shared=None):
+        """
+        Return the sync interval of each calendar a user is served that is
+        watched through an open channel.
+
+        Args:
+            user_key: Key identifying the user
+            shared: Optional dict mapping calendar ID to its shared user key
+
+        Returns:
+            Dict mapping calendar ID to seconds it is served from the cache
+        """
+        now = time.time()
+        shared = shared or {}
+        intervals = {}
+
+        with self._lock:
+            for calendar_id, channel in self._channels.get(user_key, {}).items():
+                if calendar_id not in shared and channel["expiration"] > now:
+                    intervals[calendar_id] = self.sync_interval
+            for calendar_id, owner_key in shared.items():
+                channel = self._channels.get(owner_key, {}).get(calendar_id)
+                if channel is not None and channel["expiration"] > now:
+                    intervals[calendar_id] = self.sync_interval
+
+        return intervals
+
+    def notify(self, token, state):
+        """
+        Handle a push notification from Google.
+
+        Args:
+            token: Value of the X-Goog-Channel-Token header
+            state: Value of the X-Goog-Resource-State header
+
+        Returns:
+            False if the token was not issued by us, otherwise True
+        """
+        target = read_channel_token(self.secret, token)
+        if target is None:
+            return False
+
+        PUSH_NOTIFICATIONS.inc(state=state or "unknown")
+        if state == "sync":
+            # Sent once when a channel opens; nothing changed
+            return True
+
+        self.cache.expire(*target)
+        self._queue_resync(target)
+        return True
+
+    def channels(self):
+        """Return the open channels"""
+        with self._lock:
+            return [dict(channel) for owned in self._channels.values() for channel in owned.values()]
+
+    def renew_expiring(self):
+        """Reopen channels about to expire and close those whose calendar left the cache"""
+        now = time.time()
+        with self._lock:
+            due = []
+            for owned in self._channels.values():
+                for channel in owned.values():
+                    if channel["expiration"] - now < self.renew_margin and not channel.get("renewing"):
+                        channel["renewing"] = True
+                        due.append(channel)
+
+        for channel in due:
+            self._submit(self._renew, channel)
+
+    def forget(self, user_key):
+        """
+        Close the channels kept open with a user's credentials, for
+        instance when they log out. Their calendars are polled again until
+        another reader opens a channel.
+
+        Args:
+            user_key: Key identifying the user
+        """
+        with self._lock:
+            dropped = []
+            for owner_key, owned in list(self._channels.items()):
+                for calendar_id, channel in list(owned.items()):
+                    if channel["options"]["user_key"] == user_key:
+                        dropped.append(owned.pop(calendar_id))
+                if not owned:
+                    del self._channels[owner_key]
+            self._dropped.update(target for target, opener in self._opening.items() if opener == user_key)
+
+        for channel in dropped:
+            self._submit(self._close, channel)
+
+    def shutdown(self):
+        """Cancel queued work and stop the renewal thread; open channels expire on their own"""
+        self._stopped.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _open(self, credentials, target, options):
+        owner_key, calendar_id = target
+        try:
+            with acting_for(options["user_key"]):
+                channel = self._request_channel(get_calendar_service(credentials), target)
+            if channel is None:
+                return
+            channel.update(credentials=credentials, options=options)
+
+            with self._lock:
+                dropped = target in self._dropped
+                if not dropped:
+                    self._channels.setdefault(owner_key, {})[calendar_id] = channel
+            if dropped:
+                # The user logged out while the channel was being opened
+                self._close(channel)
+                return
+        except Exception as e:
+            logger.warning(f"Opening a push channel for {calendar_id} failed: {e}")
+            return
+        finally:
+            with self._lock:
+                self._opening.pop(target, None)
+                self._dropped.discard(target)
+
+        # Pick up changes made between the load and the channel opening
+        self._queue_resync(target)
+
+    def _request_channel(self, service, target):
+        owner_key, calendar_id = target
+        token = channel_token(self.secret, owner_key, calendar_id)
+        if token is None:
+            logger.info(f"Calendar ID {calendar_id} is too long for a push channel; it is polled")
+            return None
+
+        body = {
+            "id": str(uuid.uuid4()),
+            "type": "web_hook",
+            "address": self.address,
+            "token": token,
+            "params": {"ttl": str(int(self.ttl))}
+        }
+        response = execute_request(service.events().watch(calendarId=calendar_id, body=body), "events.watch")
+
+        # Google reports the expiration in milliseconds since the epoch
+        expiration = response.get("expiration")
+        return {
+            "id": body["id"],
+            "resource_id": response.get("resourceId"),
+            "owner_key": owner_key,
+            "calendar_id": calendar_id,
+            "expiration": int(expiration) / 1000 if expiration else time.time() + self.ttl
+        }
+
+    def _renew(self, channel):
+        target = (channel["owner_key"], channel["calendar_id"])
+        cached = bool(self.cache.keys(*target))
+        renewed = None
+        try:
+            with acting_for(channel["options"]["user_key"]):
+                service = get_calendar_service(channel["credentials"])
+                if cached:
+                    renewed = self._request_channel(service, target)
+                if renewed is not None or not cached:
+                    self._stop_channel(service, channel)
+        except Exception as e:
+            logger.warning(f"Renewing the push channel of {target[1]} failed: {e}")
+
+        if renewed is not None:
+            renewed.update(credentials=channel["credentials"], options=channel["options"])
+
+        leftover = None
+        with self._lock:
+            owned = self._channels.get(target[0], {})
+            if owned.get(target[1]) is not channel:
+                # The user logged out meanwhile; do not leave the new channel open
+                leftover = renewed
+            elif renewed is not None:
+                owned[target[1]] = renewed
+            elif not cached or channel["expiration"] <= time.time():
+                del owned[target[1]]
+                if not owned:
+                    del self._channels[target[0]]
+            else:
+                # Try again on the next check while the channel is still open
+                channel["renewing"] = False
+
+        if leftover is not None:
+            self._close(leftover)
+
+    def _close(self, channel):
+        with acting_for(channel["options"]["user_key"]):
+            self._stop_channel(get_calendar_service(channel["credentials"]), channel)
+
+    def _submit(self, *args):
+        try:
+            self._executor.submit(*args)
+        except RuntimeError:
+            # Shut down; channels left open expire on their own
+            pass
+
+    def _stop_channel(self, service, channel):
+        try:
+            execute_request(
+                service.channels().stop(body={"id": channel["id"], "resourceId": channel["resource_id"]}),
+                "channels.stop"
+            )
+        except Exception as e:
+            # The channel expires on its own
+            logger.info(f"Stopping push channel {channel['id']} failed: {e}")
+
+    def _queue_resync(self, target):
+        with self._lock:
+            channel = self._channels.get(target[0], {}).get(target[1])
+            if channel is None or self._stopped.is_set():
+                return
+            if target in self._resyncs:
+                self._resyncs[target] = True
+                return
+            self._resyncs[target] = False
+
+        self._submit(self._resync, channel)
+
+    def _resync(self, channel):
+        target = (channel["owner_key"], channel["calendar_id"])
+        options = channel["options"]
+
+        while True:
+            try:
+                with acting_for(options["user_key"]):
+                    service = get_calendar_service(channel["credentials"])
+                    for key in self.cache.keys(*target):
+                        for _ in iter_synced_events(
+                            service, self.cache, key, *year_bounds(key[2]),
+                            page_size=options.get("page_size", DEFAULT_PAGE_SIZE),
+                            fields=options.get("fields", DEFAULT_EVENT_FIELDS)
+                        ):
+                            pass
+            except Exception as e:
+                logger.warning(f"Resync of {target[1]} after a push notification failed: {e}")
+
+            with self._lock:
+                # Sync once more if Google reported another change meanwhile
+                if not self._resyncs.get(target):
+                    self._resyncs.pop(target, None)
+                    return
+                self._resyncs[target] = False
+
+    def _start_renewer(self):
+        with self._lock:
+            if self._renewer is not None:
+                return
+            self._renewer = threading.Thread(target=self._renew_loop, name="push-renew", daemon=True)
+        self._renewer.start()
+
+    def _renew_loop(self):
+        while not self._stopped.wait(RENEW_CHECK_INTERVAL):
+            self.renew_expiring()
+
+    def _count(self):
+        # Lock must be held
+        return sum(len(owned) for owned in self._channels.values())
+
+def create_channel_manager(push_config, cache, secret):
+    """
+    Create the push channel manager described by the `push` config section.
+
+    Args:
+        push_config: Dict with `enabled`, `address` and the ChannelManager settings
+        cache: EventCache instance or None
+        secret: Key signing the channel tokens
+
+    Returns:
+        ChannelManager instance, or None if push notifications are disabled,
+        have no webhook address or there is no event cache to keep fresh
+    """
+    if not push_config.get("enabled", False) or not push_config.get("address") or cache is None:
+        return None
+
+    return ChannelManager(
+        cache, push_config["address"], secret,
+        ttl=push_config.get("ttl", DEFAULT_CHANNEL_TTL),
+        renew_margin=push_config.get("renew_margin", DEFAULT_RENEW_MARGIN),
+        sync_interval=push_config.get("sync_interval", DEFAULT_PUSH_SYNC_INTERVAL),
+        max_channels=push_config.get("max_channels", DEFAULT_MAX_CHANNELS),
+        max_workers=push_config.get("max_workers", DEFAULT_CHANNEL_WORKERS)
+    )
@@ -0,0 +1,434 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import google.auth.jwt
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+# Seconds an unused cache entry is kept before it is dropped
+DEFAULT_CACHE_TTL = 24 * 60 * 60
+
+# Seconds an unused calendar list is kept before it is dropped
+DEFAULT_CALENDAR_LIST_TTL = 24 * 60 * 60
+
+# Seconds a synced entry is served as-is before Google is asked for changes
+DEFAULT_SYNC_INTERVAL = 30
+
+# Years of calendars shared between users are cached under this prefix and
+# the access role they were read with instead of a user key
+SHARED_USER_PREFIX = "shared:"
+
+def user_cache_key(session_id, credentials=None):
+    """
+    Derive a stable, non-reversible cache key for a logged-in user.
+
+    When Google issued an ID token, its subject identifies the account
+    across logins; otherwise the key follows the server-side session ID,
+    which lasts as long as the login. Access tokens change with every
+    refresh and are never used, so a refresh does not orphan the cache.
+
+    Args:
+        session_id: Session ID handed out by CredentialManager.login
+        credentials: Optional Google OAuth credentials of the session
+
+    Returns:
+        Hex string identifying the user
+    """
+    subject = _id_token_subject(credentials)
+    identity = f"sub:{credentials.client_id}:{subject}" if subject else f"sid:{session_id}"
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()[:32]
+
+def _id_token_subject(credentials):
+    id_token = getattr(credentials, "id_token", None)
+    if not id_token:
+        return None
+    try:
+        # Received from Google's token endpoint; read, not verified
+        return google.auth.jwt.decode(id_token, verify=False).get("sub")
+    except ValueError:
+        return None
+
+def calendar_cache_key(user_key, calendar_id, year, shared=None):
+    """
+    Build the cache key of a calendar year as seen by a user.
+
+    Args:
+        user_key: Key identifying the user
+        calendar_id: ID of the calendar
+        year: The year (integer)
+        shared: Optional dict mapping calendar ID to the shared user key
+                its years are cached under (see shared_calendars)
+
+    Returns:
+        Tuple of (user_key, calendar_id, year), with the shared user key
+        for shared calendars
+    """
+    owner = shared.get(calendar_id) if shared else None
+    return (owner or user_key, calendar_id, year)
+
+def is_shared_key(key):
+    """Check whether a cache key belongs to the shared tier"""
+    return isinstance(key[0], str) and key[0].startswith(SHARED_USER_PREFIX)
+
+class EventCache(ABC):
+    """
+    Base class for event cache backends.
+
+    Entries are keyed by (user_key, calendar_id, year) and hold a dict with
+    the calendar's events by ID, Google's sync token and the time of the
+    last sync:
+
+        {"events": {event_id: event}, "sync_token": "...", "synced_at": 0.0}
+
+    Each user's calendar list is kept apart from the event years, keyed by
+    the user key alone and with its own TTL:
+
+        {"calendars": {calendar_id: calendar}, "sync_token": "...", "synced_at": 0.0}
+    """
+
+    @abstractmethod
+    def get(self, key):
+        """Return the entry of a calendar year, or None"""
+
+    @abstractmethod
+    def set(self, key, entry):
+        """Store the entry of a calendar year"""
+
+    @abstractmethod
+    def delete(self, key):
+        """Drop the entry of a calendar year if it is cached"""
+
+    @abstractmethod
+    def invalidate(self, user_key, calendar_id=None):
+        """Drop every cached year of a user's calendar (or of all their calendars and their calendar list)"""
+
+    @abstractmethod
+    def get_calendar_list(self, user_key):
+        """Return a user's cached calendar list entry, or None"""
+
+    @abstractmethod
+    def set_calendar_list(self, user_key, entry):
+        """Store a user's calendar list entry"""
+
+    @abstractmethod
+    def clear(self):
+        """Drop every entry"""
+
+    @abstractmethod
+    def keys(self, user_key, calendar_id):
+        """Return the keys of every cached year of a user's calendar"""
+
+    def find_event(self, user_key, calendar_id, event_id):
+        """
+        Look up an event in any cached year of a user's calendar.
+
+        Args:
+            user_key: Key identifying the user
+            calendar_id: ID of the calendar containing the event
+            event_id: ID of the event
+
+        Returns:
+            The cached event, or None if it is not cached
+        """
+        for key in self.keys(user_key, calendar_id):
+            entry = self.get(key)
+            if entry is not None and event_id in entry["events"]:
+                return entry["events"][event_id]
+        return None
+
+    def update_event(self, user_key, calendar_id, event_id, changes):
+        """
+        Apply changes we made ourselves to every cached copy of an event,
+        so the next load does not have to wait for Google to report them.
+
+        Args:
+            user_key: Key identifying the user
+            calendar_id: ID of the calendar containing the event
+            event_id: ID of the event
+            changes: Dict of event fields to overwrite
+        """
+        for key in self.keys(user_key, calendar_id):
+            entry = self.get(key)
+            if entry is None or event_id not in entry["events"]:
+                continue
+
+            events = dict(entry["events"])
+            events[event_id] = dict(events[event_id], **changes)
+            self.set(key, dict(entry, events=events))
+
+    def expire(self, user_key, calendar_id):
+        """
+        Mark every cached year of a calendar as due for a sync, keeping its
+        events and sync token so the next load only fetches the changes.
+
+        Args:
+            user_key: Key identifying the user (or the shared user key)
+            calendar_id: ID of the calendar
+
+        Returns:
+            Cache keys of the expired years
+        """
+        expired = []
+        for key in self.keys(user_key, calendar_id):
+            entry = self.get(key)
+            if entry is not None:
+                self.set(key, dict(entry, synced_at=0))
+                expired.append(key)
+        return expired
+
+class MemoryEventCache(EventCache):
+    """
+    In-process LRU cache with a TTL and a bound on the total number of
+    cached events.
+
+    Args:
+        max_entries: Maximum number of (user, calendar, year) entries, and
+                     of cached calendar lists
+        max_events: Maximum number of events across all entries
+        ttl: Seconds an entry is kept after it was last stored
+        calendar_list_ttl: Seconds a calendar list is kept after it was last stored
+    """
+
+    def __init__(self, max_entries=1024, max_events=500000, ttl=DEFAULT_CACHE_TTL,
+                 calendar_list_ttl=DEFAULT_CALENDAR_LIST_TTL):
+        self.max_entries = max_entries
+        self.max_events = max_events
+        self.ttl = ttl
+        self.calendar_list_ttl = calendar_list_ttl
+        self._entries = OrderedDict()
+        self._calendar_lists = OrderedDict()
+        self._event_count = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+
+            stored_at, entry = item
+            if time.time() - stored_at > self.ttl:
+                self._remove(key)
+                return None
+
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (time.time(), entry)
+            self._event_count += len(entry["events"])
+
+            # Evict least recently used entries, but always keep the newest
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or self._event_count > self.max_events
+            ):
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def invalidate(self, user_key, calendar_id=None):
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == user_key and calendar_id in (None, key[1]):
+                    self._remove(key)
+            if calendar_id is None:
+                self._calendar_lists.pop(user_key, None)
+
+    def get_calendar_list(self, user_key):
+        with self._lock:
+            item = self._calendar_lists.get(user_key)
+            if item is None:
+                return None
+
+            stored_at, entry = item
+            if time.time() - stored_at > self.calendar_list_ttl:
+                del self._calendar_lists[user_key]
+                return None
+
+            self._calendar_lists.move_to_end(user_key)
+            return entry
+
+    def set_calendar_list(self, user_key, entry):
+        with self._lock:
+            self._calendar_lists.pop(user_key, None)
+            self._calendar_lists[user_key] = (time.time(), entry)
+            while len(self._calendar_lists) > self.max_entries:
+                self._calendar_lists.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._calendar_lists.clear()
+            self._event_count = 0
+
+    def keys(self, user_key, calendar_id):
+        with self._lock:
+            return [key for key in self._entries if key[:2] == (user_key, calendar_id)]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        _, entry = self._entries.pop(key)
+        self._event_count -= len(entry["events"])
+
+class SQLiteEventCache(EventCache):
+    """
+    On-disk cache backed by SQLite, shared by every worker process that
+    points at the same file.
+
+    Args:
+        path: Path of the SQLite database file
+        ttl: Seconds an entry is kept after it was last stored
+        calendar_list_ttl: Seconds a calendar list is kept after it was last stored
+    """
+
+    def __init__(self, path, ttl=DEFAULT_CACHE_TTL, calendar_list_ttl=DEFAULT_CALENDAR_LIST_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.calendar_list_ttl = calendar_list_ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS event_cache ("
+            " user_key TEXT NOT NULL,"
+            " calendar_id TEXT NOT NULL,"
+            " year INTEGER NOT NULL,"
+            " entry TEXT NOT NULL,"
+            " stored_at REAL NOT NULL,"
+            " PRIMARY KEY (user_key, calendar_id, year))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS calendar_lists ("
+            " user_key TEXT PRIMARY KEY,"
+            " entry TEXT NOT NULL,"
+            " stored_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT entry, stored_at FROM event_cache"
+                " WHERE user_key = ? AND calendar_id = ? AND year = ?",
+                key
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        if time.time() - row[1] > self.ttl:
+            self.delete(key)
+            return None
+
+        return json.loads(row[0])
+
+    def set(self, key, entry):
+        with self._lock:
+            now = time.time()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO event_cache VALUES (?, ?, ?, ?, ?)",
+                (*key, json.dumps(entry), now)
+            )
+            self._conn.execute("DELETE FROM event_cache WHERE stored_at < ?", (now - self.ttl,))
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM event_cache WHERE user_key = ? AND calendar_id = ? AND year = ?",
+                key
+            )
+            self._conn.commit()
+
+    def invalidate(self, user_key, calendar_id=None):
+        with self._lock:
+            if calendar_id is None:
+                self._conn.execute("DELETE FROM event_cache WHERE user_key = ?", (user_key,))
+                self._conn.execute("DELETE FROM calendar_lists WHERE user_key = ?", (user_key,))
+            else:
+                self._conn.execute(
+                    "DELETE FROM event_cache WHERE user_key = ? AND calendar_id = ?",
+                    (user_key, calendar_id)
+                )
+            self._conn.commit()
+
+    def get_calendar_list(self, user_key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT entry, stored_at FROM calendar_lists WHERE user_key = ?", (user_key,)
+            ).fetchone()
+
+        if row is None or time.time() - row[1] > self.calendar_list_ttl:
+            return None
+
+        return json.loads(row[0])
+
+    def set_calendar_list(self, user_key, entry):
+        with self._lock:
+            now = time.time()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO calendar_lists VALUES (?, ?, ?)",
+                (user_key, json.dumps(entry), now)
+            )
+            self._conn.execute(
+                "DELETE FROM calendar_lists WHERE stored_at < ?", (now - self.calendar_list_ttl,)
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM event_cache")
+            self._conn.execute("DELETE FROM calendar_lists")
+            self._conn.commit()
+
+    def keys(self, user_key, calendar_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT year FROM event_cache WHERE user_key = ? AND calendar_id = ?",
+                (user_key, calendar_id)
+            ).fetchall()
+        return [(user_key, calendar_id, row[0]) for row in rows]
+
+def create_event_cache(cache_config):
+    """
+    Create the event cache backend described by the `cache` config section.
+
+    Args:
+        cache_config: Dict with `backend` ("memory", "sqlite" or "none") and
+                      backend specific settings
+
+    Returns:
+        EventCache instance, or None if caching is disabled
+    """
+    backend = cache_config.get("backend", "memory")
+    ttl = cache_config.get("ttl", DEFAULT_CACHE_TTL)
+    calendar_list_ttl = cache_config.get("calendar_list_ttl", DEFAULT_CALENDAR_LIST_TTL)
+
+    if backend == "memory":
+        return MemoryEventCache(
+            max_entries=cache_config.get("max_entries", 1024),
+            max_events=cache_config.get("max_events", 500000),
+            ttl=ttl,
+            calendar_list_ttl=calendar_list_ttl
+        )
+
+    if backend == "sqlite":
+        return SQLiteEventCache(
+            cache_config.get("path", "event_cache.sqlite3"), ttl=ttl, calendar_list_ttl=calendar_list_ttl
+        )
+
+    if backend in ("none", None):
+        return None
+
+    raise ValueError(f"Unknown cache backend: {backend}")
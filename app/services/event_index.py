@@ -0,0 +1,126 @@
+from collections import OrderedDict
+from datetime import date
+from app.services.bucketing import day_spans
+import bisect
+import threading
+
+# Day 0 of the spans stored in an index
+INDEX_ORIGIN = date(1970, 1, 1)
+
+# Events covering at least this many days are kept apart from the short
+# ones, so a window query only looks this far back for short events
+LONG_EVENT_DAYS = 7
+
+# Event indexes kept in memory (one per cached calendar year)
+DEFAULT_INDEX_ENTRIES = 1024
+
+class EventIndex:
+    """
+    Interval index over a set of events by the days they cover.
+
+    Events are kept in two lists sorted by first day: short events, whose
+    span is under LONG_EVENT_DAYS, and long ones. A window query bisects
+    both lists. Any short event overlapping the window starts at most
+    LONG_EVENT_DAYS before it, so only a bounded slice is checked. Long
+    events are rare, and their list is cut off at the end of the window.
+    A query costs O(log n + k) plus the few long events that started
+    before the window.
+
+    Args:
+        events: Iterable of events; they are referenced, not copied
+    """
+
+    def __init__(self, events):
+        events = list(events)
+        short = []
+        long = []
+
+        for event, span in zip(events, day_spans(events, INDEX_ORIGIN)):
+            if span is None:
+                continue  # Events with no date are never in a window
+            (long if span[1] - span[0] >= LONG_EVENT_DAYS else short).append((span[0], span[1], event))
+
+        short.sort(key=lambda item: item[0])
+        long.sort(key=lambda item: item[0])
+        self._short = short
+        self._short_starts = [item[0] for item in short]
+        self._long = long
+        self._long_starts = [item[0] for item in long]
+
+    def __len__(self):
+        return len(self._short) + len(self._long)
+
+    def overlapping(self, first_day, last_day):
+        """
+        Return the events covering any day of a window.
+
+        Args:
+            first_day: First day of the window (date)
+            last_day: Last day of the window, inclusive (date)
+
+        Returns:
+            List of events in first day order within each length class
+        """
+        first = (first_day - INDEX_ORIGIN).days
+        last = (last_day - INDEX_ORIGIN).days
+
+        low = bisect.bisect_left(self._short_starts, first - LONG_EVENT_DAYS + 1)
+        high = bisect.bisect_right(self._short_starts, last)
+        found = [event for _, end, event in self._short[low:high] if end >= first]
+
+        high = bisect.bisect_right(self._long_starts, last)
+        found.extend(event for _, end, event in self._long[:high] if end >= first)
+        return found
+
+class EventIndexCache:
+    """
+    In-process LRU of event indexes, one per event cache entry.
+
+    An index is reused while the cache keeps handing out the same events
+    dict for its key. A sync, a note write or an eviction stores a new
+    dict, and the index is rebuilt on the next query. The sqlite backend
+    returns a new dict on every read, so there the index only lasts for
+    one query.
+
+    Args:
+        max_entries: Maximum number of indexes kept
+    """
+
+    def __init__(self, max_entries=DEFAULT_INDEX_ENTRIES):
+        self.max_entries = max_entries
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, entry):
+        """
+        Return the index of a cache entry, building it if needed.
+
+        Args:
+            key: Event cache key of the entry
+            entry: The entry, as returned by the event cache
+
+        Returns:
+            EventIndex over the entry's events
+        """
+        events = entry["events"]
+        with self._lock:
+            item = self._indexes.get(key)
+            if item is not None and item[0] is events:
+                self._indexes.move_to_end(key)
+                return item[1]
+
+        index = EventIndex(events.values())
+
+        with self._lock:
+            self._indexes[key] = (events, index)
+            self._indexes.move_to_end(key)
+            while len(self._indexes) > self.max_entries:
+                self._indexes.popitem(last=False)
+        return index
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+    def __len__(self):
+        return len(self._indexes)
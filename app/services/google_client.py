@@ -0,0 +1,156 @@
+from collections import OrderedDict
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+import google_auth_httplib2
+import httplib2
+import json
+import threading
+import weakref
+
+# Discovery document fetched when the client library has no bundled copy
+DISCOVERY_URL = "https://www.googleapis.com/discovery/v1/apis/{api}/{version}/rest"
+
+# Seconds before an HTTP request to Google is abandoned
+DEFAULT_HTTP_TIMEOUT = 60
+
+# Services (each with its own keep-alive transport) a thread keeps, one per
+# login it recently worked for
+MAX_SERVICES_PER_THREAD = 16
+
+_discovery_documents = {}
+_discovery_lock = threading.Lock()
+_local = threading.local()
+
+def get_discovery_document(api="calendar", version="v3"):
+    """
+    Return the parsed discovery document for an API, loading it once per
+    process.
+
+    The document bundled with google-api-python-client is used, so no
+    discovery request is made at startup; it is only fetched from Google if
+    the library does not ship it.
+
+    Args:
+        api: API name
+        version: API version
+
+    Returns:
+        Discovery document as a dictionary
+    """
+    key = (api, version)
+    document = _discovery_documents.get(key)
+    if document is not None:
+        return document
+
+    with _discovery_lock:
+        if key not in _discovery_documents:
+            content = discovery_cache.get_static_doc(api, version)
+            if content is None:
+                _, content = httplib2.Http(timeout=DEFAULT_HTTP_TIMEOUT).request(
+                    DISCOVERY_URL.format(api=api, version=version)
+                )
+            document = json.loads(content)
+
+            # The client library fills in defaults on the document the first
+            # time methods are created; do that once before it is shared
+            # between threads
+            CalendarService(document, google_auth_httplib2.AuthorizedHttp(None, http=httplib2.Http())).warm_up()
+
+            _discovery_documents[key] = document
+
+    return _discovery_documents[key]
+
+class CalendarService:
+    """
+    Calendar API client whose resources are created once and reused.
+
+    Creating a discovery-based resource (`service.events()`) builds every
+    method and its docstring from the discovery document, which costs
+    milliseconds. This wrapper creates each resource once and exposes the
+    same interface as the service object returned by `build()`.
+
+    Args:
+        document: Parsed discovery document
+        http: Authorized HTTP transport the requests are sent through
+    """
+
+    RESOURCES = ("events", "calendarList", "calendars", "colors")
+
+    def __init__(self, document, http):
+        self.http = http
+        self._service = build_from_document(document, http=http)
+        self._resources = {}
+
+    def _resource(self, name):
+        resource = self._resources.get(name)
+        if resource is None:
+            resource = self._resources[name] = getattr(self._service, name)()
+        return resource
+
+    def events(self):
+        return self._resource("events")
+
+    def calendarList(self):
+        return self._resource("calendarList")
+
+    def calendars(self):
+        return self._resource("calendars")
+
+    def colors(self):
+        return self._resource("colors")
+
+    def new_batch_http_request(self, callback=None):
+        return self._service.new_batch_http_request(callback=callback)
+
+    def warm_up(self):
+        for name in self.RESOURCES:
+            self._resource(name)
+        return self
+
+def create_transport():
+    """Return a new keep-alive HTTP transport to Google"""
+    return httplib2.Http(timeout=DEFAULT_HTTP_TIMEOUT)
+
+def get_calendar_service(credentials):
+    """
+    Return a Calendar API service for the given credentials.
+
+    Services are pooled per thread and per credentials object: httplib2
+    connections are not thread-safe, and a service is only ever authorized
+    for the login it was created for. The credential manager hands out one
+    credentials object per login, and calendars are fetched on long-lived
+    threads (see get_fetch_executor), so later requests of the same user
+    reuse open connections and already-built resources. Refreshed tokens
+    are written back to the credentials object.
+
+    Args:
+        credentials: Google OAuth credentials
+
+    Returns:
+        CalendarService bound to the current thread and credentials
+    """
+    services = getattr(_local, "services", None)
+    if services is None:
+        services = _local.services = OrderedDict()
+
+    # Keyed by identity; the weak reference tells a reused id from the same object
+    key = id(credentials)
+    item = services.get(key)
+    if item is not None and item[0]() is credentials:
+        services.move_to_end(key)
+        return item[1]
+
+    http = google_auth_httplib2.AuthorizedHttp(credentials, http=create_transport())
+    service = CalendarService(get_discovery_document(), http)
+    services[key] = (_reference(credentials), service)
+    services.move_to_end(key)
+    while len(services) > MAX_SERVICES_PER_THREAD:
+        services.popitem(last=False)
+    return service
+
+def _reference(credentials):
+    try:
+        return weakref.ref(credentials)
+    except TypeError:
+        # Not weakly referenceable; keep it alive as long as its service
+        return lambda: credentials
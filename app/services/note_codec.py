@@ -0,0 +1,88 @@
+import re
+
+# Markers delimiting the note section stored in an event's description
+NOTE_START = "<!-- BIGASSCALENDAR_NOTE_START -->"
+NOTE_END = "<!-- BIGASSCALENDAR_NOTE_END -->"
+
+NOTE_PATTERN = re.compile(re.escape(NOTE_START) + "(.*?)" + re.escape(NOTE_END), re.DOTALL)
+
+def extract_note(description):
+    """
+    Extract the note section from an event description.
+
+    Descriptions without the start marker, which is nearly all of them, are
+    rejected with a substring check before any regex runs.
+
+    Args:
+        description: Event description text
+
+    Returns:
+        Note text if found, otherwise None
+    """
+    if not description:
+        return None
+
+    start = description.find(NOTE_START)
+    if start < 0:
+        return None
+
+    match = NOTE_PATTERN.search(description, start)
+    if match:
+        return match.group(1)
+
+    return None
+
+def extract_notes(descriptions):
+    """
+    Extract the notes from many event descriptions in one call.
+
+    Args:
+        descriptions: Iterable of description texts (None is allowed)
+
+    Returns:
+        List of note texts or None, in the order of descriptions
+    """
+    find = str.find
+    search = NOTE_PATTERN.search
+    notes = []
+
+    for description in descriptions:
+        if not description:
+            notes.append(None)
+            continue
+
+        start = find(description, NOTE_START)
+        match = search(description, start) if start >= 0 else None
+        notes.append(match.group(1) if match else None)
+
+    return notes
+
+def inject_note(description, note):
+    """
+    Replace the note section of an event description, or append one.
+
+    Everything from the first start marker to the last end marker is
+    replaced, so duplicated sections left behind by other clients collapse
+    into one.
+
+    Args:
+        description: Event description text
+        note: New note content
+
+    Returns:
+        Updated description text
+    """
+    description = description or ""
+    note_section = NOTE_START + note + NOTE_END
+
+    start = description.find(NOTE_START)
+    if start >= 0:
+        end = description.rfind(NOTE_END)
+        if end >= start + len(NOTE_START):
+            # Replace existing note
+            return description[:start] + note_section + description[end + len(NOTE_END):]
+
+    # Add new note at the end
+    if description:
+        return description + "\n\n" + note_section
+    return note_section
@@ -0,0 +1,233 @@
+from app.services.google_client import get_calendar_service
+from app.services.calendar_service import (
+    iter_synced_events, year_bounds, DEFAULT_PAGE_SIZE, DEFAULT_EVENT_FIELDS
+)
+from app.services.event_cache import calendar_cache_key, is_shared_key
+from app.services.scheduler import acting_for
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Threads warming the event cache in the background
+DEFAULT_PREFETCH_WORKERS = 2
+
+# Years warmed on each side of the year being viewed
+DEFAULT_ADJACENT_YEARS = 1
+
+# Calendar years that may wait for a prefetch thread at the same time
+DEFAULT_MAX_PENDING = 256
+
+# Seconds after their last request a user's year is no longer refreshed
+DEFAULT_IDLE_TIMEOUT = 15 * 60
+
+class YearPrefetcher:
+    """
+    Warms the event cache for the years around the one a user is viewing,
+    so switching to the previous or next year is served from the cache.
+
+    Work runs on a small shared thread pool as one job per calendar year.
+    When a user moves on to another year, jobs for years they no longer
+    need are cancelled; queued jobs never start and running ones stop
+    before their next page. With a refresh interval, the year each active
+    user last viewed is also re-synced in the background so it stays fresh
+    between visits. Users idle for longer than idle_timeout are forgotten.
+
+    Args:
+        max_workers: Threads warming the cache
+        adjacent_years: Years warmed on each side of the viewed year
+        refresh_interval: Seconds between background re-syncs of each
+                          user's viewed year, or 0 to disable them
+        idle_timeout: Seconds after their last request a user's year is
+                      no longer refreshed
+        max_pending: Maximum number of queued and running jobs
+    """
+
+    def __init__(self, max_workers=DEFAULT_PREFETCH_WORKERS, adjacent_years=DEFAULT_ADJACENT_YEARS,
+                 refresh_interval=0, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 max_pending=DEFAULT_MAX_PENDING):
+        self.adjacent_years = adjacent_years
+        self.refresh_interval = refresh_interval
+        self.idle_timeout = idle_timeout
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers),
+                                            thread_name_prefix="year-prefetch")
+        self._users = {}
+        self._pending = {}
+        # Reentrant: a job that is already done runs its callback right away
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+        self._refresher = None
+
+    def year_viewed(self, credentials, year, calendar_ids, options):
+        """
+        Record the year a user is looking at and warm the years around it.
+
+        Args:
+            credentials: Google OAuth credentials of the user
+            year: The year that was just served
+            calendar_ids: Calendars shown to the user
+            options: Fetch and cache options used for the request
+        """
+        cache = options.get("cache")
+        if cache is None or self._stopped.is_set():
+            return
+
+        user_key = options["user_key"]
+        calendar_ids = list(dict.fromkeys(calendar_ids))
+        wanted = [year + offset
+                  for distance in range(1, self.adjacent_years + 1)
+                  for offset in (-distance, distance)]
+
+        now = time.monotonic()
+        with self._lock:
+            # Re-inserted, so users stay ordered from least recently seen
+            self._users.pop(user_key, None)
+            self._users[user_key] = {
+                "credentials": credentials,
+                "year": year,
+                "calendar_ids": calendar_ids,
+                "options": options,
+                "seen_at": now
+            }
+
+            self._forget_idle(now)
+            self._cancel_unwanted(user_key)
+            for prefetch_year in wanted:
+                for calendar_id in calendar_ids:
+                    self._submit(credentials, (user_key, calendar_id, prefetch_year), options)
+
+        if self.refresh_interval > 0:
+            self._start_refresher()
+
+    def forget(self, user_key):
+        """Stop prefetching and refreshing for a user"""
+        with self._lock:
+            self._users.pop(user_key, None)
+            self._cancel_unwanted(user_key)
+
+    def shutdown(self):
+        """Cancel all queued work and stop the refresh thread"""
+        self._stopped.set()
+        with self._lock:
+            self._users.clear()
+            self._pending.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def pending(self):
+        """Return the cache keys of the queued and running jobs"""
+        with self._lock:
+            return list(self._pending)
+
+    def _wanted(self, key):
+        # Lock must be held
+        user = self._users.get(key[0])
+        if user is None or key[1] not in user["calendar_ids"]:
+            return False
+        return abs(key[2] - user["year"]) <= self.adjacent_years
+
+    def _forget_idle(self, now):
+        # Lock must be held; only the idle users at the front are visited
+        idle = []
+        for user_key, user in self._users.items():
+            if now - user["seen_at"] <= self.idle_timeout:
+                break
+            idle.append(user_key)
+
+        for user_key in idle:
+            del self._users[user_key]
+            self._cancel_unwanted(user_key)
+
+    def _cancel_unwanted(self, user_key):
+        # Lock must be held; running jobs notice on their next page
+        for key, future in list(self._pending.items()):
+            if key[0] == user_key and not self._wanted(key):
+                # Cancelling runs the done callback, which may already drop it
+                future.cancel()
+                self._pending.pop(key, None)
+
+    def _submit(self, credentials, key, options, force=False):
+        # Lock must be held
+        if key in self._pending or len(self._pending) >= self.max_pending:
+            return
+        future = self._executor.submit(self._warm, credentials, key, options, force)
+        self._pending[key] = future
+        future.add_done_callback(lambda done: self._done(key, done))
+
+    def _warm(self, credentials, key, options, force):
+        cache_key = calendar_cache_key(*key, options.get("shared"))
+        sync_intervals = options.get("sync_intervals") or {}
+        sync_interval = sync_intervals.get(key[1], options.get("sync_interval", 0))
+        if force and not is_shared_key(cache_key) and key[1] not in sync_intervals:
+            # A shared year is refreshed by all of its readers, so it keeps
+            # the sync interval instead; a watched one is kept fresh by
+            # push notifications
+            sync_interval = 0
+        time_min, time_max = year_bounds(key[2])
+
+        # Prefetching counts against the user's rate limit like their requests
+        with acting_for(key[0]):
+            try:
+                service = get_calendar_service(credentials)
+                for _ in iter_synced_events(
+                    service, options["cache"], cache_key, time_min, time_max,
+                    page_size=options.get("page_size", DEFAULT_PAGE_SIZE),
+                    fields=options.get("fields", DEFAULT_EVENT_FIELDS),
+                    sync_interval=sync_interval
+                ):
+                    with self._lock:
+                        if not self._wanted(key) or self._stopped.is_set():
+                            # The user moved on; drop the partial year
+                            return
+            except Exception as e:
+                logger.warning(f"Prefetch of {key[1]} {key[2]} failed: {e}")
+
+    def _done(self, key, future):
+        with self._lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+
+    def _start_refresher(self):
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(
+                target=self._refresh_loop, name="year-refresh", daemon=True
+            )
+        self._refresher.start()
+
+    def _refresh_loop(self):
+        while not self._stopped.wait(self.refresh_interval):
+            self._refresh_viewed_years()
+
+    def _refresh_viewed_years(self):
+        with self._lock:
+            self._forget_idle(time.monotonic())
+            for user_key, user in list(self._users.items()):
+                for calendar_id in user["calendar_ids"]:
+                    self._submit(user["credentials"], (user_key, calendar_id, user["year"]),
+                                 user["options"], force=True)
+
+def create_prefetcher(prefetch_config):
+    """
+    Create the background year prefetcher described by the `prefetch`
+    config section.
+
+    Args:
+        prefetch_config: Dict with `enabled` and the YearPrefetcher settings
+
+    Returns:
+        YearPrefetcher instance, or None if prefetching is disabled
+    """
+    if not prefetch_config.get("enabled", True):
+        return None
+
+    return YearPrefetcher(
+        max_workers=prefetch_config.get("max_workers", DEFAULT_PREFETCH_WORKERS),
+        adjacent_years=prefetch_config.get("adjacent_years", DEFAULT_ADJACENT_YEARS),
+        refresh_interval=prefetch_config.get("refresh_interval", 0),
+        idle_timeout=prefetch_config.get("idle_timeout", DEFAULT_IDLE_TIMEOUT),
+        max_pending=prefetch_config.get("max_pending", DEFAULT_MAX_PENDING)
+    )
@@ -0,0 +1,344 @@
+from contextlib import contextmanager
+from googleapiclient.errors import HttpError
+from app.metrics import REGISTRY
+import asyncio
+import contextvars
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Calls to Google in flight at once across the process
+DEFAULT_MAX_CONCURRENT_REQUESTS = 32
+
+# Sustained Google calls per second allowed for one user, and the burst
+# a user may spend at once (one year load is a page or two per calendar)
+DEFAULT_USER_RATE = 10
+DEFAULT_USER_BURST = 40
+
+# Retries of a call that failed with a rate limit or server error
+DEFAULT_MAX_RETRIES = 4
+
+# Backoff before retry n is a random delay up to base * 2**n, capped
+DEFAULT_RETRY_BASE_DELAY = 0.5
+DEFAULT_RETRY_MAX_DELAY = 16
+
+# Statuses worth retrying; 403 only when Google reports a rate limit
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+RATE_LIMIT_REASONS = (b"rateLimitExceeded", b"userRateLimitExceeded")
+
+# Buckets of users idle for this long are dropped
+IDLE_BUCKET_SECONDS = 600
+
+GOOGLE_RETRIES = REGISTRY.counter(
+    "google_retries", "Calendar API calls retried after a rate limit or server error, by status.",
+    ("status",)
+)
+THROTTLE_SECONDS = REGISTRY.histogram(
+    "google_throttle_seconds", "Time calls waited for their user's rate limit."
+)
+COALESCED_REQUESTS = REGISTRY.counter(
+    "coalesced_requests", "Requests answered by an identical request already in flight."
+)
+
+_user_key = contextvars.ContextVar("google_user_key", default=None)
+
+def set_current_user(user_key):
+    """Charge the Google calls made in the current context to a user"""
+    _user_key.set(user_key)
+
+@contextmanager
+def acting_for(user_key):
+    """Charge the Google calls made inside the block to a user"""
+    token = _user_key.set(user_key)
+    try:
+        yield
+    finally:
+        _user_key.reset(token)
+
+class TokenBucket:
+    """
+    Token bucket refilled at rate tokens per second up to capacity.
+
+    Args:
+        rate: Tokens added per second
+        capacity: Maximum number of tokens
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, now):
+        """
+        Take a token, going into debt if none is left.
+
+        Returns:
+            Seconds to wait before the token may be used
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+class GoogleScheduler:
+    """
+    Gate for every call to the Calendar API.
+
+    Calls are spread per user with a token bucket and capped globally by
+    a semaphore. Calls failing with a rate limit (429, or 403
+    rateLimitExceeded) or a server error are retried with exponential
+    backoff and full jitter, honouring Retry-After. No slot is held while
+    a call waits for its user's bucket or backs off.
+
+    Args:
+        max_concurrent: Calls in flight at once across the process
+        user_rate: Sustained calls per second per user (0 disables)
+        user_burst: Calls a user may make at once
+        max_retries: Retries of a call before its error is raised
+        base_delay: Seconds of backoff before the first retry
+        max_delay: Upper bound of the backoff in seconds
+    """
+
+    def __init__(self, max_concurrent=DEFAULT_MAX_CONCURRENT_REQUESTS,
+                 user_rate=DEFAULT_USER_RATE, user_burst=DEFAULT_USER_BURST,
+                 max_retries=DEFAULT_MAX_RETRIES, base_delay=DEFAULT_RETRY_BASE_DELAY,
+                 max_delay=DEFAULT_RETRY_MAX_DELAY):
+        self.max_concurrent = max_concurrent
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def run(self, call):
+        """
+        Run a blocking Calendar API call under the limits, retrying it on
+        rate limits and server errors.
+
+        Args:
+            call: Callable performing the request
+
+        Returns:
+            The result of call
+
+        Raises:
+            HttpError: If the call fails for good
+        """
+        for attempt in range(self.max_retries + 1):
+            wait = self._reserve()
+            if wait:
+                time.sleep(wait)
+
+            with self._slots:
+                try:
+                    return call()
+                except HttpError as e:
+                    delay = self.retry_delay(e.resp.status, e.content, attempt, e.resp.get("retry-after"))
+                    if delay is None:
+                        raise
+
+            time.sleep(delay)
+
+    async def throttle(self):
+        """Wait on the event loop for the current user's rate limit"""
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+    def retry_delay(self, status, content, attempt, retry_after=None):
+        """
+        Decide whether and when to retry a failed call.
+
+        Args:
+            status: HTTP status of the failure
+            content: Response body (bytes or str)
+            attempt: Number of retries made so far
+            retry_after: Value of the Retry-After header, if any
+
+        Returns:
+            Seconds to wait before retrying, or None to give up
+        """
+        if attempt >= self.max_retries or not is_retryable(status, content):
+            return None
+
+        GOOGLE_RETRIES.inc(status=status)
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        try:
+            delay = max(delay, min(float(retry_after), self.max_delay))
+        except (TypeError, ValueError):
+            pass  # No Retry-After, or an HTTP date we do not bother parsing
+
+        logger.info(f"Retrying Calendar API call after HTTP {status} in {delay:.2f}s")
+        return delay
+
+    def _reserve(self):
+        # Seconds the current user's next call has to wait
+        user_key = _user_key.get()
+        if user_key is None or not self.user_rate:
+            return 0.0
+
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(user_key)
+            if bucket is None:
+                self._drop_idle_buckets(now)
+                bucket = self._buckets[user_key] = TokenBucket(self.user_rate, self.user_burst)
+            wait = bucket.reserve(now)
+
+        THROTTLE_SECONDS.observe(wait)
+        return wait
+
+    def _drop_idle_buckets(self, now):
+        # Idle buckets are full again; forgetting them changes nothing
+        for user_key, bucket in list(self._buckets.items()):
+            if now - bucket.updated > IDLE_BUCKET_SECONDS:
+                del self._buckets[user_key]
+
+def is_retryable(status, content=b""):
+    """
+    Check whether a Calendar API error is temporary.
+
+    Args:
+        status: HTTP status
+        content: Response body (bytes or str)
+
+    Returns:
+        True for rate limits and server errors
+    """
+    if status in RETRYABLE_STATUSES:
+        return True
+    if status == 403:
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        return any(reason in (content or b"") for reason in RATE_LIMIT_REASONS)
+    return False
+
+_scheduler = GoogleScheduler()
+
+def get_scheduler():
+    """Return the process-wide scheduler"""
+    return _scheduler
+
+def configure_scheduler(config):
+    """
+    Replace the process-wide scheduler with one built from the
+    `calendar_api` config section.
+
+    Args:
+        config: Dict from the `calendar_api` config section (may be empty)
+
+    Returns:
+        The new GoogleScheduler
+    """
+    global _scheduler
+    _scheduler = GoogleScheduler(
+        max_concurrent=config.get("max_concurrent_requests", DEFAULT_MAX_CONCURRENT_REQUESTS),
+        user_rate=config.get("user_rate", DEFAULT_USER_RATE),
+        user_burst=config.get("user_burst", DEFAULT_USER_BURST),
+        max_retries=config.get("max_retries", DEFAULT_MAX_RETRIES),
+        base_delay=config.get("retry_base_delay", DEFAULT_RETRY_BASE_DELAY),
+        max_delay=config.get("retry_max_delay", DEFAULT_RETRY_MAX_DELAY)
+    )
+    return _scheduler
+
+def init_app(app):
+    """
+    Install request coalescing on a Flask app and stop charging Google
+    calls to a user once their request is over.
+
+    Args:
+        app: Flask application
+    """
+    app.extensions["single_flight"] = SingleFlight()
+
+    @app.teardown_request
+    def forget_user(exc):
+        set_current_user(None)
+
+class SingleFlight:
+    """
+    Coalesce identical calls made while one of them is in flight: the
+    first caller runs the call and the others wait for and share its
+    result (or exception).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, call):
+        """
+        Run call, unless a call with the same key is already running.
+
+        Args:
+            key: Hashable identifying equivalent calls
+            call: Callable taking no arguments
+
+        Returns:
+            The result of call, possibly shared with other callers
+        """
+        with self._lock:
+            flight = self._calls.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._calls[key] = _Flight()
+
+        if not leader:
+            COALESCED_REQUESTS.inc()
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = call()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            flight.done.set()
+
+    async def do_async(self, key, call):
+        """
+        Async counterpart of do for coroutines on one event loop.
+
+        Args:
+            key: Hashable identifying equivalent calls
+            call: Coroutine function taking no arguments
+
+        Returns:
+            The result of call, possibly shared with other callers
+        """
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is None:
+                task = self._tasks[key] = asyncio.ensure_future(call())
+                task.add_done_callback(lambda _: self._forget(key, task))
+            else:
+                COALESCED_REQUESTS.inc()
+
+        # A caller that goes away does not cancel the others' call
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
@@ -0,0 +1,382 @@
+from collections import OrderedDict
+from datetime import date
+from app.services.bucketing import event_day_span
+from app.services.note_codec import NOTE_PATTERN, extract_note
+from app.metrics import REGISTRY
+from itertools import compress
+from operator import is_not
+import bisect
+import html
+import re
+import threading
+
+# Search indexes kept in memory (one per cached calendar year)
+DEFAULT_SEARCH_ENTRIES = 1024
+
+# Words are runs of letters, digits and underscores, matched case-insensitively
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Markup in descriptions (Google stores them as HTML) is not searchable text
+TAG_PATTERN = re.compile(r"<[^>]*>")
+
+# Words used by at least this many events keep a ready-made bitmap; rarer
+# words are merged slot by slot
+BITMAP_MIN_EVENTS = 64
+
+# Events covering more days than this are kept apart instead of being
+# added to the bitmap of every day they cover
+LONG_EVENT_DAYS = 31
+
+# Above this many new words an update re-sorts the word list instead of
+# inserting each word
+NEW_WORDS_SORT_THRESHOLD = 64
+
+SEARCH_DOCUMENTS_INDEXED = REGISTRY.counter(
+    "search_documents_indexed", "Events (re)indexed for search; unchanged events are skipped."
+)
+
+def tokenize(text):
+    """
+    Split text into the words the search index stores.
+
+    Args:
+        text: Any text (None is allowed)
+
+    Returns:
+        List of casefolded words, in order, with repeats
+    """
+    return TOKEN_PATTERN.findall(text.casefold()) if text else []
+
+def searchable_text(event):
+    """
+    Return the text of an event that search matches against: its title,
+    location, description and note, without markup.
+
+    Args:
+        event: Event resource from the Google Calendar API
+
+    Returns:
+        Plain text
+    """
+    description = event.get("description") or ""
+    note = extract_note(description)
+    if note is not None:
+        description = NOTE_PATTERN.sub(" ", description)
+
+    parts = (event.get("summary"), event.get("location"), description, note)
+    return html.unescape(TAG_PATTERN.sub(" ", " ".join(part for part in parts if part)))
+
+class SearchIndex:
+    """
+    Inverted index from words to the events containing them.
+
+    Every event gets a small integer slot, and a set of events is a Python
+    int used as a bitmap, so the union of all the words starting with a
+    prefix and the intersection of a query's words are a few big-int
+    operations. The words are kept sorted, so those starting with a prefix
+    are one bisected slice. Per-day bitmaps of the events starting on and
+    covering each day give a query's dates with one AND per day, and its
+    first matches in start order without sorting all the matches.
+
+    update() diffs a new set of events against the indexed one and only
+    reindexes events whose object or etag changed, so an incremental sync
+    of a few events costs a pass over the IDs plus the changed events, not
+    a rebuild. Events without a date are never matched.
+
+    Args:
+        events: Optional dict of event ID to event to index
+    """
+
+    def __init__(self, events=None):
+        self._events = {}
+        self._docs = {}
+        self._slots = []
+        self._free = []
+        self._words = []
+        self._postings = _Bitmaps()
+        self._starts = _Bitmaps()
+        self._covers = _Bitmaps()
+        self._long = {}
+        self._lock = threading.Lock()
+        if events:
+            self.update(events)
+
+    def __len__(self):
+        return len(self._docs)
+
+    def update(self, events):
+        """
+        Bring the index in line with a new set of events.
+
+        Args:
+            events: Dict of event ID to event; events are referenced, not
+                    copied, and must not be modified afterwards
+
+        Returns:
+            Number of events indexed or removed
+        """
+        with self._lock:
+            indexed = self._events
+            if events is indexed:
+                return 0
+
+            # The cache copies an entry's dict on write but keeps the
+            # unchanged event objects, so few events fail this test
+            changed = list(compress(events, map(is_not, events.values(), map(indexed.get, events))))
+            added = sum(event_id not in indexed for event_id in changed)
+            removed = indexed.keys() - events.keys() if len(indexed) + added > len(events) else ()
+
+            count = 0
+            new_words = []
+            for event_id in removed:
+                self._remove(event_id)
+                count += 1
+
+            for event_id in changed:
+                event = events[event_id]
+                previous = indexed.get(event_id)
+                if previous is not None:
+                    if _same_version(previous, event):
+                        continue
+                    self._remove(event_id)
+                self._add(event_id, event, new_words)
+                count += 1
+
+            # A few new words are slotted in; a first build sorts them all once
+            if len(new_words) > NEW_WORDS_SORT_THRESHOLD:
+                self._words = sorted(self._postings.sets)
+            else:
+                for word in new_words:
+                    bisect.insort(self._words, word)
+            self._events = events
+
+        if count:
+            SEARCH_DOCUMENTS_INDEXED.inc(count)
+        return count
+
+    def search(self, query, first_day, last_day, limit=None):
+        """
+        Find the events within a window of days containing every word of a
+        query, each word matching any word it is a prefix of.
+
+        Args:
+            query: Search text
+            first_day: First day of the window (date)
+            last_day: Last day of the window, inclusive (date)
+            limit: Maximum number of events returned, or None for all
+
+        Returns:
+            Tuple of (events, dates, total): the first matching events in
+            start time order (not copies), the set of days in the window
+            covered by any match, and the number of matches overlapping
+            the window
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return [], set(), 0
+
+        with self._lock:
+            matches = -1
+            for term in terms:
+                matches &= self._prefix_matches(term)
+                if not matches:
+                    return [], set(), 0
+
+            # Only events overlapping the window count as matches
+            first = first_day.toordinal()
+            last = last_day.toordinal()
+            window = 0
+            days = set()
+            for day in self._covers.sets:
+                if first <= day <= last:
+                    bits = self._covers.bits(day)
+                    window |= bits
+                    if bits & matches:
+                        days.add(day)
+            for slot, (start, end) in self._long.items():
+                if start <= last and end >= first:
+                    window |= 1 << slot
+                    if matches >> slot & 1:
+                        days.update(range(max(start, first), min(end, last) + 1))
+
+            matches &= window
+            events = self._first_matches(matches, limit)
+
+        dates = {date.fromordinal(day) for day in days}
+        return events, dates, bin(matches).count("1")
+
+    def _prefix_matches(self, term):
+        words = self._words
+        position = bisect.bisect_left(words, term)
+        end = bisect.bisect_left(words, term + "\U0010ffff", position)
+
+        found = 0
+        rare = []
+        for word in words[position:end]:
+            slots = self._postings.sets[word]
+            if len(slots) >= BITMAP_MIN_EVENTS:
+                found |= self._postings.bits(word)
+            else:
+                rare.extend(slots)
+        return found | _bitmap(rare) if rare else found
+
+    def _first_matches(self, matches, limit):
+        # Walk the days in order; only the days reached are sorted
+        events = []
+        for day in sorted(self._starts.sets):
+            hits = self._starts.bits(day) & matches
+            if not hits:
+                continue
+
+            event_ids = sorted((self._slots[slot] for slot in _bit_positions(hits)),
+                               key=lambda event_id: self._docs[event_id][3])
+            events.extend(self._events[event_id] for event_id in event_ids)
+            if limit is not None and len(events) >= limit:
+                return events[:limit]
+        return events
+
+    def _add(self, event_id, event, new_words):
+        span = event_day_span(event)
+        if span is None:
+            self._docs[event_id] = None
+            return
+
+        slot = self._free.pop() if self._free else len(self._slots)
+        if slot == len(self._slots):
+            self._slots.append(event_id)
+        else:
+            self._slots[slot] = event_id
+
+        # Start time, then ID: the order event_sort_key gives
+        start = event.get("start", {})
+        order = (start.get("dateTime") or start.get("date") or "", event_id)
+        words = frozenset(tokenize(searchable_text(event)))
+        first, last = span[0].toordinal(), span[1].toordinal()
+        self._docs[event_id] = (slot, words, (first, last), order)
+
+        for word in words:
+            if self._postings.add(word, slot):
+                new_words.append(word)
+        self._starts.add(first, slot)
+        if last - first >= LONG_EVENT_DAYS:
+            self._long[slot] = (first, last)
+        else:
+            for day in range(first, last + 1):
+                self._covers.add(day, slot)
+
+    def _remove(self, event_id):
+        doc = self._docs.pop(event_id)
+        if doc is None:
+            return
+
+        slot, words, (first, last), _ = doc
+        for word in words:
+            if self._postings.discard(word, slot):
+                del self._words[bisect.bisect_left(self._words, word)]
+        self._starts.discard(first, slot)
+        if self._long.pop(slot, None) is None:
+            for day in range(first, last + 1):
+                self._covers.discard(day, slot)
+
+        self._slots[slot] = None
+        self._free.append(slot)
+
+class _Bitmaps:
+    # Sets of slots by key, each with a bitmap built on first use
+    def __init__(self):
+        self.sets = {}
+        self._bits = {}
+
+    def add(self, key, slot):
+        # True for a new key
+        slots = self.sets.get(key)
+        new = slots is None
+        if new:
+            slots = self.sets[key] = set()
+        slots.add(slot)
+        self._bits.pop(key, None)
+        return new
+
+    def discard(self, key, slot):
+        # True once the key has no slots left
+        slots = self.sets[key]
+        slots.discard(slot)
+        self._bits.pop(key, None)
+        if slots:
+            return False
+        del self.sets[key]
+        return True
+
+    def bits(self, key):
+        bits = self._bits.get(key)
+        if bits is None:
+            bits = self._bits[key] = _bitmap(self.sets[key])
+        return bits
+
+def _bitmap(slots):
+    # One pass over a bytearray instead of a new int per slot
+    buffer = bytearray((max(slots) >> 3) + 1)
+    for slot in slots:
+        buffer[slot >> 3] |= 1 << (slot & 7)
+    return int.from_bytes(buffer, "little")
+
+def _bit_positions(bits):
+    positions = []
+    while bits:
+        low = bits & -bits
+        positions.append(low.bit_length() - 1)
+        bits ^= low
+    return positions
+
+def _same_version(indexed, event):
+    # Google gives every change to an event a new etag
+    etag = event.get("etag")
+    return etag is not None and etag == indexed.get("etag")
+
+class SearchIndexCache:
+    """
+    In-process LRU of search indexes, one per event cache entry.
+
+    Unlike event indexes (see EventIndexCache), a search index is not
+    rebuilt when the cache hands out a new events dict for its key: a sync
+    or a note write only reindexes the events they changed. Events from
+    the sqlite backend are new objects on every read, and are compared by
+    etag instead.
+
+    Args:
+        max_entries: Maximum number of indexes kept
+    """
+
+    def __init__(self, max_entries=DEFAULT_SEARCH_ENTRIES):
+        self.max_entries = max_entries
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, entry):
+        """
+        Return the search index of a cache entry, updated to its events.
+
+        Args:
+            key: Event cache key of the entry
+            entry: The entry, as returned by the event cache
+
+        Returns:
+            SearchIndex over the entry's events
+        """
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                index = self._indexes[key] = SearchIndex()
+                while len(self._indexes) > self.max_entries:
+                    self._indexes.popitem(last=False)
+            self._indexes.move_to_end(key)
+
+        index.update(entry["events"])
+        return index
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+    def __len__(self):
+        return len(self._indexes)
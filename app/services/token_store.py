@@ -0,0 +1,375 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import google.auth.exceptions
+import google.oauth2.credentials
+import google_auth_httplib2
+import hashlib
+import httplib2
+import json
+import secrets
+import sqlite3
+import threading
+import time
+
+# Seconds before expiry at which an access token is refreshed ahead of use
+DEFAULT_REFRESH_MARGIN = 5 * 60
+
+# Seconds an unused login is kept before it is dropped (about one month)
+DEFAULT_TOKEN_TTL = 30 * 24 * 60 * 60
+
+# Seconds live credentials are used before the store is checked again
+DEFAULT_RECHECK_INTERVAL = 60
+
+# Seconds before a token refresh request to Google is abandoned
+REFRESH_TIMEOUT = 30
+
+def credentials_to_dict(credentials):
+    """
+    Serialize Google OAuth credentials for storage.
+
+    Args:
+        credentials: Google OAuth credentials
+
+    Returns:
+        JSON serializable dictionary
+    """
+    return {
+        "token": credentials.token,
+        "refresh_token": credentials.refresh_token,
+        "id_token": credentials.id_token,
+        "token_uri": credentials.token_uri,
+        "client_id": credentials.client_id,
+        "client_secret": credentials.client_secret,
+        "scopes": credentials.scopes,
+        "expiry": credentials.expiry.isoformat() if credentials.expiry else None
+    }
+
+def credentials_from_dict(data):
+    """
+    Rebuild Google OAuth credentials stored with credentials_to_dict.
+
+    Args:
+        data: Stored credentials dictionary
+
+    Returns:
+        Google OAuth credentials
+    """
+    data = dict(data)
+    expiry = data.pop("expiry", None)
+    credentials = google.oauth2.credentials.Credentials(**data)
+    # google-auth keeps expiry as a naive UTC datetime
+    credentials.expiry = datetime.fromisoformat(expiry) if expiry else None
+    return credentials
+
+class TokenStore(ABC):
+    """
+    Base class for credential store backends.
+
+    Entries are keyed by a hash of the session ID, so the stored keys cannot
+    be used as session cookies, and hold the dictionary produced by
+    credentials_to_dict.
+    """
+
+    @abstractmethod
+    def get(self, key):
+        """Return the stored credentials dictionary, or None"""
+
+    @abstractmethod
+    def set(self, key, data):
+        """Store a credentials dictionary"""
+
+    @abstractmethod
+    def delete(self, key):
+        """Drop an entry if it exists"""
+
+class MemoryTokenStore(TokenStore):
+    """
+    In-process credential store; logins do not survive a restart and are
+    not shared between worker processes.
+
+    Args:
+        ttl: Seconds an entry is kept after it was last stored
+    """
+
+    def __init__(self, ttl=DEFAULT_TOKEN_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+
+            stored_at, data = item
+            if time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            return data
+
+    def set(self, key, data):
+        with self._lock:
+            self._entries[key] = (time.time(), data)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+class SQLiteTokenStore(TokenStore):
+    """
+    On-disk credential store backed by SQLite, shared by every worker
+    process that points at the same file. The database is opened on first
+    use.
+
+    Args:
+        path: Path of the SQLite database file
+        ttl: Seconds an entry is kept after it was last stored
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TOKEN_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS tokens ("
+                " session_key TEXT PRIMARY KEY,"
+                " data TEXT NOT NULL,"
+                " stored_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key):
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT data, stored_at FROM tokens WHERE session_key = ?", (key,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        if time.time() - row[1] > self.ttl:
+            self.delete(key)
+            return None
+
+        return json.loads(row[0])
+
+    def set(self, key, data):
+        with self._lock:
+            now = time.time()
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO tokens VALUES (?, ?, ?)", (key, json.dumps(data), now))
+            conn.execute("DELETE FROM tokens WHERE stored_at < ?", (now - self.ttl,))
+            conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM tokens WHERE session_key = ?", (key,))
+            conn.commit()
+
+def create_token_store(store_config):
+    """
+    Create the credential store backend described by the `token_store`
+    config section.
+
+    Args:
+        store_config: Dict with `backend` ("sqlite" or "memory") and backend
+                      specific settings
+
+    Returns:
+        TokenStore instance
+    """
+    backend = store_config.get("backend", "sqlite")
+    ttl = store_config.get("ttl", DEFAULT_TOKEN_TTL)
+
+    if backend == "sqlite":
+        return SQLiteTokenStore(store_config.get("path", "tokens.sqlite3"), ttl=ttl)
+
+    if backend == "memory":
+        return MemoryTokenStore(ttl=ttl)
+
+    raise ValueError(f"Unknown token store backend: {backend}")
+
+class CredentialManager:
+    """
+    Hands out live Google credentials for opaque session IDs.
+
+    Credentials are kept in memory once loaded, so requests share one
+    credentials object per login instead of rebuilding it from the store;
+    the store is consulted again every `recheck_interval` seconds so logins
+    ended in another process stop working here too. Access tokens are
+    refreshed shortly before they expire. A per-session lock makes
+    concurrent requests wait for a single refresh, and the store is re-read
+    under that lock so a token another process already refreshed is
+    adopted instead of refreshed again.
+
+    Args:
+        store: TokenStore persisting the credentials
+        refresh_margin: Seconds before expiry at which tokens are refreshed
+        recheck_interval: Seconds live credentials are used before the
+                          store is checked again
+        max_live: Maximum number of logins kept in memory
+    """
+
+    def __init__(self, store, refresh_margin=DEFAULT_REFRESH_MARGIN,
+                 recheck_interval=DEFAULT_RECHECK_INTERVAL, max_live=1024):
+        self.store = store
+        self.refresh_margin = refresh_margin
+        self.recheck_interval = recheck_interval
+        self.max_live = max_live
+        self._live = OrderedDict()
+        self._saved_tokens = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def login(self, credentials):
+        """
+        Store freshly granted credentials under a new session ID.
+
+        Args:
+            credentials: Google OAuth credentials
+
+        Returns:
+            Session ID to keep in the user's session cookie
+        """
+        session_id = secrets.token_urlsafe(32)
+        key = _session_key(session_id)
+        self._save(key, credentials)
+        self._keep(key, credentials)
+        return session_id
+
+    def logout(self, session_id):
+        """
+        Forget the credentials of a session.
+
+        Args:
+            session_id: Session ID returned by login
+
+        Returns:
+            The credentials the session had, or None if it was unknown
+        """
+        key = _session_key(session_id)
+        with self._lock:
+            live = self._live.get(key)
+        data = self.store.get(key) if live is None else None
+
+        self.store.delete(key)
+        self._forget(key)
+        if live is not None:
+            return live[1]
+        return credentials_from_dict(data) if data is not None else None
+
+    def get(self, session_id):
+        """
+        Return live credentials for a session, refreshing the access token
+        first if it is about to expire.
+
+        Args:
+            session_id: Session ID returned by login
+
+        Returns:
+            Google OAuth credentials, or None if the session is unknown
+        """
+        key = _session_key(session_id)
+
+        with self._lock:
+            live = self._live.get(key)
+            if live is not None:
+                self._live.move_to_end(key)
+
+        if live is None or time.monotonic() - live[0] > self.recheck_interval:
+            data = self.store.get(key)
+            if data is None:
+                self._forget(key)
+                return None
+
+            if live is None:
+                credentials = self._keep(key, credentials_from_dict(data))
+                with self._lock:
+                    self._saved_tokens.setdefault(key, credentials.token)
+            else:
+                credentials = live[1]
+                self._adopt(key, credentials, data)
+                live[0] = time.monotonic()
+        else:
+            credentials = live[1]
+
+        if self._expiring(credentials):
+            with self._session_lock(key):
+                # Another request or process may have refreshed it meanwhile
+                if self._expiring(credentials):
+                    data = self.store.get(key)
+                    if data is not None:
+                        self._adopt(key, credentials, data)
+                if self._expiring(credentials) and credentials.refresh_token:
+                    try:
+                        credentials.refresh(google_auth_httplib2.Request(httplib2.Http(timeout=REFRESH_TIMEOUT)))
+                    except google.auth.exceptions.RefreshError:
+                        # The grant was revoked or expired; the user has to log in again
+                        self.logout(session_id)
+                        return None
+                    self._save(key, credentials)
+
+        # The API client refreshes rejected tokens on its own; keep the store current
+        elif credentials.token != self._saved_tokens.get(key):
+            self._save(key, credentials)
+
+        return credentials
+
+    def _expiring(self, credentials):
+        if credentials.expiry is None:
+            return False
+        margin = timedelta(seconds=self.refresh_margin)
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return credentials.expiry - margin <= now
+
+    def _adopt(self, key, credentials, data):
+        # Take over a newer token stored by another process
+        if not data.get("expiry") or data["token"] == credentials.token:
+            return
+
+        stored = credentials_from_dict(data)
+        if credentials.expiry is None or stored.expiry > credentials.expiry:
+            credentials.token = stored.token
+            credentials.expiry = stored.expiry
+            with self._lock:
+                self._saved_tokens[key] = stored.token
+
+    def _keep(self, key, credentials):
+        with self._lock:
+            if key in self._live:
+                return self._live[key][1]
+
+            self._live[key] = [time.monotonic(), credentials]
+            while len(self._live) > self.max_live:
+                evicted, _ = self._live.popitem(last=False)
+                self._saved_tokens.pop(evicted, None)
+                self._locks.pop(evicted, None)
+            return credentials
+
+    def _forget(self, key):
+        with self._lock:
+            self._live.pop(key, None)
+            self._saved_tokens.pop(key, None)
+            self._locks.pop(key, None)
+
+    def _save(self, key, credentials):
+        self.store.set(key, credentials_to_dict(credentials))
+        with self._lock:
+            self._saved_tokens[key] = credentials.token
+
+    def _session_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+def _session_key(session_id):
+    return hashlib.sha256(session_id.encode("utf-8")).hexdigest()
@@ -4,11 +4,26 @@ document.addEventListener('alpine:init', () => {
         isAuthenticated: false,
         calendars: [],
         selectedCalendars: [],
-        events: {},
+        // Compact year: each event once, days hold indexes into `events`
+        events: [],
+        eventDays: {},
+        // Per-day counts the canvas draws from (see summarize_days on the server)
+        eventSummary: { calendars: [], days: {} },
         showCalendarList: false,
         selectedDay: null,
         selectedDayEvents: [],
         appConfig: {},
+        eventsRequestId: 0,
+        dayRequestId: 0,
+        loadedEventQueries: new Set(),
+        pendingNotes: {},
+        noteFlushTimer: null,
+        toggleFetchTimer: null,
+        // Full-text search over the year; matching days are highlighted
+        searchQuery: '',
+        searchTotal: 0,
+        searchRequestId: 0,
+        searchTimer: null,
         
         async init() {
             // Initialize the calendar app
@@ -31,6 +46,15 @@ document.addEventListener('alpine:init', () => {
             
             // Initialize with auto-resize enabled
             this.autoResize = true;
+            
+            // Save queued notes before the page goes away
+            window.addEventListener('pagehide', () => {
+                const notes = this.takePendingNotes();
+                if (notes.length > 0) {
+                    const body = new Blob([JSON.stringify({ notes })], { type: 'application/json' });
+                    navigator.sendBeacon('/api/notes:batch', body);
+                }
+            });
         },
         
         // Debounce helper function for resize events
@@ -91,8 +115,18 @@ document.addEventListener('alpine:init', () => {
         },
         
         async fetchEvents() {
+            // Responses to earlier requests are ignored once a newer one starts
+            const requestId = ++this.eventsRequestId;
+            
+            // A new year or calendar selection changes what the search matches
+            if (this.searchQuery.trim()) {
+                this.searchEvents();
+            }
+            
             if (this.selectedCalendars.length === 0) {
-                this.events = {};
+                this.events = [];
+                this.eventDays = {};
+                this.eventSummary = { calendars: [], days: {} };
                 this.drawCalendar();
                 return;
             }
@@ -102,19 +136,117 @@ document.addEventListener('alpine:init', () => {
                 params.append('year', this.currentYear);
                 this.selectedCalendars.forEach(id => params.append('calendar_id', id));
                 
-                const response = await fetch(`/api/events?${params.toString()}`);
+                // Stream a year the first time it is shown; afterwards a plain
+                // request lets the browser revalidate its copy (304) instead
+                const query = params.toString();
+                const stream = !this.loadedEventQueries.has(query);
+                
+                const response = await fetch(`/api/events?${query}${stream ? '&stream=1' : ''}`);
                 if (!response.ok) {
                     throw new Error(`Failed to fetch events: ${response.statusText}`);
                 }
                 
-                this.events = await response.json();
-                this.drawCalendar();
+                if (requestId !== this.eventsRequestId) return;
+                this.events = [];
+                this.eventDays = {};
+                this.eventSummary = { calendars: [], days: {} };
+                this.loadedEventQueries.add(query);
+                
+                if (!stream) {
+                    const data = await response.json();
+                    if (requestId !== this.eventsRequestId) return;
+                    this.addEventChunk({ ...data, type: 'calendar' });
+                    this.addEventChunk({ type: 'done', errors: data.errors, calendars: data.calendars });
+                    return;
+                }
+                
+                // One JSON object per line; calendars arrive as they are ready
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffered = '';
+                
+                while (true) {
+                    const { value, done } = await reader.read();
+                    if (requestId !== this.eventsRequestId) {
+                        reader.cancel();
+                        return;
+                    }
+                    
+                    buffered += decoder.decode(value || new Uint8Array(), { stream: !done });
+                    const lines = buffered.split('\n');
+                    buffered = lines.pop();
+                    lines.filter(line => line.trim()).forEach(line => this.addEventChunk(JSON.parse(line)));
+                    
+                    if (done) break;
+                }
                 
             } catch (error) {
                 console.error('Error fetching events:', error);
             }
         },
         
+        addEventChunk(chunk) {
+            if (chunk.type === 'done') {
+                // Calendars that failed are left out of the payload
+                if (Object.keys(chunk.errors || {}).length > 0) {
+                    console.warn('Some calendars could not be loaded:', chunk.errors);
+                }
+                
+                // Colors and access roles resolved server-side from the
+                // cached calendar list
+                Object.entries(chunk.calendars || {}).forEach(([calendarId, settings]) => {
+                    const calendar = this.calendars.find(cal => cal.id === calendarId);
+                    if (calendar) Object.assign(calendar, settings);
+                });
+                this.drawCalendar();
+                
+                if (this.selectedDay) {
+                    this.updateSelectedDayEvents();
+                }
+                return;
+            }
+            
+            // Chunk indexes are local to the calendar; shift them into the table
+            const offset = this.events.length;
+            chunk.events.forEach(event => this.events.push(event));
+            
+            // Keep each day in the order the calendars were selected, however
+            // the fetches happened to finish
+            const order = id => this.selectedCalendars.indexOf(id);
+            Object.entries(chunk.days).forEach(([day, refs]) => {
+                const merged = (this.eventDays[day] || []).concat(refs.map(ref => ref + offset));
+                merged.sort((a, b) =>
+                    order(this.events[a].calendarId) - order(this.events[b].calendarId) || a - b
+                );
+                this.eventDays[day] = merged;
+            });
+            
+            this.mergeSummary(chunk.summary);
+            this.drawCalendar();
+        },
+        
+        mergeSummary(summary) {
+            // Rows are [total, multiDay, calendar, count, ...] with calendar
+            // indexes into summary.calendars; remap them into ours
+            const calendars = this.eventSummary.calendars;
+            const mapping = summary.calendars.map(calendarId => {
+                if (!calendars.includes(calendarId)) calendars.push(calendarId);
+                return calendars.indexOf(calendarId);
+            });
+            const order = index => this.selectedCalendars.indexOf(calendars[index]);
+            
+            Object.entries(summary.days).forEach(([day, row]) => {
+                const existing = this.eventSummary.days[day] || [0, 0];
+                const pairs = [];
+                for (let i = 2; i < existing.length; i += 2) pairs.push([existing[i], existing[i + 1]]);
+                for (let i = 2; i < row.length; i += 2) pairs.push([mapping[row[i]], row[i + 1]]);
+                
+                // Keep pie segments in calendar selection order
+                pairs.sort((a, b) => order(a[0]) - order(b[0]));
+                this.eventSummary.days[day] = [existing[0] + row[0], existing[1] + row[1]].concat(...pairs);
+            });
+        },
+        
         toggleCalendarList() {
             this.showCalendarList = !this.showCalendarList;
             if (!this.showCalendarList && this.selectedDay) {
@@ -136,7 +268,9 @@ document.addEventListener('alpine:init', () => {
                 calendar.selected = !calendar.selected;
             }
             
-            this.fetchEvents();
+            // Rapid toggles load the year once, after the last one
+            clearTimeout(this.toggleFetchTimer);
+            this.toggleFetchTimer = setTimeout(() => this.fetchEvents(), 250);
         },
         
         prevYear() {
@@ -216,8 +350,62 @@ document.addEventListener('alpine:init', () => {
             }, 500);
         },
         
+        onSearchInput() {
+            // Search once typing pauses
+            clearTimeout(this.searchTimer);
+            this.searchTimer = setTimeout(() => this.searchEvents(), 200);
+        },
+        
+        async searchEvents() {
+            const requestId = ++this.searchRequestId;
+            const query = this.searchQuery.trim();
+            
+            if (!query || this.selectedCalendars.length === 0) {
+                this.searchTotal = 0;
+                this.showSearchDates([]);
+                return;
+            }
+            
+            try {
+                const params = new URLSearchParams();
+                params.append('q', query);
+                params.append('year', this.currentYear);
+                this.selectedCalendars.forEach(id => params.append('calendar_id', id));
+                
+                const response = await fetch(`/api/search?${params.toString()}`);
+                if (requestId !== this.searchRequestId) return;
+                
+                if (!response.ok) {
+                    throw new Error(`HTTP error! Status: ${response.status}`);
+                }
+                
+                const data = await response.json();
+                if (requestId !== this.searchRequestId) return;
+                
+                this.searchTotal = data.total;
+                this.showSearchDates(data.dates);
+            } catch (error) {
+                console.error('Error searching events:', error);
+            }
+        },
+        
+        clearSearch() {
+            this.searchQuery = '';
+            this.searchEvents();
+        },
+        
+        showSearchDates(dates) {
+            if (!this.calendarCanvas) return;
+            this.calendarCanvas.highlightedDates = new Set(dates);
+            this.drawCalendar();
+        },
+        
         drawCalendar() {
-            this.calendarCanvas.drawCalendar(this.currentYear, this.events, this.calendars);
+            this.calendarCanvas.drawCalendar(
+                this.currentYear,
+                { events: this.events, days: this.eventDays, summary: this.eventSummary },
+                this.calendars
+            );
         },
         
         // Mouse and touch interactions
@@ -269,67 +457,131 @@ document.addEventListener('alpine:init', () => {
         
         // Day and event handling
         selectDay(day, month) {
-            // Format the date for lookup in the events object
-            const monthIndex = month - 1;
-            const date = new Date(this.currentYear, monthIndex, day);
-            const dateKey = date.toISOString().split('T')[0];
+            // Day-of-year index used to look up the day's events
+            const dayIndex = Math.round(
+                (Date.UTC(this.currentYear, month - 1, day) - Date.UTC(this.currentYear, 0, 1)) / 86400000
+            );
             
             this.selectedDay = {
                 day,
                 month,
-                dateKey
+                dayIndex
             };
             
             this.updateSelectedDayEvents();
         },
         
-        updateSelectedDayEvents() {
+        async updateSelectedDayEvents() {
+            // Responses for a previously selected day are ignored
+            const requestId = ++this.dayRequestId;
+            
             if (!this.selectedDay) {
                 this.selectedDayEvents = [];
                 return;
             }
             
-            // Get events for the selected date
-            this.selectedDayEvents = this.events[this.selectedDay.dateKey] || [];
+            // Nothing to load for days without events
+            if (!this.eventDays[this.selectedDay.dayIndex] || this.selectedCalendars.length === 0) {
+                this.selectedDayEvents = [];
+                return;
+            }
             
-            // Filter events by selected calendars
-            this.selectedDayEvents = this.selectedDayEvents.filter(event => 
-                this.selectedCalendars.includes(event.calendarId)
-            );
+            // The overview only has titles and times; load the full events
+            const { day, month } = this.selectedDay;
+            const isoDate = `${this.currentYear}-${String(month).padStart(2, '0')}-${String(day).padStart(2, '0')}`;
+            const params = new URLSearchParams();
+            this.selectedCalendars.forEach(id => params.append('calendar_id', id));
+            
+            try {
+                const response = await fetch(`/api/events/day/${isoDate}?${params.toString()}`);
+                if (!response.ok) {
+                    throw new Error(`Failed to fetch day events: ${response.statusText}`);
+                }
+                
+                const data = await response.json();
+                if (requestId !== this.dayRequestId) return;
+                this.selectedDayEvents = data.events;
+                
+            } catch (error) {
+                console.error('Error fetching day events:', error);
+            }
         },
         
         closeEventsPanel() {
+            this.dayRequestId++;
             this.selectedDay = null;
             this.selectedDayEvents = [];
         },
         
-        async saveNote(event) {
+        saveNote(event) {
             if (!event.id || !event.note) return;
             
+            // Queue the note; notes edited in quick succession are saved in one batch
+            this.pendingNotes[`${event.calendarId}/${event.id}`] = {
+                calendar_id: event.calendarId,
+                event_id: event.id,
+                note: event.note,
+                etag: event.etag
+            };
+            
+            clearTimeout(this.noteFlushTimer);
+            this.noteFlushTimer = setTimeout(() => this.flushNotes(), 500);
+        },
+        
+        takePendingNotes() {
+            const notes = Object.values(this.pendingNotes);
+            this.pendingNotes = {};
+            clearTimeout(this.noteFlushTimer);
+            return notes;
+        },
+        
+        async flushNotes() {
+            const notes = this.takePendingNotes();
+            if (notes.length === 0) return;
+            
             try {
-                const response = await fetch(`/api/events/${event.id}/note?calendar_id=${event.calendarId}`, {
-                    method: 'PUT',
+                const response = await fetch('/api/notes:batch', {
+                    method: 'POST',
                     headers: {
                         'Content-Type': 'application/json'
                     },
-                    body: JSON.stringify({
-                        note: event.note
-                    })
+                    body: JSON.stringify({ notes })
                 });
                 
                 if (!response.ok) {
-                    throw new Error(`Failed to save note: ${response.statusText}`);
+                    throw new Error(`Failed to save notes: ${response.statusText}`);
                 }
                 
-                // Success message or notification could be shown here
+                // Each note succeeds or fails on its own
+                const data = await response.json();
+                data.results.forEach(result => {
+                    if (!result.success) {
+                        console.error(`Error saving note for event ${result.event_id}:`, result.error);
+                        return;
+                    }
+                    
+                    // Remember the new version so the next save needs no extra read
+                    const event = this.selectedDayEvents.find(
+                        event => event.calendarId === result.calendar_id && event.id === result.event_id
+                    );
+                    if (event) event.etag = result.etag;
+                });
                 
             } catch (error) {
-                console.error('Error saving note:', error);
+                console.error('Error saving notes:', error);
                 // Error message could be shown here
             }
         },
         
         // Helper functions
+        isMultiDay(event) {
+            return event.span[0] !== event.span[1];
+        },
+        
+        isFirstDay(event) {
+            return !this.selectedDay || event.span[0] === this.selectedDay.dayIndex;
+        },
+        
         formatSelectedDate() {
             if (!this.selectedDay) return '';
             
@@ -341,7 +593,7 @@ document.addEventListener('alpine:init', () => {
             if (!event.start) return '';
             
             // Handle multi-day events
-            if (event.isMultiDay) {
+            if (this.isMultiDay(event)) {
                 let eventTime = '';
                 
                 // All-day event
@@ -362,7 +614,7 @@ document.addEventListener('alpine:init', () => {
                     // Format options
                     const dateOptions = { month: 'short', day: 'numeric' };
                     
-                    if (event.isFirstDay) {
+                    if (this.isFirstDay(event)) {
                         // This is the first day of the event
                         eventTime = `Multi-day: ${startDate.toLocaleDateString(undefined, dateOptions)} - ${endDate.toLocaleDateString(undefined, dateOptions)}`;
                     } else {
@@ -388,7 +640,7 @@ document.addEventListener('alpine:init', () => {
                     const dateOptions = { month: 'short', day: 'numeric' };
                     const timeOptions = { hour: 'numeric', minute: '2-digit' };
                     
-                    if (event.isFirstDay) {
+                    if (this.isFirstDay(event)) {
                         // First day: show start time and date range
                         return `Starts: ${startDate.toLocaleTimeString(undefined, timeOptions)}, ${startDate.toLocaleDateString(undefined, dateOptions)} - ${endDate.toLocaleDateString(undefined, dateOptions)}`;
                     } else {
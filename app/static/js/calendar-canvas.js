@@ -21,6 +21,9 @@ class CalendarCanvas {
         this.initialPinchDistance = 0;
         this.initialScale = 1;
         
+        // Days matching the current search, as YYYY-MM-DD strings
+        this.highlightedDates = new Set();
+        
         // Day click callback
         this.onDayClick = null;
         
@@ -79,6 +82,7 @@ class CalendarCanvas {
         
         // Draw calendar elements
         this.drawGrid();
+        this.drawHighlights();
         this.drawMonthLabels();
         this.drawDayLabels();
         this.drawCellHeaders();
@@ -88,6 +92,21 @@ class CalendarCanvas {
         this.ctx.restore();
     }
     
+    drawHighlights() {
+        if (this.highlightedDates.size === 0) return;
+        
+        this.ctx.fillStyle = 'rgba(255, 214, 0, 0.35)';
+        for (const isoDate of this.highlightedDates) {
+            const [year, month, day] = isoDate.split('-').map(Number);
+            if (year !== this.year) continue;
+            
+            // Same cell position as drawEvents
+            const x = this.gridX + this.columnWidth + ((day - 1) * this.columnWidth);
+            const y = this.gridY + this.rowHeight + ((month - 1) * this.rowHeight);
+            this.ctx.fillRect(x, y, this.columnWidth, this.rowHeight);
+        }
+    }
+    
     drawCellHeaders() {
         // Draw day headers for each cell in the grid
         for (let month = 1; month <= 12; month++) {
@@ -172,13 +191,19 @@ class CalendarCanvas {
     }
     
     drawEvents() {
-        if (!this.events || Object.keys(this.events).length === 0) return;
+        // Per-day rows precomputed by the server: [total, multiDay, calendar, count, ...]
+        const summary = this.events && this.events.summary;
+        if (!summary || Object.keys(summary.days).length === 0) return;
         
-        Object.entries(this.events).forEach(([dateKey, dayEvents]) => {
-            if (!dayEvents || dayEvents.length === 0) return;
-            
-            // Parse the date to get day and month
-            const date = new Date(dateKey);
+        // Look the colors up once per draw instead of once per day
+        const colors = summary.calendars.map(calendarId => {
+            const calendar = this.calendars.find(cal => cal.id === calendarId);
+            return calendar ? calendar.backgroundColor : '#4285F4';
+        });
+        
+        for (const dayKey in summary.days) {
+            // Convert the day-of-year index to day and month
+            const date = new Date(this.year, 0, 1 + Number(dayKey));
             const day = date.getDate();
             const month = date.getMonth();
             
@@ -187,8 +212,8 @@ class CalendarCanvas {
             const y = this.gridY + this.rowHeight + (month * this.rowHeight);
             
             // Draw event indicators
-            this.drawEventIndicator(x, y, dayEvents);
-        });
+            this.drawEventIndicator(x, y, summary.days[dayKey], colors);
+        }
     }
     
     drawCellHeader(x, y, day, month) {
@@ -231,49 +256,18 @@ class CalendarCanvas {
         this.ctx.stroke();
     }
     
-    drawEventIndicator(x, y, events) {
-        // Sort events by calendar and categorize single-day vs multi-day events
-        const eventsByCalendar = {};
-        const multiDayEvents = [];
-        const singleDayEvents = [];
-        
-        events.forEach(event => {
-            // Categorize events as single-day or multi-day
-            if (event.isMultiDay) {
-                multiDayEvents.push(event);
-            } else {
-                singleDayEvents.push(event);
-            }
-            
-            // Group by calendar for visualization
-            if (!eventsByCalendar[event.calendarId]) {
-                eventsByCalendar[event.calendarId] = [];
-            }
-            eventsByCalendar[event.calendarId].push(event);
-        });
-        
-        // Get colors for each calendar
-        const calendarColors = {};
-        Object.keys(eventsByCalendar).forEach(calendarId => {
-            const calendar = this.calendars.find(cal => cal.id === calendarId);
-            calendarColors[calendarId] = calendar ? calendar.backgroundColor : '#4285F4';
-        });
+    drawEventIndicator(x, y, row, colors) {
+        const [totalCount, multiDayCount] = row;
+        const calendarCount = (row.length - 2) / 2;
         
         // Draw indicators for each calendar's events
         const indicatorSize = Math.min(this.columnWidth, this.rowHeight) * 0.6; // Reduced size to make room for header
         const cellCenterX = x + (this.columnWidth / 2);
         const cellCenterY = y + (this.rowHeight * 0.6); // Move down to make room for header
         
-        // Draw unique single-day and multi-day event counts
-        const singleDayCount = this.countUniqueEvents(singleDayEvents);
-        const multiDayCount = this.countUniqueEvents(multiDayEvents);
-        const totalCount = singleDayCount + multiDayCount;
-        
-        if (Object.keys(eventsByCalendar).length === 1) {
+        if (calendarCount === 1) {
             // Single calendar: draw one colored circle
-            const calendarId = Object.keys(eventsByCalendar)[0];
-            
-            this.ctx.fillStyle = calendarColors[calendarId];
+            this.ctx.fillStyle = colors[row[2]];
             this.ctx.beginPath();
             this.ctx.arc(cellCenterX, cellCenterY, indicatorSize / 2, 0, Math.PI * 2);
             this.ctx.fill();
@@ -286,26 +280,13 @@ class CalendarCanvas {
                 this.ctx.textBaseline = 'middle';
                 this.ctx.fillText(totalCount.toString(), cellCenterX, cellCenterY);
             }
-            
-            // Add a border for multi-day events
-            if (multiDayCount > 0) {
-                this.ctx.strokeStyle = 'white';
-                this.ctx.lineWidth = 2;
-                this.ctx.beginPath();
-                this.ctx.arc(cellCenterX, cellCenterY, indicatorSize / 2 + 2, 0, Math.PI * 2);
-                this.ctx.stroke();
-            }
         } else {
             // Multiple calendars: draw pie segments
-            const calendarIds = Object.keys(eventsByCalendar);
-            const totalEvents = calendarIds.reduce((sum, id) => sum + this.countUniqueEvents(eventsByCalendar[id]), 0);
-            
             let startAngle = 0;
-            calendarIds.forEach(calendarId => {
-                const count = this.countUniqueEvents(eventsByCalendar[calendarId]);
-                const angle = (count / totalEvents) * (Math.PI * 2);
+            for (let i = 2; i < row.length; i += 2) {
+                const angle = (row[i + 1] / totalCount) * (Math.PI * 2);
                 
-                this.ctx.fillStyle = calendarColors[calendarId];
+                this.ctx.fillStyle = colors[row[i]];
                 this.ctx.beginPath();
                 this.ctx.moveTo(cellCenterX, cellCenterY);
                 this.ctx.arc(cellCenterX, cellCenterY, indicatorSize / 2, startAngle, startAngle + angle);
@@ -313,7 +294,7 @@ class CalendarCanvas {
                 this.ctx.fill();
                 
                 startAngle += angle;
-            });
+            }
             
             // Add total count text
             if (totalCount > 1) {
@@ -328,33 +309,16 @@ class CalendarCanvas {
                 this.ctx.textBaseline = 'middle';
                 this.ctx.fillText(totalCount.toString(), cellCenterX, cellCenterY);
             }
-            
-            // Add a border for multi-day events
-            if (multiDayCount > 0) {
-                this.ctx.strokeStyle = 'white';
-                this.ctx.lineWidth = 2;
-                this.ctx.beginPath();
-                this.ctx.arc(cellCenterX, cellCenterY, indicatorSize / 2 + 2, 0, Math.PI * 2);
-                this.ctx.stroke();
-            }
         }
-    }
-    
-    // Helper method to count unique events (preventing double-counting of multi-day events)
-    countUniqueEvents(events) {
-        // For multi-day events, only count an event once per day, giving priority to the first day
-        const countedEventIds = new Set();
-        let count = 0;
-        
-        events.forEach(event => {
-            // If the event is not a multi-day event or it's the first day of a multi-day event, count it
-            if (!event.isMultiDay || event.isFirstDay || !countedEventIds.has(event.id)) {
-                count++;
-                countedEventIds.add(event.id);
-            }
-        });
         
-        return count;
+        // Add a border for multi-day events
+        if (multiDayCount > 0) {
+            this.ctx.strokeStyle = 'white';
+            this.ctx.lineWidth = 2;
+            this.ctx.beginPath();
+            this.ctx.arc(cellCenterX, cellCenterY, indicatorSize / 2 + 2, 0, Math.PI * 2);
+            this.ctx.stroke();
+        }
     }
     
     handleClick(e) {
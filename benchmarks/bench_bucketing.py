@@ -0,0 +1,59 @@
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from app.services.bucketing import day_spans, index_days
+
+def make_events(count, seed=0):
+    """Build a year of expanded instances: mostly timed, some multi-day all-day events"""
+    rng = random.Random(seed)
+    events = []
+    for i in range(count):
+        day = date(2025, 1, 1) + timedelta(days=rng.randint(0, 364))
+        if rng.random() < 0.2:
+            end = day + timedelta(days=rng.choice([1, 1, 2, 3, 7]))
+            events.append({"id": f"e{i}", "start": {"date": day.isoformat()},
+                           "end": {"date": end.isoformat()}})
+        else:
+            hour = rng.randint(0, 22)
+            events.append({"id": f"e{i}",
+                           "start": {"dateTime": f"{day.isoformat()}T{hour:02d}:00:00-05:00"},
+                           "end": {"dateTime": f"{day.isoformat()}T{hour + 1:02d}:00:00-05:00"}})
+    return events
+
+def bucket(events, engine):
+    """Spans plus day index, the work build_compact_year does per year"""
+    spans = [span for span in day_spans(events, date(2025, 1, 1), engine=engine) if span]
+    return index_days(spans, 365, engine=engine)
+
+def measure(events, engine, repeat):
+    """Return the best milliseconds per run"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        bucket(events, engine)
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare the Python and NumPy day-bucketing engines'
+    )
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='Event counts to benchmark')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Runs per engine and size; the best one is reported')
+    args = parser.parse_args()
+    
+    print(f"{'events':>8} {'python':>11} {'numpy':>11} {'speedup':>8}")
+    for size in args.sizes:
+        events = make_events(size)
+        assert bucket(events, "python") == bucket(events, "numpy")
+        
+        python_ms = measure(events, "python", args.repeat)
+        numpy_ms = measure(events, "numpy", args.repeat)
+        print(f"{size:8d} {python_ms:8.2f} ms {numpy_ms:8.2f} ms {python_ms / numpy_ms:7.1f}x")
+
+if __name__ == "__main__":
+    main()
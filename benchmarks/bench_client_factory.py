@@ -0,0 +1,96 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+import google.oauth2.credentials
+from googleapiclient.discovery import build
+from app.services import calendar_service, google_client
+from app.services.calendar_service import get_events_for_year
+from app.services.google_client import get_calendar_service, get_discovery_document
+from tests.fake_calendar import FakeTransport, make_event
+
+def build_per_request(credentials):
+    """Previous behavior: build() on every request"""
+    service = build("calendar", "v3", credentials=credentials)
+    service.events().list(calendarId="primary", singleEvents=True)
+
+def pooled_service(credentials):
+    """Shared client factory: cached discovery document and pooled transport"""
+    service = get_calendar_service(credentials)
+    service.events().list(calendarId="primary", singleEvents=True)
+
+def measure(func, iterations):
+    """Return the average milliseconds per call (requests are built, not sent)"""
+    credentials = google.oauth2.credentials.Credentials(token="benchmark-token")
+    func(credentials)  # Warm up
+    
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func(credentials)
+    return (time.perf_counter() - started) * 1000 / iterations
+
+def measure_year_loads(requests, calendars, latency, connect_latency, per_request_threads):
+    """
+    Load a year of several calendars repeatedly for one user through the
+    real client library, with transports that simulate connection setup.
+    
+    Returns:
+        Tuple of (average milliseconds per load, transports created)
+    """
+    items = {f"calendar-{number}": [make_event(f"e{number}", "2025-03-01")] for number in range(calendars)}
+    created = []
+    google_client.create_transport = lambda: FakeTransport(
+        items, latency=latency, connect_latency=connect_latency, created=created
+    )
+    
+    shared = calendar_service.get_fetch_executor
+    if per_request_threads:
+        # Previous behavior: every request started its own fetch threads
+        calendar_service.get_fetch_executor = lambda: ThreadPoolExecutor(thread_name_prefix="calendar-fetch")
+    
+    credentials = google.oauth2.credentials.Credentials(token="benchmark-token")
+    try:
+        started = time.perf_counter()
+        for _ in range(requests):
+            get_events_for_year(credentials, 2025, list(items))
+        elapsed = (time.perf_counter() - started) * 1000 / requests
+    finally:
+        calendar_service.get_fetch_executor = shared
+    return elapsed, len(created)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure per-request overhead of creating a Calendar API client'
+    )
+    parser.add_argument('--iterations', type=int, default=200,
+                        help='Number of requests to time per strategy')
+    parser.add_argument('--requests', type=int, default=10,
+                        help='Year loads of the same user in the transport reuse run')
+    parser.add_argument('--calendars', type=int, default=4,
+                        help='Calendars per year load')
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='Simulated seconds per Google request')
+    parser.add_argument('--connect-latency', type=float, default=0.05,
+                        help='Simulated seconds to open a connection to Google')
+    args = parser.parse_args()
+    
+    before = measure(build_per_request, args.iterations)
+    after = measure(pooled_service, args.iterations)
+    
+    print(f"build() per request:   {before:8.3f} ms")
+    print(f"shared client factory: {after:8.3f} ms")
+    print(f"speedup:               {before / after:8.1f}x")
+    
+    get_discovery_document()
+    original = google_client.create_transport
+    try:
+        print(f"\n{args.requests} year loads of {args.calendars} calendars")
+        for label, per_request in (("fetch threads per request", True), ("shared fetch threads", False)):
+            elapsed, transports = measure_year_loads(
+                args.requests, args.calendars, args.latency, args.connect_latency, per_request
+            )
+            print(f"{label:26} {elapsed:8.1f} ms per load, {transports:3d} transports")
+    finally:
+        google_client.create_transport = original
+
+if __name__ == "__main__":
+    main()
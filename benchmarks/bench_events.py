@@ -0,0 +1,294 @@
+import argparse
+import gzip
+import json
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+import yaml
+from app import create_app
+from app.services import calendar_service
+from app.routes import calendar as calendar_routes
+from app.services.token_store import credentials_from_dict
+from tests.fake_calendar import FakeCalendarService
+
+YEAR = 2025
+WORDS = "meeting agenda zoom link notes project review dial-in room lunch standup budget".split()
+
+# Metrics where a larger value is a regression, compared by --compare
+LOWER_IS_BETTER = ("p50_ms", "p95_ms", "peak_memory_kb", "payload_bytes", "gzip_bytes")
+HIGHER_IS_BETTER = ("requests_per_second",)
+
+def make_calendars(calendars, events, recurring, multi_day, description_size, seed=0):
+    """
+    Build synthetic calendars shaped like real ones after singleEvents expansion.
+
+    Args:
+        calendars: Number of calendars
+        events: Events per calendar, counting every instance of a series
+        recurring: Fraction of events that are instances of weekly series
+        multi_day: Fraction of the one-off events that are multi-day all-day events
+        description_size: Average words in an event description
+        seed: Random seed, so runs on different commits see the same data
+
+    Returns:
+        Dict mapping calendar ID to its list of events
+    """
+    rng = random.Random(seed)
+    result = {}
+
+    for calendar_index in range(calendars):
+        items = []
+
+        # Weekly series, each expanded into one instance per week
+        series = 0
+        while len(items) < events * recurring:
+            weekday = rng.randint(0, 6)
+            hour = rng.randint(7, 18)
+            first = date(YEAR, 1, 1) + timedelta(days=weekday)
+            description = _description(rng, description_size)
+            for week in range(52):
+                if len(items) >= events * recurring:
+                    break
+                day = first + timedelta(weeks=week)
+                start = datetime(day.year, day.month, day.day, hour).isoformat() + "-05:00"
+                end = datetime(day.year, day.month, day.day, hour + 1).isoformat() + "-05:00"
+                items.append({
+                    "id": f"s{series}_{day.strftime('%Y%m%d')}",
+                    "recurringEventId": f"s{series}",
+                    "etag": '"1"',
+                    "summary": f"Series {series}",
+                    "description": description,
+                    "start": {"dateTime": start}, "end": {"dateTime": end}
+                })
+            series += 1
+
+        for index in range(events - len(items)):
+            day = date(YEAR, 1, 1) + timedelta(days=rng.randint(0, 364))
+            if rng.random() < multi_day:
+                last = day + timedelta(days=rng.choice([2, 3, 7, 14, 30]))
+                span = {"start": {"date": day.isoformat()}, "end": {"date": last.isoformat()}}
+            else:
+                hour = rng.randint(0, 22)
+                span = {
+                    "start": {"dateTime": datetime(day.year, day.month, day.day, hour).isoformat() + "-05:00"},
+                    "end": {"dateTime": datetime(day.year, day.month, day.day, hour + 1).isoformat() + "-05:00"}
+                }
+            items.append(dict(span, id=f"e{index}", etag='"1"', summary=f"Event {index}",
+                              description=_description(rng, description_size)))
+
+        items.sort(key=lambda event: event["start"].get("dateTime") or event["start"]["date"])
+        result[f"calendar{calendar_index}@example.com"] = items
+
+    return result
+
+def make_calendar_list(calendars):
+    """Build the calendar list entries of the generated calendars"""
+    return [{
+        "id": calendar_id,
+        "summary": calendar_id,
+        "backgroundColor": "#9fc6e7",
+        "foregroundColor": "#000000",
+        "accessRole": "owner"
+    } for calendar_id in calendars]
+
+def _description(rng, size):
+    if size <= 0 or rng.random() < 0.3:
+        return None
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, size * 2)))
+
+def build_app(service, cache):
+    """Create the app against the fake service with a logged-in session cookie"""
+    with tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False) as config_file:
+        yaml.dump({
+            "flask": {"secret_key": "benchmark-key"},
+            "google": {"client_id": "benchmark-client", "client_secret": "benchmark-secret"},
+            # A long sync interval serves the warm scenario from the cache alone
+            "cache": {"backend": cache, "sync_interval": 3600},
+            "token_store": {"backend": "memory"},
+            "prefetch": {"enabled": False},
+            "metrics": {"enabled": False}
+        }, config_file)
+    try:
+        app = create_app(config_file.name)
+    finally:
+        os.unlink(config_file.name)
+
+    # Patched where it is used: events come from the service module, the
+    # calendar list (colors and access roles) from the routes
+    calendar_service.get_calendar_service = lambda credentials: service
+    calendar_routes.get_calendar_service = lambda credentials: service
+
+    sid = app.extensions["credentials"].login(credentials_from_dict({
+        "token": "benchmark-token",
+        "refresh_token": "benchmark-refresh-token",
+        "token_uri": "https://oauth2.googleapis.com/token",
+        "client_id": "benchmark-client",
+        "client_secret": "benchmark-secret"
+    }))
+    serializer = app.session_interface.get_signing_serializer(app)
+    return app, serializer.dumps({"sid": sid})
+
+def make_client(app, cookie):
+    client = app.test_client()
+    client.set_cookie(app.config["SESSION_COOKIE_NAME"], cookie)
+    return client
+
+def measure_latency(client, url, requests):
+    """Return sorted milliseconds per request"""
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = client.get(url, headers={"Accept-Encoding": "identity"})
+        latencies.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return sorted(latencies)
+
+def measure_throughput(app, cookie, url, clients, duration):
+    """Return completed requests per second with concurrent clients"""
+    deadline = time.monotonic() + duration
+    counts = [0] * clients
+
+    def run(index):
+        client = make_client(app, cookie)
+        while time.monotonic() < deadline:
+            client.get(url, headers={"Accept-Encoding": "gzip"})
+            counts[index] += 1
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(clients)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / (time.monotonic() - started)
+
+def measure_memory(client, url):
+    """Return the peak kilobytes allocated while serving one request"""
+    tracemalloc.start()
+    try:
+        client.get(url, headers={"Accept-Encoding": "identity"})
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+def run_scenario(name, service, cache, url, args):
+    app, cookie = build_app(service, cache)
+    client = make_client(app, cookie)
+    # The warm scenario fills the cache first; the cold one has none
+    client.get(url)
+
+    latencies = measure_latency(client, url, args.requests)
+    payload = client.get(url, headers={"Accept-Encoding": "identity"}).get_data()
+    return {
+        "scenario": name,
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1 if len(latencies) > 1 else 0], 2),
+        "requests_per_second": round(measure_throughput(app, cookie, url, args.clients, args.duration), 1),
+        "peak_memory_kb": round(measure_memory(client, url)),
+        "payload_bytes": len(payload),
+        "gzip_bytes": len(gzip.compress(payload, 6))
+    }
+
+def compare(results, baseline, tolerance):
+    """
+    Print each metric against a saved run.
+
+    Returns:
+        Number of metrics worse than the baseline by more than the tolerance
+    """
+    previous = {result["scenario"]: result for result in baseline["results"]}
+    regressions = 0
+    for result in results:
+        before = previous.get(result["scenario"])
+        if before is None:
+            continue
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            if not before.get(metric):
+                continue
+            change = (result[metric] - before[metric]) / before[metric]
+            worse = change > tolerance if metric in LOWER_IS_BETTER else change < -tolerance
+            regressions += worse
+            print(f"{result['scenario']:>12} {metric:>20} {before[metric]:>12} -> {result[metric]:<12}"
+                  f" {change:+7.1%}{'  REGRESSION' if worse else ''}")
+    return regressions
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure /api/events end to end against a synthetic Calendar API backend'
+    )
+    parser.add_argument('--calendars', type=int, default=10,
+                        help='Number of calendars requested together')
+    parser.add_argument('--events', type=int, default=2000,
+                        help='Events per calendar in the year, counting recurring instances')
+    parser.add_argument('--recurring', type=float, default=0.5,
+                        help='Fraction of events that are instances of weekly series')
+    parser.add_argument('--multi-day', type=float, default=0.2,
+                        help='Fraction of one-off events spanning several days')
+    parser.add_argument('--description-words', type=int, default=40,
+                        help='Average words in an event description')
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='Seconds the fake backend waits per API request')
+    parser.add_argument('--format', choices=['compact', 'full'], default='compact',
+                        help='Response format requested from /api/events')
+    parser.add_argument('--requests', type=int, default=20,
+                        help='Sequential requests timed for the latency percentiles')
+    parser.add_argument('--clients', type=int, default=8,
+                        help='Concurrent clients for the throughput run')
+    parser.add_argument('--duration', type=float, default=5,
+                        help='Seconds of the throughput run')
+    parser.add_argument('--scenarios', nargs='+', choices=['cold', 'warm'], default=['cold', 'warm'],
+                        help='cold: no event cache, every request goes to the backend; '
+                             'warm: requests are served from the memory cache')
+    parser.add_argument('--json', dest='json_path',
+                        help='Write the results to this file for later comparison')
+    parser.add_argument('--compare',
+                        help='Results file of an earlier run (e.g. another commit) to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Relative change counted as a regression by --compare')
+    args = parser.parse_args()
+
+    service = FakeCalendarService(
+        calendars=make_calendars(args.calendars, args.events, args.recurring, args.multi_day,
+                                 args.description_words),
+        latency=args.latency
+    )
+    service.calendar_list = make_calendar_list(service.calendars)
+    query = "&".join(f"calendar_id={calendar_id}" for calendar_id in service.calendars)
+    url = f"/api/events?year={YEAR}&format={args.format}&{query}"
+
+    backends = {"cold": "none", "warm": "memory"}
+    results = [run_scenario(name, service, backends[name], url, args) for name in args.scenarios]
+
+    print(f"{args.calendars} calendars x {args.events} events, {args.latency * 1000:.0f} ms backend latency")
+    print(f"{'scenario':>12} {'p50':>10} {'p95':>10} {'req/s':>8} {'peak mem':>10} {'payload':>10} {'gzip':>10}")
+    for result in results:
+        print(f"{result['scenario']:>12} {result['p50_ms']:7.1f} ms {result['p95_ms']:7.1f} ms"
+              f" {result['requests_per_second']:8.1f} {result['peak_memory_kb']:7d} KB"
+              f" {result['payload_bytes'] / 1024:7.0f} KB {result['gzip_bytes'] / 1024:7.0f} KB")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"commit": git_commit(), "settings": vars(args), "results": results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.compare} (commit {baseline.get('commit')}):")
+        if compare(results, baseline, args.tolerance):
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import random
+import re
+import time
+from app.services.note_codec import NOTE_START, NOTE_END, extract_note, extract_notes
+
+def original_extract(description):
+    """Previous behavior: uncompiled regex search on every description"""
+    if not description:
+        return None
+    
+    note_pattern = r"<!-- BIGASSCALENDAR_NOTE_START -->(.*?)<!-- BIGASSCALENDAR_NOTE_END -->"
+    match = re.search(note_pattern, description, re.DOTALL)
+    
+    if match:
+        return match.group(1)
+    
+    return None
+
+def make_corpus(size, note_ratio, seed=0):
+    """Build event descriptions shaped like real ones: mostly empty or plain text"""
+    rng = random.Random(seed)
+    words = "meeting agenda zoom link notes project review dial-in room lunch".split()
+    corpus = []
+    
+    for _ in range(size):
+        kind = rng.random()
+        if kind < 0.4:
+            corpus.append(None)
+            continue
+        
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(5, 200)))
+        if kind < 0.4 + note_ratio:
+            text += f"\n\n{NOTE_START}remember {rng.randint(0, 999)}{NOTE_END}"
+        corpus.append(text)
+    
+    return corpus
+
+def measure(func, corpus, repeat):
+    """Return the best milliseconds per pass over the corpus"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(corpus)
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare note extraction strategies over a synthetic event corpus'
+    )
+    parser.add_argument('--events', type=int, default=50000,
+                        help='Number of event descriptions in the corpus')
+    parser.add_argument('--note-ratio', type=float, default=0.05,
+                        help='Fraction of events that carry a note')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Passes per strategy; the best one is reported')
+    args = parser.parse_args()
+    
+    corpus = make_corpus(args.events, args.note_ratio)
+    assert extract_notes(corpus) == [original_extract(d) for d in corpus]
+    
+    strategies = [
+        ("original regex per event", lambda corpus: [original_extract(d) for d in corpus]),
+        ("codec per event", lambda corpus: [extract_note(d) for d in corpus]),
+        ("codec batched", extract_notes),
+    ]
+    
+    baseline = None
+    for name, func in strategies:
+        elapsed = measure(func, corpus, args.repeat)
+        baseline = baseline or elapsed
+        print(f"{name:25} {elapsed:8.2f} ms  ({baseline / elapsed:4.1f}x)")
+
+if __name__ == "__main__":
+    main()
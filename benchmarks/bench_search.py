@@ -0,0 +1,58 @@
+import argparse
+import statistics
+import time
+from datetime import date
+from app.services.search_index import SearchIndex
+from benchmarks.bench_events import make_calendars, YEAR
+
+QUERIES = ("event 4242", "series", "budget review", "meet", "e", "nothing")
+
+def timed(call, repeat):
+    """Return the milliseconds of each run"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        times.append((time.perf_counter() - started) * 1000)
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure building, updating and querying the event search index'
+    )
+    parser.add_argument('--events', type=int, default=50000,
+                        help='Events in the indexed calendar year')
+    parser.add_argument('--description-size', type=int, default=20,
+                        help='Average words in an event description')
+    parser.add_argument('--changed', type=int, default=20,
+                        help='Events changed by the simulated incremental sync')
+    parser.add_argument('--limit', type=int, default=100,
+                        help='Events returned per query')
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='Runs per query')
+    args = parser.parse_args()
+
+    items = next(iter(make_calendars(1, args.events, 0.3, 0.05, args.description_size).values()))
+    events = {event["id"]: event for event in items}
+    first_day, last_day = date(YEAR, 1, 1), date(YEAR, 12, 31)
+
+    started = time.perf_counter()
+    index = SearchIndex(events)
+    print(f"build    {len(index):6d} events {(time.perf_counter() - started) * 1000:9.1f} ms")
+
+    # An incremental sync hands out a new dict with a few replaced events
+    synced = dict(events)
+    for event in items[:args.changed]:
+        synced[event["id"]] = dict(event, summary="Rescheduled", etag='"2"')
+    started = time.perf_counter()
+    changed = index.update(synced)
+    print(f"update   {changed:6d} events {(time.perf_counter() - started) * 1000:9.1f} ms")
+
+    print(f"{'query':>14} {'matches':>8} {'p50':>9} {'max':>9}")
+    for query in QUERIES:
+        total = index.search(query, first_day, last_day, args.limit)[2]
+        times = timed(lambda: index.search(query, first_day, last_day, args.limit), args.repeat)
+        print(f"{query:>14} {total:8d} {statistics.median(times):6.2f} ms {max(times):6.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import http.client
+import statistics
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+def run_client(url, headers, deadline, latencies, statuses, lock):
+    """Send requests over one keep-alive connection until the deadline"""
+    parts = urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+
+    connection = connection_class(parts.netloc, timeout=60)
+    own_latencies = []
+    own_statuses = Counter()
+
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            connection.request("GET", path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            own_statuses[response.status] += 1
+        except (OSError, http.client.HTTPException) as e:
+            own_statuses[type(e).__name__] += 1
+            connection.close()
+            connection = connection_class(parts.netloc, timeout=60)
+            continue
+        own_latencies.append((time.perf_counter() - started) * 1000)
+
+    connection.close()
+    with lock:
+        latencies.extend(own_latencies)
+        statuses.update(own_statuses)
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure throughput and latency of a running server with concurrent clients'
+    )
+    parser.add_argument('--url', default='http://127.0.0.1:5000/api/config',
+                        help='URL to request (GET)')
+    parser.add_argument('--clients', type=int, default=32,
+                        help='Concurrent keep-alive connections')
+    parser.add_argument('--duration', type=float, default=10,
+                        help='Seconds to run')
+    parser.add_argument('--cookie',
+                        help='Cookie header to send, e.g. the session cookie of a logged in browser')
+    args = parser.parse_args()
+
+    headers = {"Accept-Encoding": "gzip"}
+    if args.cookie:
+        headers["Cookie"] = args.cookie
+
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+
+    threads = [
+        threading.Thread(target=run_client, args=(args.url, headers, deadline, latencies, statuses, lock))
+        for _ in range(args.clients)
+    ]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    print(f"{args.url} with {args.clients} clients for {elapsed:.1f} s")
+    print(f"requests:   {len(latencies):8d}")
+    print(f"throughput: {len(latencies) / elapsed:8.1f} req/s")
+    if latencies:
+        print(f"latency:    p50 {percentile(latencies, 0.50):.1f} ms, "
+              f"p95 {percentile(latencies, 0.95):.1f} ms, "
+              f"p99 {percentile(latencies, 0.99):.1f} ms, "
+              f"mean {statistics.mean(latencies):.1f} ms")
+    print(f"responses:  {dict(statuses)}")
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,13 @@
 import os
 import sys
-import logging
 from app import create_app
+from app.config import load_config
+from app.server import (
+    SERVE_MODES, server_settings, configure_logging, production_server, missing_packages,
+    serve_production, serve_asgi
+)
 import argparse
 
-# Configure logging for OAuth debugging
-os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'  # Allow OAuth over HTTP for development
-logging.basicConfig(level=logging.INFO)
-logging.getLogger('oauthlib').setLevel(logging.DEBUG)
-logging.getLogger('google.auth.transport.requests').setLevel(logging.DEBUG)
-
 def print_app_info():
     """Print information about the Big Ass Calendar application"""
     print("\nBig Ass Calendar Application")
@@ -21,16 +19,20 @@ def print_app_info():
     print("  Custom config file:             python run.py --config=path/to/config.yaml")
     print("  Custom Google credentials:      python run.py --google-client=path/to/credentials.json")
     print("  Both custom configs:            python run.py --config=path/to/config.yaml --google-client=path/to/credentials.json")
+    print("  Production server:              python run.py --serve=production --workers=4 --threads=8")
+    print("  Async (ASGI) server:            python run.py --serve=asgi")
     print("\nDefault behavior will look for:")
     print("  - config.yaml in the current directory")
     print("  - google_client.json in the current directory")
     print("\nSee README.md for detailed setup instructions.")
 
-def main():
+def create_parser():
     """
-    Main entry point for the application
+    Build the command line parser of the application
+    
+    Returns:
+        argparse.ArgumentParser
     """
-    # Set up command line argument parsing
     parser = argparse.ArgumentParser(
         description='Run the Big Ass Calendar application',
         formatter_class=argparse.RawTextHelpFormatter
@@ -44,9 +46,59 @@ def main():
                            'Default: ./google_client.json')
     parser.add_argument('--info', action='store_true',
                       help='Show application information and exit')
+    parser.add_argument('--serve', choices=SERVE_MODES,
+                      help='development: Flask debug server\n'
+                           'production: gunicorn (or waitress) with several workers\n'
+                           'asgi: uvicorn serving the async API routes\n'
+                           'Default: server.mode from the config file, else development')
+    parser.add_argument('--host',
+                      help='Address to listen on\n'
+                           'Default: 127.0.0.1')
+    parser.add_argument('--port', type=int,
+                      help='Port to listen on\n'
+                           'Default: 5000')
+    parser.add_argument('--workers', type=int,
+                      help='Production worker processes\n'
+                           'Default: 2')
+    parser.add_argument('--threads', type=int,
+                      help='Production threads per worker\n'
+                           'Default: 8')
+    
+    return parser
+
+def command_line_settings(args):
+    """
+    Combine the server section of the config file with the command line
     
+    Args:
+        args: Parsed command line arguments
+        
+    Returns:
+        Server settings, as returned by server_settings
+        
+    Raises:
+        ValueError: If a setting is invalid
+    """
+    # Command line options override the server section of the config file
+    try:
+        server_config = load_config(args.config).get("server", {})
+    except FileNotFoundError:
+        server_config = {}
+    
+    return server_settings(server_config, {
+        "mode": args.serve,
+        "host": args.host,
+        "port": args.port,
+        "workers": args.workers,
+        "threads": args.threads
+    })
+
+def main():
+    """
+    Main entry point for the application
+    """
     # Parse arguments
-    args = parser.parse_args()
+    args = create_parser().parse_args()
     
     # If --info flag is provided, show app info and exit
     if args.info:
@@ -70,6 +122,43 @@ def main():
         print(f"Error: Google client file not found at {google_client_path}")
         sys.exit(1)
     
+    try:
+        settings = command_line_settings(args)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    
+    # The production and asgi servers are separate packages
+    missing = missing_packages(settings["mode"])
+    if missing:
+        print(f"Error: {settings['mode']} mode needs {' and '.join(missing)}; "
+              f"install with: pip install {' '.join(missing)} (or pip install -r requirements.txt)")
+        sys.exit(1)
+    
+    configure_logging(settings["mode"])
+    url = f"http://{settings['host']}:{settings['port']}"
+    
+    if settings["mode"] == "production":
+        server = production_server()
+        
+        workers = settings["workers"] if server == "gunicorn" else 1
+        print(f"\nServing {url} with {server}: {workers} worker(s) x {settings['threads']} threads")
+        
+        # Workers build their own app so nothing is shared across a fork
+        serve_production(lambda: create_app(config_path, google_client_path), settings)
+        return
+    
+    if settings["mode"] == "asgi":
+        from app.asgi import create_asgi_app
+        
+        print(f"\nServing {url} with uvicorn (async API routes, {settings['threads']} threads for the rest)")
+        try:
+            serve_asgi(lambda threads: create_asgi_app(config_path, google_client_path, threads), settings)
+        except RuntimeError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        return
+    
     # Create the Flask app with optional config paths
     app = create_app(config_path, google_client_path)
     
@@ -77,10 +166,10 @@ def main():
     debug = app.config.get('DEBUG', False)
     
     # Show where the app is running
-    print(f"\nRunning on http://127.0.0.1:5000 (Press CTRL+C to quit)")
+    print(f"\nRunning on {url} (Press CTRL+C to quit)")
     print(f"Debug mode: {'on' if debug else 'off'}")
     
-    app.run(debug=debug)
+    app.run(host=settings["host"], port=settings["port"], debug=debug, threaded=True)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
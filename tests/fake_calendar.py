@@ -0,0 +1,466 @@
+from datetime import date, datetime, timedelta
+from googleapiclient.errors import HttpError
+from app.services.event_cache import MemoryEventCache
+import asyncio
+import httplib2
+import json
+import threading
+import time
+import urllib.parse
+
+
+def make_http_error(status, message=""):
+    """Build the HttpError the API client raises for an error status"""
+    return HttpError(httplib2.Response({"status": status}), message.encode("utf-8"))
+
+def make_rate_limit_error(status=429, reason="rateLimitExceeded", retry_after=None):
+    """Build the HttpError Google answers with when a rate limit is hit"""
+    headers = {"status": status}
+    if retry_after is not None:
+        headers["retry-after"] = str(retry_after)
+    content = json.dumps({"error": {
+        "code": status, "message": "Rate Limit Exceeded",
+        "errors": [{"domain": "usageLimits", "reason": reason, "message": "Rate Limit Exceeded"}]
+    }})
+    return HttpError(httplib2.Response(headers), content.encode("utf-8"))
+
+def make_event(event_id, start, end=None, summary=None, **extra):
+    """
+    Build an event resource shaped like the Calendar API returns it.
+
+    Args:
+        event_id: ID of the event
+        start: Date ("2025-01-01") or datetime ("2025-01-01T09:00:00Z") string
+        end: End date or datetime string; defaults to a one day/one hour event
+        summary: Event title, defaults to the event ID
+        extra: Additional event fields such as description
+
+    Returns:
+        Event dictionary
+    """
+    if "T" in start:
+        if end is None:
+            end = (datetime.fromisoformat(start.replace("Z", "+00:00")) + timedelta(hours=1)).isoformat()
+        event = {"start": {"dateTime": start}, "end": {"dateTime": end}}
+    else:
+        # All-day events end on the day after their last day
+        if end is None:
+            end = (date.fromisoformat(start) + timedelta(days=1)).isoformat()
+        event = {"start": {"date": start}, "end": {"date": end}}
+
+    event["id"] = event_id
+    event["etag"] = '"1"'
+    event["summary"] = summary or event_id
+    event.update(extra)
+    return event
+
+
+class FakeRequest:
+    def __init__(self, service, calendar_id, handler):
+        self.service = service
+        self.calendar_id = calendar_id
+        self.handler = handler
+        self.headers = {}
+
+    def execute(self):
+        with self.service._lock:
+            self.service.in_flight += 1
+            self.service.peak_in_flight = max(self.service.peak_in_flight, self.service.in_flight)
+        try:
+            delay = self.service.delays.get(self.calendar_id, self.service.latency)
+            if delay:
+                time.sleep(delay)
+
+            return self.run()
+        finally:
+            with self.service._lock:
+                self.service.in_flight -= 1
+
+    def run(self):
+        failure = self.service.failures.get(self.calendar_id)
+        if failure is not None:
+            raise failure
+
+        with self.service._lock:
+            transient = self.service.transient_errors.get(self.calendar_id)
+            error = transient.pop(0) if transient else None
+        if error is not None:
+            raise error
+
+        return self.handler(self)
+
+
+class FakeBatch:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self.requests.append((request_id, request, callback or self.callback))
+
+    def execute(self):
+        # One round trip for the whole batch
+        self.service.record("batch", None, {"size": len(self.requests)})
+        if self.service.latency:
+            time.sleep(self.service.latency)
+
+        for request_id, request, callback in self.requests:
+            try:
+                response = request.run()
+            except Exception as e:
+                callback(request_id, None, e)
+            else:
+                callback(request_id, response, None)
+
+
+class FakeEventsResource:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, calendarId, **params):
+        self.service.record("events.list", calendarId, params)
+
+        def handler(request):
+            if params.get("syncToken"):
+                events = self.service.changes_since(calendarId, params["syncToken"])
+            else:
+                events = [
+                    event for event in self.service.calendars.get(calendarId, [])
+                    if _in_range(event, params.get("timeMin"), params.get("timeMax"))
+                ]
+            
+            # Paginate the same way the API does, with opaque page tokens
+            page_size = params.get("maxResults", 250)
+            offset = int(params.get("pageToken") or 0)
+            result = {"items": [dict(event) for event in events[offset:offset + page_size]]}
+            if offset + page_size < len(events):
+                result["nextPageToken"] = str(offset + page_size)
+            else:
+                result["nextSyncToken"] = f"{calendarId}|{self.service.versions.get(calendarId, 0)}"
+            return result
+
+        return FakeRequest(self.service, calendarId, handler)
+
+    def get(self, calendarId, eventId, **params):
+        self.service.record("events.get", calendarId, dict(params, eventId=eventId))
+
+        def handler(request):
+            return dict(self.service.find_event(calendarId, eventId))
+
+        return FakeRequest(self.service, calendarId, handler)
+
+    def patch(self, calendarId, eventId, body, **params):
+        self.service.record("events.patch", calendarId, dict(params, eventId=eventId, body=body))
+
+        def handler(request):
+            with self.service._lock:
+                event = dict(self.service.find_event(calendarId, eventId))
+                if_match = request.headers.get("If-Match")
+                if if_match is not None and if_match != event.get("etag"):
+                    raise make_http_error(412, "Precondition Failed")
+
+                event.update(body)
+                version = int(event.get("etag", '"0"').strip('"')) + 1
+                event["etag"] = f'"{version}"'
+            self.service.update_event(calendarId, event)
+            return dict(event)
+
+        return FakeRequest(self.service, calendarId, handler)
+
+    def watch(self, calendarId, body, **params):
+        self.service.record("events.watch", calendarId, dict(params, body=body))
+
+        def handler(request):
+            ttl = int(body.get("params", {}).get("ttl", 604800))
+            channel = dict(body, calendarId=calendarId, resourceId=f"resource-{calendarId}",
+                           expiration=str(int((time.time() + ttl) * 1000)))
+            with self.service._lock:
+                self.service.watch_channels[body["id"]] = channel
+            return {"kind": "api#channel", "id": body["id"], "resourceId": channel["resourceId"],
+                    "expiration": channel["expiration"]}
+
+        return FakeRequest(self.service, calendarId, handler)
+
+
+class FakeChannelsResource:
+    def __init__(self, service):
+        self.service = service
+
+    def stop(self, body):
+        self.service.record("channels.stop", None, {"body": body})
+
+        def handler(request):
+            with self.service._lock:
+                self.service.watch_channels.pop(body["id"], None)
+            return {}
+
+        return FakeRequest(self.service, None, handler)
+
+
+class FakeCalendarListResource:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, **params):
+        self.service.record("calendarList.list", None, params)
+
+        def handler(request):
+            if params.get("syncToken"):
+                entries = self.service.changes_since("", params["syncToken"])
+            else:
+                entries = self.service.calendar_list
+
+            page_size = params.get("maxResults", 100)
+            offset = int(params.get("pageToken") or 0)
+            result = {"items": [dict(entry) for entry in entries[offset:offset + page_size]]}
+            if offset + page_size < len(entries):
+                result["nextPageToken"] = str(offset + page_size)
+            else:
+                result["nextSyncToken"] = f"|{self.service.versions.get('', 0)}"
+            return result
+
+        return FakeRequest(self.service, None, handler)
+
+
+class ProbeEventCache(MemoryEventCache):
+    """
+    Memory cache that records how its reads are made.
+
+    Each read waits, up to timeout seconds, until `parties` reads of the
+    same kind are in flight, the way a busy database holds them. Reads made
+    on the event loop cannot overlap, so they only get through on the
+    timeout. The peak number of concurrent reads of each kind and the reads
+    made on an event loop thread are recorded.
+
+    Args:
+        parties: Reads of a kind that have to be in flight before they proceed
+        timeout: Seconds a read waits for the others
+    """
+
+    def __init__(self, parties=1, timeout=1.0):
+        super().__init__()
+        self.parties = parties
+        self.timeout = timeout
+        self.in_flight = {}
+        self.peak = {}
+        self.loop_reads = []
+        self._gates = {}
+        self._probe_lock = threading.Lock()
+
+    def get(self, key):
+        return self._probe("get", super().get, key)
+
+    def get_calendar_list(self, user_key):
+        return self._probe("get_calendar_list", super().get_calendar_list, user_key)
+
+    def _probe(self, name, read, *args):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            self.loop_reads.append(name)
+
+        with self._probe_lock:
+            self.in_flight[name] = self.in_flight.get(name, 0) + 1
+            self.peak[name] = max(self.peak.get(name, 0), self.in_flight[name])
+            gate = self._gates.setdefault(name, threading.Event())
+            if self.in_flight[name] >= self.parties:
+                gate.set()
+        try:
+            gate.wait(self.timeout)
+            return read(*args)
+        finally:
+            with self._probe_lock:
+                self.in_flight[name] -= 1
+
+
+class FakeCalendarService:
+    """
+    In-memory stand-in for the Google Calendar API service object.
+    
+    Mimics the parts of the discovery-based client used by the calendar
+    service and can inject latency and failures per calendar.
+
+    Args:
+        calendars: Dict mapping calendar ID to its list of events
+        latency: Seconds every request sleeps before answering
+        delays: Dict mapping calendar ID to a latency overriding the default
+        failures: Dict mapping calendar ID to an exception raised on execute
+        calendar_list: Calendar list entries returned by calendarList
+        transient_errors: Dict mapping calendar ID to a list of exceptions
+                          raised by its next requests, one per request
+    """
+
+    def __init__(self, calendars=None, latency=0.0, delays=None, failures=None, calendar_list=None,
+                 transient_errors=None):
+        self.calendars = calendars or {}
+        self.transient_errors = transient_errors or {}
+        self.calendar_list = calendar_list or []
+        self.latency = latency
+        self.delays = delays or {}
+        self.failures = failures or {}
+        self.calls = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.versions = {}
+        self.changes = {}
+        self.min_sync_version = {}
+        self.watch_channels = {}
+        self._message_numbers = {}
+        self._lock = threading.Lock()
+
+    def find_event(self, calendar_id, event_id):
+        for event in self.calendars.get(calendar_id, []):
+            if event["id"] == event_id:
+                return event
+        raise make_http_error(404, "Not Found")
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+    def update_event(self, calendar_id, event):
+        """Add or replace an event, recording the change for incremental sync"""
+        with self._lock:
+            events = self.calendars.setdefault(calendar_id, [])
+            position = next(
+                (index for index, existing in enumerate(events) if existing["id"] == event["id"]),
+                len(events)
+            )
+            events[position:position + 1] = [event]
+            self._log_change(calendar_id, event)
+
+    def delete_event(self, calendar_id, event_id):
+        """Remove an event, recording a cancellation for incremental sync"""
+        with self._lock:
+            events = self.calendars.get(calendar_id, [])
+            events[:] = [existing for existing in events if existing["id"] != event_id]
+            self._log_change(calendar_id, {"id": event_id, "status": "cancelled"})
+
+    def update_calendar(self, entry):
+        """Add or replace a calendar list entry, recording the change for incremental sync"""
+        with self._lock:
+            self.calendar_list = [
+                existing for existing in self.calendar_list if existing["id"] != entry["id"]
+            ] + [entry]
+            self._log_change("", entry)
+
+    def remove_calendar(self, calendar_id):
+        """Remove a calendar list entry, recording a deletion for incremental sync"""
+        with self._lock:
+            self.calendar_list = [entry for entry in self.calendar_list if entry["id"] != calendar_id]
+            self._log_change("", {"id": calendar_id, "deleted": True})
+
+    def expire_sync_tokens(self, calendar_id):
+        """Make every sync token issued so far fail with 410 Gone"""
+        with self._lock:
+            self.min_sync_version[calendar_id] = self.versions.get(calendar_id, 0)
+
+    def changes_since(self, calendar_id, sync_token):
+        token_calendar, version = sync_token.rsplit("|", 1)
+        version = int(version)
+        if token_calendar != calendar_id or version < self.min_sync_version.get(calendar_id, 0):
+            raise make_http_error(410, "Sync token is no longer valid")
+
+        # Latest state of every event changed after the token was issued
+        changed = {}
+        for change_version, event in self.changes.get(calendar_id, []):
+            if change_version > version:
+                changed[event["id"]] = event
+        return list(changed.values())
+
+    def _log_change(self, calendar_id, event):
+        self.versions[calendar_id] = self.versions.get(calendar_id, 0) + 1
+        self.changes.setdefault(calendar_id, []).append((self.versions[calendar_id], dict(event)))
+
+    def notify(self, calendar_id, post, state="exists"):
+        """
+        Post a push notification to every channel watching a calendar, the
+        way Google pings a webhook when the calendar changes.
+
+        Args:
+            calendar_id: ID of the calendar that changed
+            post: Callable taking (address, headers) that delivers the ping
+            state: X-Goog-Resource-State ("sync", "exists" or "not_exists")
+
+        Returns:
+            List of whatever post returned, one per channel
+        """
+        with self._lock:
+            channels = [channel for channel in self.watch_channels.values() if channel["calendarId"] == calendar_id]
+            for channel in channels:
+                self._message_numbers[channel["id"]] = self._message_numbers.get(channel["id"], 0) + 1
+
+        return [post(channel["address"], {
+            "X-Goog-Channel-ID": channel["id"],
+            "X-Goog-Channel-Token": channel.get("token", ""),
+            "X-Goog-Channel-Expiration": channel["expiration"],
+            "X-Goog-Resource-ID": channel["resourceId"],
+            "X-Goog-Resource-URI": f"https://www.googleapis.com/calendar/v3/calendars/{calendar_id}/events",
+            "X-Goog-Resource-State": state,
+            "X-Goog-Message-Number": str(self._message_numbers[channel["id"]])
+        }) for channel in channels]
+
+    def record(self, method, calendar_id, params):
+        with self._lock:
+            self.calls.append((method, calendar_id, params))
+
+    def events(self):
+        return FakeEventsResource(self)
+
+    def calendarList(self):
+        return FakeCalendarListResource(self)
+
+    def channels(self):
+        return FakeChannelsResource(self)
+
+
+class FakeTransport:
+    """
+    Stand-in for an httplib2.Http transport that answers Calendar API
+    events.list calls, for exercising the real client library without a
+    network. Every transport created is recorded, so tests can count the
+    connections a workload would open.
+
+    Args:
+        calendars: Dict mapping calendar ID to its list of events
+        latency: Seconds every request sleeps before answering
+        connect_latency: Seconds the first request additionally sleeps, as
+                         opening the connection (TCP and TLS) would take
+        created: List the new transport is appended to
+    """
+
+    def __init__(self, calendars, latency=0.0, connect_latency=0.0, created=None):
+        self.calendars = calendars
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.timeout = None
+        self.requests = 0
+        if created is not None:
+            created.append(self)
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        self.requests += 1
+        delay = self.latency + (self.connect_latency if self.requests == 1 else 0)
+        if delay:
+            time.sleep(delay)
+
+        path = urllib.parse.urlparse(uri).path
+        calendar_id = urllib.parse.unquote(path.split("/calendars/")[1].split("/")[0])
+        content = json.dumps({
+            "items": self.calendars.get(calendar_id, []),
+            "nextSyncToken": f"sync-{calendar_id}",
+        })
+        return httplib2.Response({"status": "200", "content-type": "application/json"}), content.encode("utf-8")
+
+
+def _in_range(event, time_min, time_max):
+    # Date-level overlap check, precise enough for the fake
+    start = event["start"].get("dateTime") or event["start"].get("date")
+    end = event["end"].get("dateTime") or event["end"].get("date")
+    if time_min and end[:10] < time_min[:10]:
+        return False
+    if time_max and start[:10] > time_max[:10]:
+        return False
+    return True
@@ -0,0 +1,123 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl, unquote
+from googleapiclient.errors import HttpError
+import json
+import re
+import threading
+
+
+class FakeCalendarServer:
+    """
+    Local HTTP server speaking the Calendar REST API, backed by a
+    FakeCalendarService so both the threaded and the async implementation
+    see the same data, latency and failures.
+
+    Args:
+        service: FakeCalendarService holding the calendars
+        calendar_list: Calendar list entries returned by calendarList
+        list_page_size: Calendar list entries per page
+
+    Use as a context manager; `base_url` is the API root to pass to the
+    async calendar service.
+    """
+
+    def __init__(self, service, calendar_list=None, list_page_size=2):
+        self.service = service
+        if calendar_list is not None:
+            service.calendar_list = calendar_list
+        self.list_page_size = list_page_size
+        self.requests = []
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/calendar/v3"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                self.dispatch("GET")
+
+            def do_PATCH(self):
+                self.dispatch("PATCH")
+
+            def dispatch(self, method):
+                url = urlsplit(self.path)
+                params = dict(parse_qsl(url.query))
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                fake.requests.append((method, url.path, params, dict(self.headers)))
+
+                if not self.headers.get("Authorization", "").startswith("Bearer "):
+                    return self.reply(401, {"error": {"code": 401, "message": "Login Required"}})
+
+                try:
+                    result = self.route(method, url.path, params, body)
+                except HttpError as e:
+                    try:
+                        error = json.loads(e.content)
+                    except ValueError:
+                        error = {"error": {"code": e.resp.status, "message": str(e)}}
+                    return self.reply(e.resp.status, error, e.resp.get("retry-after"))
+                except Exception as e:
+                    return self.reply(500, {"error": {"code": 500, "message": str(e)}})
+
+                if result is None:
+                    return self.reply(404, {"error": {"code": 404, "message": "Not Found"}})
+                self.reply(200, result)
+
+            def route(self, method, path, params, body):
+                events = fake.service.events()
+
+                if method == "GET" and path == "/calendar/v3/users/me/calendarList":
+                    params["maxResults"] = fake.list_page_size
+                    return fake.service.calendarList().list(**params).execute()
+
+                found = re.fullmatch(r"/calendar/v3/calendars/([^/]+)/events(?:/([^/]+))?", path)
+                if found is None:
+                    return None
+                calendar_id = unquote(found.group(1))
+                event_id = unquote(found.group(2)) if found.group(2) else None
+
+                if "maxResults" in params:
+                    params["maxResults"] = int(params["maxResults"])
+
+                if method == "GET" and event_id is None:
+                    return events.list(calendarId=calendar_id, **params).execute()
+                if method == "GET":
+                    return events.get(calendarId=calendar_id, eventId=event_id, **params).execute()
+
+                request = events.patch(calendarId=calendar_id, eventId=event_id, body=body, **params)
+                if self.headers.get("If-Match"):
+                    request.headers["If-Match"] = self.headers["If-Match"]
+                return request.execute()
+
+            def reply(self, status, payload, retry_after=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                if retry_after is not None:
+                    self.send_header("Retry-After", retry_after)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
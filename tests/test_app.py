@@ -2,9 +2,18 @@ import pytest
 import os
 import yaml
 import json
+import gzip
+import socket
 import tempfile
+import time
+from flask import Flask
 from app import create_app
+from app.routes import calendar as calendar_routes
+from app.services import calendar_service, prefetch
+from app.services.prefetch import YearPrefetcher
+from app.services.search_index import SEARCH_DOCUMENTS_INDEXED
 from flask import session
+from tests.fake_calendar import FakeCalendarService, make_event
 
 @pytest.fixture
 def test_config():
@@ -22,6 +31,16 @@ def test_config():
             "app": {
                 "title": "Test Calendar",
                 "default_year": 2025
+            },
+            "token_store": {
+                "backend": "memory"
+            },
+            "prefetch": {
+                "enabled": False
+            },
+            "metrics": {
+                "enabled": True,
+                "token": "metrics-token"
             }
         }
         yaml.dump(config, f)
@@ -95,6 +114,30 @@ def app(app_with_both_configs):
 def client(app):
     return app.test_client()
 
+@pytest.fixture
+def fake_service(monkeypatch):
+    """Route Google Calendar API calls to an in-memory fake"""
+    service = FakeCalendarService(calendars={
+        "primary": [make_event("e1", "2025-01-10", summary="Dentist")],
+    })
+    monkeypatch.setattr(calendar_service, "get_calendar_service", lambda credentials: service)
+    monkeypatch.setattr(calendar_routes, "get_calendar_service", lambda credentials: service)
+    return service
+
+@pytest.fixture
+def auth_client(client):
+    """Test client with Google credentials in the session"""
+    with client.session_transaction() as sess:
+        sess["credentials"] = {
+            "token": "test-token",
+            "refresh_token": "test-refresh-token",
+            "token_uri": "https://oauth2.googleapis.com/token",
+            "client_id": "test-json-client-id",
+            "client_secret": "test-json-client-secret",
+            "scopes": ["https://www.googleapis.com/auth/calendar.readonly"]
+        }
+    return client
+
 def test_index_route(client):
     response = client.get("/")
     assert response.status_code == 200
@@ -130,32 +173,410 @@ def test_check_auth_unauthenticated(client):
 def test_login_redirect(client):
     response = client.get("/login")
     assert response.status_code == 302  # Redirect to Google OAuth
+
+def test_events_requires_auth(client):
+    response = client.get("/api/events?year=2025&calendar_id=primary")
+    assert response.status_code == 401
+
+def test_events_reports_failed_calendars(auth_client, fake_service):
+    fake_service.failures = {"broken": RuntimeError("boom")}
+    
+    response = auth_client.get("/api/events?year=2025&calendar_id=primary&calendar_id=broken")
+    assert response.status_code == 200
+    assert json.loads(response.headers["X-Calendar-Errors"]) == {"broken": "boom"}
+    data = response.get_json()
+    assert data["errors"] == {"broken": "boom"}
+    assert data["events"][0]["summary"] == "Dentist"
+
+def test_events_compact_format(auth_client, fake_service):
+    fake_service.calendars["primary"].append(make_event("trip", "2025-02-01", "2025-02-22"))
+    
+    data = auth_client.get("/api/events?year=2025&calendar_id=primary").get_json()
+    assert data["year"] == 2025
+    assert [event["id"] for event in data["events"]] == ["e1", "trip"]
+    assert data["events"][1]["span"] == [31, 51]
+    assert data["days"]["9"] == [0]
+    assert all(data["days"][str(day)] == [1] for day in range(31, 52))
+
+def test_events_legacy_format(auth_client, fake_service):
+    response = auth_client.get("/api/events?year=2025&calendar_id=primary&format=legacy")
+    data = response.get_json()
+    assert list(data) == ["2025-01-10"]
+    assert data["2025-01-10"][0]["isFirstDay"] is True
+    
+    response = auth_client.get("/api/events?year=2025&calendar_id=primary&format=xml")
+    assert response.status_code == 400
+
+def test_events_stream_one_line_per_calendar(auth_client, fake_service):
+    fake_service.failures = {"broken": RuntimeError("boom")}
+    
+    response = auth_client.get("/api/events?year=2025&calendar_id=primary&calendar_id=broken&stream=1")
+    assert response.mimetype == "application/x-ndjson"
+    chunks = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    
+    assert [chunk["type"] for chunk in chunks] == ["calendar", "done"]
+    assert chunks[0]["calendarId"] == "primary"
+    assert chunks[0]["events"][0]["id"] == "e1" and chunks[0]["days"] == {"9": [0]}
+    assert chunks[1]["errors"] == {"broken": "boom"}
+    
+    response = auth_client.get("/api/events?year=2025&calendar_id=primary&stream=1&format=legacy")
+    assert response.status_code == 400
+
+def test_events_conditional_get(auth_client, fake_service):
+    response = auth_client.get("/api/events?year=2025&calendar_id=primary&detail=full")
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "private, no-cache"
+    
+    response = auth_client.get("/api/events?year=2025&calendar_id=primary&detail=full",
+                               headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.get_data() == b""
+    
+    # A changed note changes the tag
+    auth_client.put("/api/events/e1/note?calendar_id=primary", json={"note": "Bring forms"})
+    response = auth_client.get("/api/events?year=2025&calendar_id=primary&detail=full",
+                               headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+def test_large_responses_are_gzipped(auth_client, fake_service):
+    fake_service.calendars["primary"] = [make_event(f"e{i}", "2025-01-10") for i in range(100)]
+    url = "/api/events?year=2025&calendar_id=primary"
+    
+    plain = auth_client.get(url)
+    assert "Content-Encoding" not in plain.headers
+    
+    compressed = auth_client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in compressed.headers["Vary"]
+    assert gzip.decompress(compressed.get_data()) == plain.get_data()
+    
+    # Any variant's tag validates the others
+    response = auth_client.get(url, headers={"If-None-Match": compressed.headers["ETag"]})
+    assert response.status_code == 304
+    
+    stream = auth_client.get(url + "&stream=1", headers={"Accept-Encoding": "gzip"})
+    lines = gzip.decompress(stream.get_data()).decode("utf-8").splitlines()
+    assert [json.loads(line)["type"] for line in lines] == ["calendar", "done"]
+
+def test_batch_note_update(auth_client, fake_service):
+    response = auth_client.post("/api/notes:batch", json={"notes": [
+        {"calendar_id": "primary", "event_id": "e1", "note": "Bring forms"},
+        {"calendar_id": "primary", "event_id": "nope", "note": "x"},
+    ]})
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert [result["success"] for result in results] == [True, False]
+    
+    data = auth_client.get("/api/events/day/2025-01-10?calendar_id=primary").get_json()
+    assert data["events"][0]["note"] == "Bring forms"
+    
+    response = auth_client.post("/api/notes:batch", json={"notes": [{"event_id": "e1"}]})
+    assert response.status_code == 400
+
+def test_calendar_list_is_cached_and_colors_events(auth_client, fake_service):
+    fake_service.calendar_list = [
+        {"id": "me@example.com", "summary": "Me", "primary": True, "backgroundColor": "#ff0000",
+         "accessRole": "owner"},
+        {"id": "holidays", "summary": "Holidays", "accessRole": "reader"},
+    ]
+    fake_service.calendars["holidays"] = [make_event("h1", "2025-12-25")]
+    
+    calendars = auth_client.get("/api/calendars").get_json()
+    assert [calendar["id"] for calendar in calendars] == ["me@example.com", "holidays"]
+    assert auth_client.get("/api/calendars").get_json() == calendars
+    
+    data = auth_client.get("/api/events?year=2025&calendar_id=primary&calendar_id=holidays").get_json()
+    assert data["calendars"]["primary"]["backgroundColor"] == "#ff0000"
+    assert data["calendars"]["holidays"]["accessRole"] == "reader"
+    # Listed once; the events request used the cached list
+    assert [call[0] for call in fake_service.calls].count("calendarList.list") == 1
+    
+    # Notes cannot be written to read-only calendars
+    fake_service.calls.clear()
+    response = auth_client.put("/api/events/h1/note?calendar_id=holidays", json={"note": "x"})
+    assert response.status_code == 403
+    results = auth_client.post("/api/notes:batch", json={"notes": [
+        {"calendar_id": "holidays", "event_id": "h1", "note": "x"},
+        {"calendar_id": "primary", "event_id": "e1", "note": "Bring forms"},
+    ]}).get_json()["results"]
+    assert [(result["success"], result.get("status")) for result in results] == [(False, 403), (True, None)]
+    assert "holidays" not in [call[1] for call in fake_service.calls]
+
+def test_events_are_served_when_the_calendar_list_cannot_be_fetched(auth_client, fake_service, monkeypatch):
+    def unreachable(credentials):
+        raise socket.gaierror(-2, "Name or service not known")
+    
+    monkeypatch.setattr(calendar_routes, "get_calendar_service", unreachable)
+    
+    response = auth_client.get("/api/events?year=2025&calendar_id=primary")
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["calendars"] == {}
+    assert data["errors"] == {}
+
+def test_read_only_calendars_are_cached_once_for_all_users(app, fake_service):
+    fake_service.calendar_list = [{"id": "holidays", "summary": "Holidays", "accessRole": "reader"}]
+    fake_service.calendars["holidays"] = [make_event("h1", "2025-12-25")]
+    
+    def login(refresh_token):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess["credentials"] = {
+                "token": f"{refresh_token}-token",
+                "refresh_token": refresh_token,
+                "token_uri": "https://oauth2.googleapis.com/token",
+                "client_id": "test-json-client-id",
+                "client_secret": "test-json-client-secret"
+            }
+        return client
+    
+    def holiday_loads():
+        return [call[:2] for call in fake_service.calls].count(("events.list", "holidays"))
+    
+    for user in ("alice", "bob", "carol"):
+        client = login(user)
+        client.get("/api/calendars")
+        data = client.get("/api/events?year=2025&calendar_id=holidays").get_json()
+        assert [event["id"] for event in data["events"]] == ["h1"]
+    assert holiday_loads() == 1
+    
+    # Without a calendar list showing access, a user reads Google themselves
+    login("dave").get("/api/events?year=2025&calendar_id=holidays")
+    assert holiday_loads() == 2
+
+def test_push_notifications_keep_the_cache_fresh(app, auth_client, fake_service, monkeypatch):
+    from urllib.parse import urlparse
+    from app.services import channels
+    from app.services.channels import ChannelManager
+    monkeypatch.setattr(channels, "get_calendar_service", lambda credentials: fake_service)
+    
+    assert auth_client.post("/api/notifications").status_code == 404
+    manager = app.extensions["channels"] = ChannelManager(
+        app.extensions["event_cache"], "https://calendar.example.com/api/notifications", app.config["SECRET_KEY"]
+    )
+    
+    def ids():
+        return [event["id"] for event in auth_client.get("/api/events?year=2025&calendar_id=primary").get_json()["events"]]
+    
+    try:
+        assert ids() == ["e1"]
+        # Wait for the channel and the resync that follows its opening
+        deadline = time.monotonic() + 2
+        while not any("syncToken" in call[2] for call in fake_service.calls) or manager._resyncs:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        
+        # Served from the cache between notifications, however old it is
+        fake_service.update_event("primary", make_event("e2", "2025-02-01"))
+        app.config["CACHE_SYNC_INTERVAL"] = 0
+        assert ids() == ["e1"]
+        
+        responses = fake_service.notify("primary", lambda address, headers: auth_client.post(
+            urlparse(address).path, headers=headers
+        ))
+        assert [response.status_code for response in responses] == [204]
+        assert ids() == ["e1", "e2"]
+        
+        assert auth_client.post("/api/notifications", headers={
+            "X-Goog-Channel-Token": "forged.token", "X-Goog-Resource-State": "exists"
+        }).status_code == 403
+        
+        # Logging out closes the channels renewed with the user's credentials
+        auth_client.get("/logout")
+        assert manager.channels() == []
+    finally:
+        manager.shutdown()
+
+def test_events_for_a_date_range(auth_client, fake_service):
+    fake_service.calendars["primary"].append(make_event("ny", "2025-12-31", "2026-01-02"))
+    
+    data = auth_client.get("/api/events?start=2025-12-15&end=2026-01-15&calendar_id=primary").get_json()
+    assert (data["start"], data["end"]) == ("2025-12-15", "2026-01-15")
+    assert [event["id"] for event in data["events"]] == ["ny"]
+    assert data["events"][0]["span"] == [16, 17]
+    
+    for query in ("start=2025-01-01", "start=2025-01-01&end=soon", "start=2025-02-01&end=2025-01-01",
+                  "start=2020-01-01&end=2025-01-01", "start=2025-01-01&end=2025-02-01&stream=1"):
+        assert auth_client.get(f"/api/events?{query}&calendar_id=primary").status_code == 400
+
+def test_search_finds_titles_and_notes(auth_client, fake_service):
+    fake_service.calendars["primary"].append(make_event("e2", "2025-03-01", "2025-03-03", summary="Dental conference"))
+    
+    def search(query):
+        return auth_client.get(f"/api/search?q={query}&year=2025&calendar_id=primary").get_json()
+    
+    data = search("dent")
+    assert [event["id"] for event in data["events"]] == ["e1", "e2"]
+    assert data["dates"] == ["2025-01-10", "2025-03-01", "2025-03-02"]
+    assert (data["query"], data["year"], data["total"]) == ("dent", 2025, 2)
+    
+    # A note write reindexes the one event instead of rebuilding the year
+    indexed = SEARCH_DOCUMENTS_INDEXED.value()
+    auth_client.put("/api/events/e1/note?calendar_id=primary", json={"note": "Crown fitting", "etag": '"1"'})
+    assert [event["id"] for event in search("crown")["events"]] == ["e1"]
+    assert SEARCH_DOCUMENTS_INDEXED.value() == indexed + 1
+    
+    for query in ("", "q=%20", "q=x&year=soon", "q=x&limit=0", "q=x&limit=5000"):
+        assert auth_client.get(f"/api/search?{query}&calendar_id=primary").status_code == 400
+    assert auth_client.get("/api/search?q=x").status_code == 400
+
+def test_note_update_refreshes_cache(auth_client, fake_service):
+    auth_client.get("/api/events?year=2025&calendar_id=primary")
+    data = auth_client.get("/api/events/day/2025-01-10?calendar_id=primary").get_json()
+    event = data["events"][0]
+    fake_service.calls.clear()
+    
+    response = auth_client.put(
+        f"/api/events/{event['id']}/note?calendar_id=primary",
+        json={"note": "Bring forms", "etag": event["etag"]}
+    )
+    assert response.status_code == 200
+    # The cached description was used, so Google only saw the write
+    assert [call[0] for call in fake_service.calls] == ["events.patch"]
+    
+    fake_service.calls.clear()
+    data = auth_client.get("/api/events?year=2025&calendar_id=primary&detail=full").get_json()
+    assert data["events"][0]["note"] == "Bring forms"
+    assert data["events"][0]["etag"] == response.get_json()["etag"]
+    # The cache was updated in place and only asked Google for changes
+    assert all(call[2].get("syncToken") for call in fake_service.calls)
+
+def test_overview_is_slim_and_days_come_from_cache(auth_client, fake_service):
+    fake_service.calendars["primary"] = [
+        make_event("e1", "2025-01-10", description="Long agenda", location="Room 1"),
+        make_event("trip", "2025-01-09", "2025-01-12"),
+        make_event("e2", "2025-01-11T09:00:00Z"),
+    ]
+    
+    data = auth_client.get("/api/events?year=2025&calendar_id=primary").get_json()
+    assert set(data["events"][0]) == {"id", "calendarId", "summary", "start", "end", "span"}
+    fake_service.calls.clear()
+    
+    data = auth_client.get("/api/events/day/2025-01-10?calendar_id=primary").get_json()
+    assert [event["id"] for event in data["events"]] == ["trip", "e1"]
+    assert data["events"][1]["description"] == "Long agenda"
+    assert data["events"][0]["span"] == [8, 10]
+    assert fake_service.calls == []
+    
+    response = auth_client.get("/api/events/day/2025-13-01?calendar_id=primary")
+    assert response.status_code == 400
+
+def test_adjacent_years_are_prefetched(app, auth_client, fake_service, monkeypatch):
+    from app.services import prefetch
+    from app.services.prefetch import YearPrefetcher
+    monkeypatch.setattr(prefetch, "get_calendar_service", lambda credentials: fake_service)
+    prefetcher = app.extensions["prefetcher"] = YearPrefetcher()
+    fake_service.calendars["primary"].append(make_event("next", "2026-03-01"))
+    
+    assert auth_client.get("/api/events?year=2025&calendar_id=primary").status_code == 200
+    deadline = time.monotonic() + 5
+    while prefetcher.pending() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    fake_service.calls.clear()
+    
+    # The next year comes straight from the cache
+    data = auth_client.get("/api/events?year=2026&calendar_id=primary").get_json()
+    assert [event["id"] for event in data["events"]] == ["next"]
+    assert fake_service.calls == []
+    prefetcher.shutdown()
+
+def test_events_report_server_timing_and_metrics(auth_client, fake_service):
+    from app.metrics import GOOGLE_REQUESTS
+    calls_before = GOOGLE_REQUESTS.value(method="events.list", status=200)
+    
+    response = auth_client.get("/api/events?year=2025&calendar_id=primary")
+    stages = [part.split(";")[0] for part in response.headers["Server-Timing"].split(", ")]
+    assert stages[:3] == ["google", "notes", "bucketing"]
+    assert "serialize" in stages and stages[-1] == "total"
+    assert GOOGLE_REQUESTS.value(method="events.list", status=200) == calls_before + 1
+    
+    assert auth_client.get("/metrics").status_code == 401
+    assert auth_client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    body = auth_client.get("/metrics", headers={"Authorization": "Bearer metrics-token"}).get_data(as_text=True)
+    assert 'bigasscalendar_http_request_duration_seconds_count{endpoint="/api/events",method="GET",status="200"}' in body
+    assert 'bigasscalendar_event_cache_lookups_total{result="miss"}' in body
+    assert 'bigasscalendar_http_response_size_bytes_bucket{endpoint="/api/events",le="1024"}' in body
+
+def test_metrics_are_off_unless_configured(app_with_json_config):
+    client = app_with_json_config.test_client()
+    
+    assert client.get("/metrics").status_code == 404
+    assert "Server-Timing" not in client.get("/api/config").headers
+
+def test_profile_hook_writes_one_file_per_profiled_request(app, tmp_path):
+    from app.metrics import ProfileRequests
+    app.wsgi_app = ProfileRequests(app.wsgi_app, str(tmp_path), "metrics-token")
+    client = app.test_client()
+    
+    client.get("/api/config")
+    client.get("/api/config?profile=1")
+    client.get("/api/config?profile=1", headers={"Authorization": "Bearer wrong"})
+    assert list(tmp_path.iterdir()) == []
+    
+    client.get("/api/config?profile=1", headers={"Authorization": "Bearer metrics-token"})
+    assert [path.suffix for path in tmp_path.iterdir()] == [".prof"]
+
+def test_profiling_needs_the_metrics_token(tmp_path):
+    from app import metrics
+    app = Flask(__name__)
+    wsgi_app = app.wsgi_app
+    
+    metrics.init_app(app, profile_dir=str(tmp_path / "profiles"))
+    assert app.wsgi_app == wsgi_app
+    
+    metrics.init_app(app, profile_dir=str(tmp_path / "profiles"), token="metrics-token")
+    assert isinstance(app.wsgi_app, metrics.ProfileRequests)
+
+def test_session_cookie_only_holds_an_opaque_id(auth_client, fake_service):
+    assert auth_client.get("/check-auth").get_json() == {"authenticated": True}
+    
+    with auth_client.session_transaction() as sess:
+        assert "credentials" not in sess
+        assert list(sess) == ["sid"]
+    
+    response = auth_client.get("/api/events?year=2025&calendar_id=primary")
+    assert response.status_code == 200
+    
+    auth_client.get("/logout")
+    assert auth_client.get("/check-auth").get_json() == {"authenticated": False}
+    assert auth_client.get("/api/events?year=2025&calendar_id=primary").status_code == 401
+
+def test_logout_forgets_the_user_in_the_prefetcher(app, auth_client, fake_service, monkeypatch):
+    monkeypatch.setattr(prefetch, "get_calendar_service", lambda credentials: fake_service)
+    prefetcher = app.extensions["prefetcher"] = YearPrefetcher(adjacent_years=0)
+    
+    assert auth_client.get("/api/events?year=2025&calendar_id=primary").status_code == 200
+    assert len(prefetcher._users) == 1
+    
+    auth_client.get("/logout")
+    assert prefetcher._users == {}
+    prefetcher.shutdown()
+
+def test_events_all_calendars_failed(auth_client, fake_service):
+    fake_service.failures = {"primary": RuntimeError("boom")}
+    
+    response = auth_client.get("/api/events?year=2025&calendar_id=primary")
+    assert response.status_code == 502
+    assert response.get_json()["calendars"] == {"primary": "boom"}
+    
+def test_identical_concurrent_event_requests_share_one_load(app, auth_client, fake_service):
+    import threading
+    fake_service.latency = 0.2
+    auth_client.get("/check-auth")
+    cookie = auth_client.get_cookie(app.config["SESSION_COOKIE_NAME"]).value
+    statuses = []
+    
+    def request():
+        client = app.test_client()
+        client.set_cookie(app.config["SESSION_COOKIE_NAME"], cookie)
+        statuses.append(client.get("/api/events?year=2025&calendar_id=primary").status_code)
+    
+    threads = [threading.Thread(target=request) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
     
-# To test the command line argument parsing, we create a custom test
-# that directly uses argparse rather than invoking the full application
-def test_command_line_args():
-    import argparse
-    
-    # Create a parser with the same arguments as in run.py
-    parser = argparse.ArgumentParser(description='Test argument parser')
-    parser.add_argument('--config', 
-                      help='Path to the configuration YAML file')
-    parser.add_argument('--google-client', 
-                      help='Path to the Google client JSON credentials file')
-    parser.add_argument('--info', action='store_true',
-                      help='Show application information and exit')
-    
-    # Test that our expected arguments are recognized
-    args = parser.parse_args(['--info'])
-    assert args.info is True
-    
-    args = parser.parse_args(['--config', 'test_config.yaml'])
-    assert args.config == 'test_config.yaml'
-    
-    args = parser.parse_args(['--google-client', 'test_client.json'])
-    assert args.google_client == 'test_client.json'
-    
-    # Test combined arguments
-    args = parser.parse_args(['--config', 'test_config.yaml', '--google-client', 'test_client.json'])
-    assert args.config == 'test_config.yaml'
-    assert args.google_client == 'test_client.json'
\ No newline at end of file
+    assert statuses == [200] * 4
+    assert len([call for call in fake_service.calls if call[0] == "events.list"]) == 1
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import pytest
+import yaml
+from tests.fake_calendar import FakeCalendarService, ProbeEventCache, make_event
+from tests.fake_calendar_server import FakeCalendarServer
+from app.services.token_store import credentials_from_dict
+
+httpx = pytest.importorskip("httpx")
+
+from app.asgi import create_asgi_app
+from app.routes import async_calendar
+
+@pytest.fixture
+def server():
+    service = FakeCalendarService(calendars={
+        "primary": [make_event("e1", "2025-01-10", summary="Dentist", description="Room 4")],
+    })
+    with FakeCalendarServer(service, calendar_list=[{"id": "primary", "summary": "Me"}]) as server:
+        yield server
+
+@pytest.fixture
+def asgi_app(tmp_path, server):
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(yaml.dump({
+        "flask": {"secret_key": "test-key"},
+        "google": {"client_id": "test-client-id", "client_secret": "test-client-secret"},
+        "token_store": {"backend": "memory"},
+        "prefetch": {"enabled": False},
+        "metrics": {"enabled": True}
+    }))
+
+    asgi_app = create_asgi_app(str(config_path))
+    asgi_app.flask_app.config["CALENDAR_API_URL"] = server.base_url
+    return asgi_app
+
+def session_cookie(asgi_app):
+    """Log a user in and return their signed session cookie"""
+    flask_app = asgi_app.flask_app
+    sid = flask_app.extensions["credentials"].login(credentials_from_dict({
+        "token": "test-token",
+        "refresh_token": "test-refresh-token",
+        "token_uri": "https://oauth2.googleapis.com/token",
+        "client_id": "test-client-id",
+        "client_secret": "test-client-secret",
+        "scopes": ["https://www.googleapis.com/auth/calendar.readonly"]
+    }))
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    return {flask_app.config["SESSION_COOKIE_NAME"]: serializer.dumps({"sid": sid})}
+
+def request_all(asgi_app, requests, cookies=None):
+    """Send (method, url, kwargs) requests concurrently through the ASGI app"""
+    async def main():
+        transport = httpx.ASGITransport(app=asgi_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver",
+                                     cookies=cookies) as client:
+            return await asyncio.gather(*(
+                client.request(method, url, **kwargs) for method, url, kwargs in requests
+            ))
+    return asyncio.run(main())
+
+def test_events_are_served_natively(asgi_app, server):
+    response, = request_all(asgi_app, [("GET", "/api/events?year=2025&calendar_id=primary", {})],
+                            cookies=session_cookie(asgi_app))
+
+    assert response.status_code == 200
+    assert response.headers["etag"]
+    assert response.headers["server-timing"].startswith("google;dur=")
+    data = response.json()
+    assert [event["id"] for event in data["events"]] == ["e1"]
+    assert set(data["events"][0]) == {"id", "calendarId", "summary", "start", "end", "span"}
+    assert server.requests[0][3]["Authorization"] == "Bearer test-token"
+
+def test_events_are_served_when_the_calendar_list_cannot_be_fetched(asgi_app, server, monkeypatch):
+    async def unreachable(*args, **kwargs):
+        raise httpx.ConnectError("Name or service not known")
+
+    monkeypatch.setattr(async_calendar, "list_calendars", unreachable)
+    response, = request_all(asgi_app, [("GET", "/api/events?year=2025&calendar_id=primary", {})],
+                            cookies=session_cookie(asgi_app))
+
+    assert response.status_code == 200
+    assert response.json()["calendars"] == {}
+
+def test_many_year_fetches_in_flight(asgi_app, server):
+    server.service.latency = 0.2
+    cache = asgi_app.flask_app.extensions["event_cache"] = ProbeEventCache()
+    urls = [f"/api/events?year={year}&calendar_id=primary" for year in range(2000, 2030)]
+
+    responses = request_all(asgi_app, [("GET", url, {}) for url in urls], cookies=session_cookie(asgi_app))
+
+    assert [response.status_code for response in responses] == [200] * len(urls)
+    assert server.service.peak_in_flight > 1
+    # The calendar list and event years are read from the cache off the event loop
+    assert cache.peak["get_calendar_list"] >= 1
+    assert cache.loop_reads == []
+
+def test_other_routes_go_to_flask(asgi_app):
+    cookies = session_cookie(asgi_app)
+    config, auth, unauthenticated = request_all(asgi_app, [
+        ("GET", "/api/config", {}),
+        ("GET", "/check-auth", {}),
+    ], cookies=cookies) + request_all(asgi_app, [("GET", "/api/calendars", {})])
+
+    assert config.json()["defaultYear"] == 2025
+    assert auth.json() == {"authenticated": True}
+    assert unauthenticated.status_code == 401
+
+def test_streamed_events_go_through_flask(asgi_app, server, monkeypatch):
+    # The threaded implementation talks to Google through googleapiclient
+    from app.services import calendar_service
+    from app.routes import calendar as calendar_routes
+    monkeypatch.setattr(calendar_service, "get_calendar_service", lambda credentials: server.service)
+    monkeypatch.setattr(calendar_routes, "get_calendar_service", lambda credentials: server.service)
+    
+    response, = request_all(asgi_app, [
+        ("GET", "/api/events?year=2025&calendar_id=primary&stream=1", {"headers": {"Accept-Encoding": "identity"}})
+    ], cookies=session_cookie(asgi_app))
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["type"] for line in lines] == ["calendar", "done"]
+    assert lines[1]["errors"] == {}
+
+def test_note_update(asgi_app, server):
+    cookies = session_cookie(asgi_app)
+    response, = request_all(asgi_app, [
+        ("PUT", "/api/events/e1/note?calendar_id=primary", {"json": {"note": "Bring forms"}})
+    ], cookies=cookies)
+
+    assert response.json() == {"success": True, "etag": '"2"'}
+    assert "Bring forms" in server.service.find_event("primary", "e1")["description"]
+
+    response, = request_all(asgi_app, [
+        ("PUT", "/api/events/e1/note?calendar_id=primary", {"json": {}})
+    ], cookies=cookies)
+    assert response.status_code == 400
@@ -0,0 +1,191 @@
+import asyncio
+import time
+import pytest
+from app.services import calendar_service
+from app.services.calendar_service import get_events_for_year as get_events_for_year_threaded
+from app.services.event_cache import MemoryEventCache
+from app.services.calendar_list import store_calendar_list
+from app.services import scheduler
+from app.services.scheduler import GoogleScheduler
+from tests.fake_calendar import FakeCalendarService, ProbeEventCache, make_event
+from tests.fake_calendar_server import FakeCalendarServer
+
+httpx = pytest.importorskip("httpx")
+
+from app.services.async_calendar_service import (
+    get_events_for_year, list_calendars, update_event_note, create_http_client
+)
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    """Keep the backoff of retried calls short"""
+    monkeypatch.setattr(scheduler, "_scheduler", GoogleScheduler(base_delay=0.001, max_delay=0.01))
+
+class Credentials:
+    token = "test-token"
+    refresh_token = None
+
+@pytest.fixture
+def fake_service():
+    return FakeCalendarService(calendars={
+        "work": [make_event("w1", "2025-03-01T09:00:00Z", description="Agenda"),
+                 make_event("w2", "2025-03-01T08:00:00Z")],
+        "home": [make_event("h1", "2025-02-27", "2025-03-02"), make_event("h2", "2025-12-31")],
+    })
+
+@pytest.fixture
+def server(fake_service):
+    with FakeCalendarServer(fake_service, calendar_list=[
+        {"id": "work", "summary": "Work", "backgroundColor": "#111111"},
+        {"id": "home", "summary": "Home"},
+        {"id": "holidays", "summary": "Holidays", "selected": False},
+    ]) as server:
+        yield server
+
+def run(coroutine_function, *args, **kwargs):
+    """Run a service coroutine with a fresh HTTP client"""
+    async def main():
+        async with create_http_client() as http:
+            return await coroutine_function(*args, http=http, **kwargs)
+    return asyncio.run(main())
+
+@pytest.mark.parametrize("compact", [True, False])
+def test_same_result_as_threaded_service(monkeypatch, fake_service, server, compact):
+    monkeypatch.setattr(calendar_service, "get_calendar_service", lambda credentials: fake_service)
+    expected = get_events_for_year_threaded(None, 2025, ["home", "work"], compact=compact)
+
+    result = run(get_events_for_year, Credentials(), 2025, ["home", "work"],
+                 compact=compact, base_url=server.base_url)
+
+    assert result == expected
+
+def test_failed_calendars_are_reported(fake_service, server):
+    fake_service.failures = {"work": RuntimeError("boom")}
+    errors = {}
+
+    result = run(get_events_for_year, Credentials(), 2025, ["work", "home", "missing"],
+                 errors=errors, compact=True, base_url=server.base_url)
+
+    assert set(errors) == {"work"}
+    assert {event["calendarId"] for event in result["events"]} == {"home"}
+
+def test_calendars_are_fetched_concurrently(server):
+    calendar_ids = [f"cal-{i}" for i in range(8)]
+    server.service.calendars = {calendar_id: [make_event(calendar_id, "2025-01-01")] for calendar_id in calendar_ids}
+    server.service.latency = 0.2
+
+    result = run(get_events_for_year, Credentials(), 2025, calendar_ids,
+                 max_workers=4, compact=True, base_url=server.base_url)
+
+    assert len(result["events"]) == 8
+    assert server.service.peak_in_flight == 4
+
+@pytest.mark.parametrize("read", ["events", "calendar_list"])
+def test_slow_cache_reads_do_not_serialise_requests(server, read):
+    # Every read waits for a second one, which only arrives if reads run off the loop
+    cache = ProbeEventCache(parties=2)
+    users = ("alice", "bob")
+    for user_key in users:
+        cache.set((user_key, "work", 2025), {
+            "events": {"w1": make_event("w1", "2025-03-01")}, "sync_token": "token", "synced_at": time.time()
+        })
+        store_calendar_list(cache, user_key, {"work": {"id": "work", "summary": "Work"}}, "token")
+
+    async def main():
+        async with create_http_client() as http:
+            if read == "events":
+                requests = (
+                    get_events_for_year(Credentials(), 2025, ["work"], http=http, compact=True, cache=cache,
+                                        user_key=user_key, sync_interval=3600, base_url=server.base_url)
+                    for user_key in users
+                )
+            else:
+                requests = (
+                    list_calendars(Credentials(), http=http, cache=cache, user_key=user_key,
+                                   refresh_interval=3600, base_url=server.base_url)
+                    for user_key in users
+                )
+            return await asyncio.gather(*requests)
+
+    results = asyncio.run(main())
+
+    if read == "events":
+        assert [[event["id"] for event in result["events"]] for result in results] == [["w1"], ["w1"]]
+    else:
+        assert [[calendar["id"] for calendar in result] for result in results] == [["work"], ["work"]]
+    assert server.requests == []
+    assert cache.loop_reads == []
+    assert cache.peak["get" if read == "events" else "get_calendar_list"] == len(users)
+
+def test_cache_entries_are_shared_with_threaded_service(monkeypatch, fake_service, server):
+    monkeypatch.setattr(calendar_service, "get_calendar_service", lambda credentials: fake_service)
+    cache = MemoryEventCache()
+    options = dict(cache=cache, user_key="user", compact=True)
+
+    get_events_for_year_threaded(None, 2025, ["work"], **options)
+    fake_service.update_event("work", make_event("w3", "2025-04-01"))
+    fake_service.calls.clear()
+
+    result = run(get_events_for_year, Credentials(), 2025, ["work"], base_url=server.base_url, **options)
+
+    assert [event["id"] for event in result["events"]] == ["w2", "w1", "w3"]
+    assert [call[2].get("syncToken") is not None for call in fake_service.calls] == [True]
+
+def test_list_calendars_follows_pages(server):
+    calendars = run(list_calendars, Credentials(), base_url=server.base_url)
+
+    assert [calendar["id"] for calendar in calendars] == ["work", "home", "holidays"]
+    assert calendars[0]["backgroundColor"] == "#111111"
+    assert calendars[1]["backgroundColor"] == "#4285F4"
+    assert calendars[2]["selected"] is False
+
+def test_list_calendars_syncs_changes_into_the_cache(fake_service, server):
+    cache = MemoryEventCache()
+    run(list_calendars, Credentials(), base_url=server.base_url, cache=cache, user_key="user")
+
+    fake_service.remove_calendar("home")
+    fake_service.update_calendar({"id": "team", "summary": "Team", "accessRole": "writer"})
+    calendars = run(list_calendars, Credentials(), base_url=server.base_url, cache=cache, user_key="user")
+
+    assert [calendar["id"] for calendar in calendars] == ["work", "holidays", "team"]
+    assert server.requests[-1][2]["syncToken"] == "|0"
+
+def test_note_write_retries_after_concurrent_edit(fake_service, server):
+    updated = run(update_event_note, Credentials(), "work", "w1", "Bring forms",
+                  etag='"0"', description="Agenda", base_url=server.base_url)
+
+    assert updated["etag"] == '"2"'
+    assert updated["description"] == (
+        "Agenda\n\n<!-- BIGASSCALENDAR_NOTE_START -->Bring forms<!-- BIGASSCALENDAR_NOTE_END -->"
+    )
+    methods = [request[0] for request in server.requests]
+    assert methods == ["PATCH", "GET", "PATCH"]
+
+def test_rate_limited_requests_are_retried(fake_service, server):
+    from tests.fake_calendar import make_rate_limit_error
+    fake_service.transient_errors = {"work": [make_rate_limit_error(429), make_rate_limit_error(403)]}
+    errors = {}
+
+    result = run(get_events_for_year, Credentials(), 2025, ["work"],
+                 errors=errors, compact=True, base_url=server.base_url)
+
+    assert errors == {}
+    assert {event["id"] for event in result["events"]} == {"w1", "w2"}
+
+def test_shared_calendar_is_fetched_once_for_all_readers(server):
+    cache = MemoryEventCache()
+
+    async def main():
+        async with create_http_client() as http:
+            # Readers arriving together wait for one sync
+            return await asyncio.gather(*(
+                get_events_for_year(Credentials(), 2025, ["home"], http=http, cache=cache, user_key=user_key,
+                                    sync_interval=60, shared={"home": "shared:reader"}, compact=True,
+                                    base_url=server.base_url)
+                for user_key in ("alice", "bob", "carol")
+            ))
+
+    results = asyncio.run(main())
+
+    assert all([event["id"] for event in result["events"]] == ["h1", "h2"] for result in results)
+    assert [request[1] for request in server.requests].count("/calendar/v3/calendars/home/events") == 1
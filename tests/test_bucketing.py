@@ -0,0 +1,49 @@
+import random
+from datetime import date, timedelta
+import pytest
+from app.services import bucketing
+from app.services.bucketing import day_spans, index_days
+from tests.fake_calendar import make_event
+
+pytest.importorskip("numpy")
+
+def random_events(count, seed=0):
+    """Mix of all-day, timed, multi-day, cross-year and undated events"""
+    rng = random.Random(seed)
+    events = []
+    for i in range(count):
+        day = date(2024, 12, 1) + timedelta(days=rng.randint(0, 420))
+        kind = rng.random()
+        if kind < 0.4:
+            end = day + timedelta(days=rng.choice([1, 1, 1, 2, 5, 30]))
+            events.append(make_event(f"e{i}", day.isoformat(), end.isoformat()))
+        elif kind < 0.95:
+            offset = rng.choice(["Z", "-05:00", "+09:00"])
+            start = f"{day.isoformat()}T{rng.randint(0, 23):02d}:30:00{offset}"
+            end_day = day + timedelta(days=rng.choice([0, 0, 0, 1, 3]))
+            end = f"{end_day.isoformat()}T{rng.randint(0, 23):02d}:00:00{offset}"
+            events.append(make_event(f"e{i}", start, end))
+        elif kind < 0.97:
+            events.append({"id": f"e{i}", "start": {"date": day.isoformat()}, "end": {}})
+        else:
+            events.append({"id": f"e{i}", "start": {}, "end": {}})
+    return events
+
+@pytest.mark.parametrize("count", [0, 1, 300, 5000])
+def test_engines_produce_identical_output(count):
+    events = random_events(count)
+    first_day = date(2025, 1, 1)
+    
+    spans = day_spans(events, first_day, engine="python")
+    assert day_spans(events, first_day, engine="numpy") == spans
+    
+    spans = [span for span in spans if span is not None]
+    expected = index_days(spans, 365, engine="python")
+    result = index_days(spans, 365, engine="numpy")
+    assert result == expected
+    # Same key order too, so serialized payloads are byte-identical
+    assert list(result) == list(expected)
+
+def test_small_inputs_use_python(monkeypatch):
+    monkeypatch.setattr(bucketing, "_index_days_numpy", None)
+    assert index_days([[0, 1]], 365) == {0: [0], 1: [0]}
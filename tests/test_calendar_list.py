@@ -0,0 +1,93 @@
+from tests.fake_calendar import FakeCalendarService
+from app.services.calendar_list import (
+    get_calendar_list, cached_calendar_list, calendar_colors, shared_calendars, CALENDAR_LIST_PAGE_SIZE
+)
+from app.services.event_cache import MemoryEventCache
+
+def make_service(count=3):
+    return FakeCalendarService(calendar_list=[
+        {"id": f"cal{index}", "summary": f"Calendar {index}", "accessRole": "owner"}
+        for index in range(count)
+    ])
+
+def list_calls(service):
+    return [params for method, _, params in service.calls if method == "calendarList.list"]
+
+def test_every_page_is_read():
+    service = make_service(CALENDAR_LIST_PAGE_SIZE + 5)
+
+    calendars = get_calendar_list(service)
+
+    assert len(calendars) == CALENDAR_LIST_PAGE_SIZE + 5
+    assert calendars[0] == {
+        "id": "cal0", "summary": "Calendar 0", "backgroundColor": "#4285F4", "foregroundColor": "#FFFFFF",
+        "selected": True, "accessRole": "owner", "primary": False
+    }
+    assert len(list_calls(service)) == 2
+
+def test_cached_list_is_served_until_the_refresh_interval():
+    service = make_service()
+    cache = MemoryEventCache()
+
+    first = get_calendar_list(service, cache, "user", refresh_interval=60)
+    second = get_calendar_list(service, cache, "user", refresh_interval=60)
+
+    assert first == second
+    assert len(list_calls(service)) == 1
+    assert list(cached_calendar_list(cache, "user")) == ["cal0", "cal1", "cal2"]
+
+def test_refresh_only_fetches_changes():
+    service = make_service()
+    cache = MemoryEventCache()
+    get_calendar_list(service, cache, "user", refresh_interval=0)
+
+    service.update_calendar({"id": "cal1", "summary": "Renamed", "backgroundColor": "#123456"})
+    service.update_calendar({"id": "cal3", "summary": "New"})
+    service.remove_calendar("cal0")
+    calendars = get_calendar_list(service, cache, "user", refresh_interval=0)
+
+    assert [(calendar["id"], calendar["summary"]) for calendar in calendars] == [
+        ("cal1", "Renamed"), ("cal2", "Calendar 2"), ("cal3", "New")
+    ]
+    assert list_calls(service)[-1]["syncToken"] == "|0"
+
+def test_expired_sync_token_reads_the_list_again():
+    service = make_service()
+    cache = MemoryEventCache()
+    get_calendar_list(service, cache, "user", refresh_interval=0)
+
+    service.remove_calendar("cal2")
+    service.expire_sync_tokens("")
+    calendars = get_calendar_list(service, cache, "user", refresh_interval=0)
+
+    assert [calendar["id"] for calendar in calendars] == ["cal0", "cal1"]
+    assert "syncToken" not in list_calls(service)[-1]
+
+def test_colors_resolve_the_primary_alias():
+    service = FakeCalendarService(calendar_list=[
+        {"id": "me@example.com", "summary": "Me", "primary": True, "backgroundColor": "#ff0000",
+         "accessRole": "owner"},
+        {"id": "holidays", "summary": "Holidays", "accessRole": "reader"},
+    ])
+    calendars = {calendar["id"]: calendar for calendar in get_calendar_list(service)}
+
+    assert calendar_colors(calendars, ["primary", "holidays", "unknown"]) == {
+        "primary": {"backgroundColor": "#ff0000", "foregroundColor": "#FFFFFF", "accessRole": "owner"},
+        "holidays": {"backgroundColor": "#4285F4", "foregroundColor": "#FFFFFF", "accessRole": "reader"}
+    }
+
+def test_only_read_only_calendars_are_shared():
+    calendars = {calendar["id"]: calendar for calendar in get_calendar_list(FakeCalendarService(calendar_list=[
+        {"id": "me", "accessRole": "owner", "primary": True},
+        {"id": "team", "accessRole": "writer"},
+        {"id": "holidays", "accessRole": "reader"},
+        {"id": "rota", "accessRole": "freeBusyReader"},
+    ]))}
+
+    assert shared_calendars(calendars, "items(id,summary)") == {
+        "holidays": "shared:reader", "rota": "shared:freeBusyReader"
+    }
+    # Full events and attendees differ between readers
+    assert shared_calendars(calendars, None) == {}
+    assert shared_calendars(calendars, "items(id,attendees)") == {}
+    assert shared_calendars(None, "items(id)") == {}
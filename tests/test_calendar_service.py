@@ -0,0 +1,382 @@
+import time
+from datetime import date, timedelta
+import pytest
+from app.services import calendar_service
+from app.services.calendar_service import (
+    stream_calendar_pages, iter_event_pages, get_events_for_year, get_events_for_range, update_event_notes, extract_note_from_description
+)
+from app.services.event_cache import MemoryEventCache
+from app.services.event_index import EventIndexCache
+from tests.fake_calendar import FakeCalendarService, make_event
+
+@pytest.fixture
+def fake_service():
+    """Fake Calendar API with a handful of calendars"""
+    return FakeCalendarService(calendars={
+        "work": [make_event("w1", "2025-03-01T09:00:00Z")],
+        "home": [make_event("h1", "2025-03-01"), make_event("h2", "2025-03-02")],
+        "holidays": [make_event("x1", "2025-12-25")],
+    })
+
+@pytest.fixture
+def use_fake_service(monkeypatch, fake_service):
+    """Make the calendar service talk to the fake API instead of Google"""
+    monkeypatch.setattr(calendar_service, "get_calendar_service", lambda credentials: fake_service)
+    return fake_service
+
+def fetch_pages(service, calendar_ids, page_size=250, fields=None, **options):
+    """Read whole calendars through stream_calendar_pages, like the year loaders do"""
+    results = {}
+    errors = {}
+
+    def list_pages(service, calendar_id):
+        for page in iter_event_pages(service, calendar_id, page_size, fields,
+                                     timeMin="2025-01-01T00:00:00Z", timeMax="2025-12-31T23:59:59Z"):
+            yield page.get("items", [])
+
+    for calendar_id, events in stream_calendar_pages(lambda: service, calendar_ids, list_pages, errors,
+                                                     report_finished=True, **options):
+        results.setdefault(calendar_id, []).extend(events or [])
+    return results, errors
+
+def test_fetch_runs_calendars_concurrently():
+    calendar_ids = [f"cal-{i}" for i in range(6)]
+    service = FakeCalendarService(
+        calendars={calendar_id: [make_event(calendar_id, "2025-01-01")] for calendar_id in calendar_ids},
+        latency=0.2
+    )
+
+    results, errors = fetch_pages(service, calendar_ids, max_workers=6)
+
+    assert errors == {}
+    assert set(results) == set(calendar_ids)
+    assert service.peak_in_flight == 6
+
+def test_fetch_respects_concurrency_limit():
+    calendar_ids = [f"cal-{i}" for i in range(4)]
+    service = FakeCalendarService(latency=0.1)
+
+    results, errors = fetch_pages(service, calendar_ids, max_workers=2)
+
+    assert errors == {}
+    assert len(results) == 4
+    assert service.peak_in_flight == 2
+
+def test_fetch_reports_partial_failures():
+    service = FakeCalendarService(
+        calendars={"ok": [make_event("e1", "2025-01-01")]},
+        failures={"broken": RuntimeError("quota exceeded")}
+    )
+
+    results, errors = fetch_pages(service, ["ok", "broken"])
+
+    assert list(results) == ["ok"]
+    assert errors == {"broken": "quota exceeded"}
+
+def test_fetch_times_out_slow_calendars():
+    service = FakeCalendarService(
+        calendars={"fast": [make_event("e1", "2025-01-01")]},
+        delays={"slow": 2.0}
+    )
+
+    started = time.monotonic()
+    results, errors = fetch_pages(service, ["fast", "slow"], timeout=0.2)
+
+    assert time.monotonic() - started < 1.0
+    assert list(results) == ["fast"]
+    assert "slow" in errors
+
+def test_events_merged_in_requested_calendar_order(use_fake_service):
+    # The first calendar finishes last, but its events still come first
+    use_fake_service.delays = {"home": 0.2}
+    use_fake_service.calendars["work"] = [make_event("w2", "2025-03-01")]
+
+    events = get_events_for_year(None, 2025, ["home", "work"])
+
+    assert [event["id"] for event in events["2025-03-01"]] == ["h1", "w2"]
+    assert events["2025-03-01"][0]["calendarId"] == "home"
+
+def test_get_events_for_year_collects_errors(use_fake_service):
+    use_fake_service.failures = {"work": RuntimeError("boom")}
+    errors = {}
+
+    events = get_events_for_year(None, 2025, ["work", "holidays"], errors=errors)
+
+    assert errors == {"work": "boom"}
+    assert list(events) == ["2025-12-25"]
+
+def test_follows_every_page():
+    events = [make_event(f"e{i}", "2025-01-01") for i in range(7)]
+    service = FakeCalendarService(calendars={"busy": events})
+
+    results, errors = fetch_pages(service, ["busy"], page_size=3, fields="items(id)")
+
+    assert errors == {}
+    assert [event["id"] for event in results["busy"]] == [f"e{i}" for i in range(7)]
+    params = [call[2] for call in service.calls]
+    assert [p.get("pageToken") for p in params] == [None, "3", "6"]
+    assert all(p["maxResults"] == 3 and p["fields"] == "items(id)" for p in params)
+
+def test_pages_yielded_before_calendar_finishes():
+    events = [make_event(f"e{i}", "2025-01-01") for i in range(4)]
+    service = FakeCalendarService(calendars={"busy": events}, latency=0.1)
+    errors = {}
+
+    def list_pages(service, calendar_id):
+        for page in calendar_service.iter_event_pages(service, calendar_id, page_size=1):
+            yield page["items"]
+
+    pages = calendar_service.stream_calendar_pages(lambda: service, ["busy"], list_pages, errors)
+    calendar_id, first_page = next(pages)
+    pages.close()
+
+    assert calendar_id == "busy"
+    assert [event["id"] for event in first_page] == ["e0"]
+    # Only the first page had been requested when it was handed over
+    assert len(service.calls) <= 2
+
+def test_failed_calendar_dropped_after_partial_pages(use_fake_service, monkeypatch):
+    use_fake_service.calendars["home"] = [make_event(f"h{i}", "2025-02-01") for i in range(3)]
+    original_list = calendar_service.iter_event_pages
+
+    def failing_pages(service, calendar_id, *args, **kwargs):
+        for page in original_list(service, calendar_id, *args, **kwargs):
+            yield page
+            if calendar_id == "home":
+                raise RuntimeError("connection reset")
+
+    monkeypatch.setattr(calendar_service, "iter_event_pages", failing_pages)
+    errors = {}
+
+    events = get_events_for_year(None, 2025, ["home", "work"], errors=errors, page_size=1)
+
+    assert errors == {"home": "connection reset"}
+    assert list(events) == ["2025-03-01"]
+
+def test_shared_calendar_is_fetched_once_for_all_readers(use_fake_service):
+    use_fake_service.calendars["holidays"][0]["description"] = calendar_service.inject_note_into_description(
+        "Office closed", "Plan ahead"
+    )
+    cache = MemoryEventCache()
+    shared = {"holidays": "shared:reader"}
+    
+    for user_key in ("alice", "bob", "carol"):
+        events = get_events_for_year(None, 2025, ["holidays", "home"], cache=cache, user_key=user_key,
+                                     sync_interval=60, shared=shared, compact=True)
+        assert [event["id"] for event in events["events"]] == ["x1", "h1", "h2"]
+        assert events["events"][0]["note"] == "Plan ahead"
+    
+    listed = [calendar_id for method, calendar_id, _ in use_fake_service.calls if method == "events.list"]
+    assert listed.count("holidays") == 1 and listed.count("home") == 3
+    
+    # One entry for every reader, holding Google's events without annotations
+    assert cache.get(("alice", "holidays", 2025)) is None
+    cached = cache.get(("shared:reader", "holidays", 2025))["events"]["x1"]
+    assert "note" not in cached and "calendarId" not in cached and "span" not in cached
+
+def test_cached_year_uses_incremental_sync(use_fake_service):
+    cache = MemoryEventCache()
+    get_events_for_year(None, 2025, ["home"], cache=cache, user_key="user")
+    
+    use_fake_service.update_event("home", make_event("h3", "2025-04-01"))
+    use_fake_service.delete_event("home", "h1")
+    use_fake_service.calls.clear()
+    
+    events = get_events_for_year(None, 2025, ["home"], cache=cache, user_key="user")
+    
+    assert sorted(events) == ["2025-03-02", "2025-04-01"]
+    params = use_fake_service.calls[0][2]
+    assert params["syncToken"] == "home|0"
+    assert "timeMin" not in params
+
+def test_incremental_sync_drops_events_moved_out_of_range(use_fake_service):
+    cache = MemoryEventCache()
+    get_events_for_year(None, 2025, ["home"], cache=cache, user_key="user")
+    
+    use_fake_service.update_event("home", make_event("h2", "2026-01-05"))
+    events = get_events_for_year(None, 2025, ["home"], cache=cache, user_key="user")
+    
+    assert list(events) == ["2025-03-01"]
+
+def test_expired_sync_token_triggers_full_resync(use_fake_service):
+    cache = MemoryEventCache()
+    get_events_for_year(None, 2025, ["home"], cache=cache, user_key="user")
+    
+    use_fake_service.update_event("home", make_event("h3", "2025-04-01"))
+    use_fake_service.expire_sync_tokens("home")
+    use_fake_service.calls.clear()
+    
+    events = get_events_for_year(None, 2025, ["home"], cache=cache, user_key="user")
+    
+    assert "2025-04-01" in events
+    assert [call[2].get("syncToken") for call in use_fake_service.calls] == ["home|0", None]
+    assert cache.get(("user", "home", 2025))["sync_token"] == "home|1"
+
+def test_fresh_cache_entry_skips_google(use_fake_service):
+    cache = MemoryEventCache()
+    first = get_events_for_year(None, 2025, ["home", "work"], cache=cache, user_key="user")
+    use_fake_service.calls.clear()
+    
+    second = get_events_for_year(None, 2025, ["home", "work"], cache=cache, user_key="user",
+                                 sync_interval=60)
+    
+    assert use_fake_service.calls == []
+    assert second == first
+
+def test_compact_year_matches_per_day_copies(use_fake_service):
+    use_fake_service.calendars["work"] += [
+        make_event("trip", "2025-02-27", "2025-03-04"),
+        make_event("overnight", "2025-03-01T22:00:00-05:00", "2025-03-02T06:00:00-05:00"),
+    ]
+    legacy = get_events_for_year(None, 2025, ["home", "work"])
+    compact = get_events_for_year(None, 2025, ["home", "work"], compact=True)
+    
+    # Expanding the compact format gives back the per-day copies
+    expanded = {}
+    for day, refs in sorted(compact["days"].items()):
+        for ref in refs:
+            event = compact["events"][ref]
+            first, last = event["span"]
+            copy = {key: value for key, value in event.items() if key != "span"}
+            copy["isFirstDay"] = day == first
+            copy["isMultiDay"] = first != last
+            key = (date(2025, 1, 1) + timedelta(days=day)).isoformat()
+            expanded.setdefault(key, []).append(copy)
+    
+    assert expanded == legacy
+
+def test_compact_year_clips_days_to_the_year(use_fake_service):
+    use_fake_service.calendars = {"home": [make_event("nye", "2024-12-30", "2025-01-03")]}
+    
+    compact = get_events_for_year(None, 2025, ["home"], compact=True)
+    
+    assert compact["events"][0]["span"] == [-2, 1]
+    assert compact["days"] == {0: [0], 1: [0]}
+
+def test_stream_yields_calendars_as_they_finish(use_fake_service):
+    use_fake_service.delays = {"work": 0.2}
+    
+    chunks = list(calendar_service.stream_events_for_year(None, 2025, ["work", "home"]))
+    
+    assert [chunk.get("calendarId") for chunk in chunks] == ["home", "work", None]
+    assert [event["id"] for event in chunks[0]["events"]] == ["h1", "h2"]
+    assert chunks[0]["days"] == {59: [0], 60: [1]}
+    assert chunks[-1] == {"type": "done", "year": 2025, "errors": {}}
+
+def test_compact_year_summarizes_days(use_fake_service):
+    use_fake_service.calendars["work"].append(make_event("trip", "2025-02-28", "2025-03-03"))
+    
+    compact = get_events_for_year(None, 2025, ["home", "work"], compact=True)
+    summary = compact["summary"]
+    
+    assert summary["calendars"] == ["home", "work"]
+    # March 1st: h1 from home, w1 and the trip from work
+    assert summary["days"][59] == [3, 1, 0, 1, 1, 2]
+    assert summary["days"][58] == [1, 1, 1, 1]
+    assert summary["days"].keys() == compact["days"].keys()
+
+def test_day_without_cache_fetches_a_window(use_fake_service):
+    use_fake_service.calendars["work"].append(make_event("late", "2025-03-01T23:30:00-08:00"))
+    
+    events = calendar_service.get_events_for_day(None, date(2025, 3, 1), ["home", "work"])
+    
+    assert [event["id"] for event in events] == ["h1", "w1", "late"]
+    params = use_fake_service.calls[0][2]
+    assert (params["timeMin"], params["timeMax"]) == ("2025-02-28T00:00:00Z", "2025-03-03T00:00:00Z")
+
+def test_range_is_cut_from_cached_years(use_fake_service):
+    use_fake_service.calendars["holidays"] += [
+        make_event("ny", "2025-12-31", "2026-01-02"),
+        make_event("late", "2026-02-10T10:00:00Z"),
+        make_event("outside", "2026-06-01"),
+    ]
+    cache = MemoryEventCache()
+    index_cache = EventIndexCache()
+    options = dict(cache=cache, user_key="user", sync_interval=60, index_cache=index_cache, compact=True)
+    
+    result = get_events_for_range(None, date(2025, 12, 1), date(2026, 3, 1), ["holidays"], **options)
+    
+    assert (result["start"], result["end"]) == ("2025-12-01", "2026-03-01")
+    assert [event["id"] for event in result["events"]] == ["x1", "ny", "late"]
+    # Spans count from the start of the range; New Year's event is listed once
+    assert result["events"][1]["span"] == [30, 31]
+    assert result["days"][31] == [1]
+    assert len(index_cache) == 2
+    
+    # Any window inside the synced years is answered without Google
+    use_fake_service.calls.clear()
+    week = get_events_for_range(None, date(2026, 1, 1), date(2026, 1, 8), ["holidays"], **options)
+    assert [event["id"] for event in week["events"]] == ["ny"]
+    assert week["events"][0]["span"] == [-1, 0]
+    assert use_fake_service.calls == []
+
+def test_range_without_cache_fetches_the_range(use_fake_service):
+    result = get_events_for_range(None, date(2025, 3, 2), date(2025, 3, 3), ["home", "work"])
+    
+    assert [event["id"] for event in result["2025-03-02"]] == ["h2"]
+    assert list(result) == ["2025-03-02"]
+    params = use_fake_service.calls[0][2]
+    assert (params["timeMin"], params["timeMax"]) == ("2025-03-01T00:00:00Z", "2025-03-04T00:00:00Z")
+
+def test_batched_note_updates_use_few_round_trips(use_fake_service):
+    use_fake_service.calendars["big"] = [make_event(f"b{i}", "2025-05-01") for i in range(60)]
+    updates = [{"calendar_id": "big", "event_id": f"b{i}", "note": f"note {i}"} for i in range(60)]
+    
+    results = update_event_notes(None, updates)
+    
+    assert all(result["success"] for result in results)
+    assert [result["event_id"] for result in results] == [f"b{i}" for i in range(60)]
+    # Two batches of GETs and two batches of PATCHes instead of 120 requests
+    assert [call[0] for call in use_fake_service.calls].count("batch") == 4
+    patch = next(call for call in use_fake_service.calls if call[0] == "events.patch")
+    assert list(patch[2]["body"]) == ["description"]
+    assert extract_note_from_description(use_fake_service.find_event("big", "b7")["description"]) == "note 7"
+
+def test_batched_note_updates_report_items_individually(use_fake_service, monkeypatch):
+    original_inject = calendar_service.inject_note
+    
+    def inject_with_concurrent_edit(description, note):
+        # Someone edits h2 between every read and write of ours
+        if note == "second":
+            event = use_fake_service.find_event("home", "h2")
+            version = int(event["etag"].strip('"')) + 1
+            use_fake_service.update_event("home", dict(event, etag=f'"{version}"'))
+        return original_inject(description, note)
+    
+    monkeypatch.setattr(calendar_service, "inject_note", inject_with_concurrent_edit)
+    
+    results = update_event_notes(None, [
+        {"calendar_id": "home", "event_id": "h1", "note": "first"},
+        {"calendar_id": "home", "event_id": "h2", "note": "second"},
+        {"calendar_id": "home", "event_id": "missing", "note": "third"},
+    ])
+    
+    assert results[0]["success"] is True
+    assert results[1]["success"] is False and results[1]["status"] == 412
+    assert results[2]["success"] is False and results[2]["status"] == 404
+
+def test_note_write_with_known_etag_skips_the_read(use_fake_service):
+    event = use_fake_service.find_event("home", "h1")
+    
+    updated = calendar_service.update_event_note(
+        None, "home", "h1", "hello", etag=event["etag"], description=""
+    )
+    
+    assert [call[0] for call in use_fake_service.calls] == ["events.patch"]
+    assert updated["etag"] == '"2"'
+    assert extract_note_from_description(updated["description"]) == "hello"
+
+def test_note_write_merges_concurrent_edit_and_retries(use_fake_service):
+    # Someone changed the description after we loaded the event
+    use_fake_service.update_event(
+        "home", dict(use_fake_service.find_event("home", "h1"), description="Agenda", etag='"5"')
+    )
+    
+    updated = calendar_service.update_event_note(
+        None, "home", "h1", "hello", etag='"1"', description=""
+    )
+    
+    assert [call[0] for call in use_fake_service.calls] == ["events.patch", "events.get", "events.patch"]
+    assert updated["etag"] == '"6"'
+    assert updated["description"].startswith("Agenda")
+    assert extract_note_from_description(updated["description"]) == "hello"
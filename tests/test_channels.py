@@ -0,0 +1,157 @@
+import time
+import pytest
+from app.services import calendar_service, channels
+from app.services.calendar_service import get_events_for_year
+from app.services.channels import ChannelManager, channel_token, read_channel_token
+from app.services.event_cache import MemoryEventCache
+from tests.fake_calendar import FakeCalendarService, make_event
+
+ADDRESS = "https://calendar.example.com/api/notifications"
+
+@pytest.fixture
+def fake_service(monkeypatch):
+    service = FakeCalendarService(calendars={
+        "work": [make_event("w1", "2025-03-01")],
+        "holidays": [make_event("x1", "2025-12-25")],
+    })
+    monkeypatch.setattr(calendar_service, "get_calendar_service", lambda credentials: service)
+    monkeypatch.setattr(channels, "get_calendar_service", lambda credentials: service)
+    return service
+
+@pytest.fixture
+def cache():
+    return MemoryEventCache()
+
+@pytest.fixture
+def manager(cache):
+    manager = ChannelManager(cache, ADDRESS, "test-secret")
+    yield manager
+    manager.shutdown()
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out waiting for the background work"
+        time.sleep(0.01)
+
+def load(cache, user_key="alice", calendar_ids=("work",), **options):
+    return get_events_for_year(None, 2025, list(calendar_ids), cache=cache, user_key=user_key, **options)
+
+def options(cache, user_key="alice", shared=None):
+    return {"cache": cache, "user_key": user_key, "shared": shared}
+
+def calls(service, method):
+    return [call for call in service.calls if call[0] == method]
+
+def test_channel_tokens_are_signed():
+    token = channel_token("secret", "shared:reader", "holidays@group.calendar.google.com")
+
+    assert read_channel_token("secret", token) == ("shared:reader", "holidays@group.calendar.google.com")
+    assert read_channel_token("other-secret", token) is None
+    assert read_channel_token("secret", token.replace(".", "x.", 1)) is None
+    assert read_channel_token("secret", None) is None
+    assert channel_token("secret", "user", "x" * 300) is None
+
+def test_watched_calendar_is_resynced_on_notification(fake_service, cache, manager):
+    load(cache)
+    manager.watch(None, ["work"], options(cache))
+    wait_for(lambda: manager.sync_intervals("alice") == {"work": manager.sync_interval})
+
+    body = calls(fake_service, "events.watch")[0][2]["body"]
+    assert (body["type"], body["address"]) == ("web_hook", ADDRESS)
+    assert manager.channels()[0]["expiration"] > time.time()
+
+    # Watching again is free
+    manager.watch(None, ["work"], options(cache))
+    assert len(calls(fake_service, "events.watch")) == 1
+
+    fake_service.update_event("work", make_event("w2", "2025-06-01"))
+    fake_service.calls.clear()
+    assert fake_service.notify("work", lambda address, headers: manager.notify(
+        headers["X-Goog-Channel-Token"], headers["X-Goog-Resource-State"]
+    )) == [True]
+
+    # Only the notified calendar is synced, incrementally
+    wait_for(lambda: "w2" in cache.get(("alice", "work", 2025))["events"])
+    assert {(method, calendar_id) for method, calendar_id, params in fake_service.calls} == {("events.list", "work")}
+    assert all("syncToken" in params for _, _, params in fake_service.calls)
+
+def test_notifications_expire_cached_years_in_any_process(fake_service, cache, manager):
+    load(cache)
+    token = channel_token("test-secret", "alice", "work")
+
+    # This process holds no channel for the calendar; the next load syncs it
+    assert manager.notify(token, "exists")
+    assert cache.get(("alice", "work", 2025))["synced_at"] == 0
+    assert manager.notify(token, "sync")
+    assert not manager.notify("forged.token", "exists")
+
+def test_readers_of_a_shared_calendar_share_one_channel(fake_service, cache, manager):
+    shared = {"holidays": "shared:reader"}
+    for user_key in ("alice", "bob"):
+        load(cache, user_key, ["holidays"], shared=shared)
+        manager.watch(None, ["holidays"], options(cache, user_key, shared))
+        wait_for(lambda: manager.sync_intervals(user_key, shared) == {"holidays": manager.sync_interval})
+
+    assert len(calls(fake_service, "events.watch")) == 1
+    # Someone who is not a reader does not get the shared channel's interval
+    assert manager.sync_intervals("carol") == {}
+
+def test_channels_are_renewed_before_expiry(fake_service, cache):
+    manager = ChannelManager(cache, ADDRESS, "test-secret", ttl=60, renew_margin=120)
+    try:
+        load(cache)
+        manager.watch(None, ["work"], options(cache))
+        wait_for(lambda: len(manager.channels()) == 1)
+        first = manager.channels()[0]
+
+        manager.renew_expiring()
+        wait_for(lambda: manager.channels()[0]["id"] != first["id"])
+        assert [call[2]["body"]["id"] for call in calls(fake_service, "channels.stop")] == [first["id"]]
+
+        # A calendar that left the cache is no longer watched
+        cache.invalidate("alice", "work")
+        manager.renew_expiring()
+        wait_for(lambda: manager.channels() == [])
+        assert fake_service.watch_channels == {}
+    finally:
+        manager.shutdown()
+
+def test_logout_stops_renewal_with_the_users_credentials(fake_service, cache):
+    manager = ChannelManager(cache, ADDRESS, "test-secret", ttl=60, renew_margin=120)
+    try:
+        shared = {"holidays": "shared:reader"}
+        load(cache)
+        load(cache, "bob", ["holidays"], shared=shared)
+        manager.watch("alice-credentials", ["work"], options(cache))
+        manager.watch("bob-credentials", ["holidays"], options(cache, "bob", shared))
+        wait_for(lambda: len(manager.channels()) == 2)
+        alice = next(channel for channel in manager.channels() if channel["owner_key"] == "alice")
+
+        manager.forget("alice")
+        assert [channel["owner_key"] for channel in manager.channels()] == ["shared:reader"]
+        assert manager.sync_intervals("alice") == {}
+        wait_for(lambda: len(calls(fake_service, "channels.stop")) == 1)
+        assert calls(fake_service, "channels.stop")[0][2]["body"]["id"] == alice["id"]
+
+        # Renewal only reopens the channels of users still logged in
+        fake_service.calls.clear()
+        manager.renew_expiring()
+        wait_for(lambda: len(calls(fake_service, "channels.stop")) == 1)
+        assert [call[1] for call in calls(fake_service, "events.watch")] == ["holidays"]
+        assert all(channel["credentials"] == "bob-credentials" for channel in manager.channels())
+    finally:
+        manager.shutdown()
+
+def test_work_arriving_after_shutdown_is_dropped(fake_service, cache):
+    # Channels are due for renewal as soon as they open
+    manager = ChannelManager(cache, ADDRESS, "test-secret", ttl=60, renew_margin=120)
+    load(cache)
+    manager.watch(None, ["work"], options(cache))
+    wait_for(lambda: manager.sync_intervals("alice") == {"work": manager.sync_interval})
+    manager.shutdown()
+
+    # Requests still being served while the process exits must not fail
+    manager.watch(None, ["holidays"], options(cache))
+    assert manager.notify(channel_token("test-secret", "alice", "work"), "exists")
+    manager.renew_expiring()
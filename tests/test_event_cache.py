@@ -0,0 +1,137 @@
+import base64
+import json
+import os
+import tempfile
+import time
+import google.oauth2.credentials
+import pytest
+from app.services.event_cache import (
+    EventCache, MemoryEventCache, SQLiteEventCache, create_event_cache, user_cache_key
+)
+
+def make_entry(count):
+    return {
+        "events": {f"e{i}": {"id": f"e{i}"} for i in range(count)},
+        "sync_token": "token",
+        "synced_at": time.time()
+    }
+
+def make_id_token(subject):
+    """Unsigned ID token carrying a subject"""
+    def encode(part):
+        return base64.urlsafe_b64encode(json.dumps(part).encode("utf-8")).rstrip(b"=").decode("ascii")
+    return f"{encode({'alg': 'RS256'})}.{encode({'sub': subject})}.c2ln"
+
+@pytest.fixture
+def sqlite_path():
+    """Temporary SQLite database file"""
+    fd, path = tempfile.mkstemp(suffix=".sqlite3")
+    os.close(fd)
+    
+    yield path
+    
+    os.unlink(path)
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryEventCache(max_entries=2)
+    cache.set(("u", "a", 2025), make_entry(1))
+    cache.set(("u", "b", 2025), make_entry(1))
+    cache.get(("u", "a", 2025))
+    cache.set(("u", "c", 2025), make_entry(1))
+    
+    assert cache.get(("u", "b", 2025)) is None
+    assert cache.get(("u", "a", 2025)) is not None
+    assert cache.get(("u", "c", 2025)) is not None
+
+def test_memory_cache_evicts_by_event_count():
+    cache = MemoryEventCache(max_events=10)
+    cache.set(("u", "a", 2025), make_entry(6))
+    cache.set(("u", "b", 2025), make_entry(6))
+    
+    assert len(cache) == 1
+    assert cache.get(("u", "b", 2025)) is not None
+
+def test_memory_cache_expires_entries():
+    cache = MemoryEventCache(ttl=0)
+    cache.set(("u", "a", 2025), make_entry(1))
+    time.sleep(0.01)
+    
+    assert cache.get(("u", "a", 2025)) is None
+
+def test_invalidate_drops_every_year_of_a_calendar():
+    cache = MemoryEventCache()
+    cache.set(("u", "a", 2024), make_entry(1))
+    cache.set(("u", "a", 2025), make_entry(1))
+    cache.set(("u", "b", 2025), make_entry(1))
+    cache.invalidate("u", "a")
+    
+    assert cache.get(("u", "a", 2024)) is None
+    assert cache.get(("u", "a", 2025)) is None
+    assert cache.get(("u", "b", 2025)) is not None
+
+def test_sqlite_cache_round_trip(sqlite_path):
+    cache = SQLiteEventCache(sqlite_path)
+    cache.set(("u", "a", 2025), make_entry(3))
+    
+    # A second connection, like another worker process, sees the entry
+    entry = SQLiteEventCache(sqlite_path).get(("u", "a", 2025))
+    assert sorted(entry["events"]) == ["e0", "e1", "e2"]
+    assert entry["sync_token"] == "token"
+    
+    cache.invalidate("u")
+    assert cache.get(("u", "a", 2025)) is None
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_calendar_lists_are_kept_apart_from_event_years(backend, sqlite_path):
+    cache = create_event_cache({"backend": backend, "path": sqlite_path, "calendar_list_ttl": 60})
+    cache.set(("u", "a", 2025), make_entry(1))
+    cache.set_calendar_list("u", {"calendars": {"a": {"id": "a"}}, "sync_token": "token", "synced_at": time.time()})
+    
+    assert cache.keys("u", "") == []
+    assert list(cache.get_calendar_list("u")["calendars"]) == ["a"]
+    
+    cache.invalidate("u", "a")
+    assert cache.get_calendar_list("u") is not None
+    
+    cache.invalidate("u")
+    assert cache.get_calendar_list("u") is None
+
+def test_calendar_lists_expire_on_their_own_ttl():
+    cache = MemoryEventCache(ttl=60, calendar_list_ttl=0)
+    cache.set(("u", "a", 2025), make_entry(1))
+    cache.set_calendar_list("u", {"calendars": {}, "sync_token": None, "synced_at": time.time()})
+    time.sleep(0.01)
+    
+    assert cache.get_calendar_list("u") is None
+    assert cache.get(("u", "a", 2025)) is not None
+
+def test_backends_must_implement_every_method():
+    class ReadOnlyCache(EventCache):
+        def get(self, key):
+            return None
+    
+    with pytest.raises(TypeError):
+        ReadOnlyCache()
+
+def test_create_event_cache_backends(sqlite_path):
+    assert isinstance(create_event_cache({}), MemoryEventCache)
+    assert isinstance(create_event_cache({"backend": "sqlite", "path": sqlite_path}), SQLiteEventCache)
+    assert create_event_cache({"backend": "none"}) is None
+    
+    with pytest.raises(ValueError):
+        create_event_cache({"backend": "redis"})
+
+def test_user_key_survives_token_refreshes():
+    credentials = google.oauth2.credentials.Credentials(token="first", refresh_token="refresh", client_id="c")
+    key = user_cache_key("session-a", credentials)
+    
+    credentials.token = "second"
+    assert user_cache_key("session-a", credentials) == key
+    assert user_cache_key("session-b", credentials) != key
+
+def test_user_key_follows_the_id_token_subject_across_logins():
+    def login(token):
+        return google.oauth2.credentials.Credentials(token=token, id_token=make_id_token("1234"), client_id="c")
+    
+    assert user_cache_key("session-a", login("first")) == user_cache_key("session-b", login("second"))
+    assert user_cache_key("session-a", login("first")) != user_cache_key("session-a")
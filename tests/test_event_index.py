@@ -0,0 +1,58 @@
+import random
+from datetime import date, timedelta
+from app.services.event_index import EventIndex, EventIndexCache
+from tests.fake_calendar import make_event
+
+def random_events(count, seed=0):
+    rng = random.Random(seed)
+    events = []
+    for i in range(count):
+        day = date(2025, 1, 1) + timedelta(days=rng.randint(0, 364))
+        if rng.random() < 0.3:
+            length = rng.choice([1, 2, 6, 7, 8, 30, 120])
+            events.append(make_event(f"e{i}", day.isoformat(), (day + timedelta(days=length)).isoformat()))
+        else:
+            events.append(make_event(f"e{i}", f"{day.isoformat()}T{rng.randint(0, 22):02d}:30:00Z"))
+    return events
+
+def brute_force(events, first_day, last_day):
+    found = set()
+    for event in events:
+        start = date.fromisoformat((event["start"].get("date") or event["start"]["dateTime"])[:10])
+        end = date.fromisoformat((event["end"].get("date") or event["end"]["dateTime"])[:10])
+        if "date" in event["end"]:
+            end -= timedelta(days=1)  # All-day ends are exclusive
+        if start <= last_day and end >= first_day:
+            found.add(event["id"])
+    return found
+
+def test_windows_match_a_full_scan():
+    events = random_events(2000)
+    index = EventIndex(events)
+    rng = random.Random(1)
+
+    for _ in range(200):
+        first_day = date(2024, 12, 1) + timedelta(days=rng.randint(0, 420))
+        last_day = first_day + timedelta(days=rng.choice([0, 6, 30, 90, 365]))
+        found = [event["id"] for event in index.overlapping(first_day, last_day)]
+
+        assert len(found) == len(set(found))
+        assert set(found) == brute_force(events, first_day, last_day)
+
+def test_events_without_dates_are_skipped():
+    index = EventIndex([{"id": "nodate", "start": {}, "end": {}}, make_event("e1", "2025-01-01")])
+    assert len(index) == 1
+    assert index.overlapping(date(2025, 1, 1), date(2025, 1, 1))[0]["id"] == "e1"
+
+def test_index_is_rebuilt_when_the_entry_changes():
+    cache = EventIndexCache(max_entries=1)
+    entry = {"events": {"e1": make_event("e1", "2025-01-01")}}
+
+    index = cache.get(("user", "work", 2025), entry)
+    assert cache.get(("user", "work", 2025), entry) is index
+
+    updated = {"events": dict(entry["events"], e2=make_event("e2", "2025-01-02"))}
+    assert len(cache.get(("user", "work", 2025), updated)) == 2
+
+    cache.get(("user", "home", 2025), entry)
+    assert len(cache) == 1
@@ -0,0 +1,71 @@
+import threading
+import google.oauth2.credentials
+import pytest
+from app.services import calendar_service, google_client
+from app.services.calendar_service import get_events_for_year, configure_fetch_threads
+from app.services.google_client import get_calendar_service, get_discovery_document
+from tests.fake_calendar import FakeTransport, make_event
+
+def make_credentials(token):
+    return google.oauth2.credentials.Credentials(token=token)
+
+def test_discovery_document_loaded_once():
+    assert get_discovery_document() is get_discovery_document()
+    assert get_discovery_document()["name"] == "calendar"
+
+def test_service_reused_for_the_same_credentials():
+    credentials = make_credentials("token-a")
+    first = get_calendar_service(credentials)
+    
+    assert get_calendar_service(credentials) is first
+    assert first.events() is get_calendar_service(credentials).events()
+
+def test_credentials_are_never_swapped_on_a_pooled_service():
+    first_credentials = make_credentials("token-a")
+    first = get_calendar_service(first_credentials)
+    second = get_calendar_service(make_credentials("token-b"))
+    
+    assert second is not first
+    assert first.http.credentials is first_credentials
+    assert second.http.credentials.token == "token-b"
+
+def test_each_thread_gets_its_own_transport():
+    credentials = make_credentials("t")
+    services = []
+    thread = threading.Thread(target=lambda: services.append(get_calendar_service(credentials)))
+    thread.start()
+    thread.join()
+    
+    assert services[0] is not get_calendar_service(credentials)
+
+def test_requests_target_calendar_api():
+    request = get_calendar_service(make_credentials("t")).events().list(calendarId="primary")
+    assert request.uri.startswith("https://www.googleapis.com/calendar/v3/calendars/primary/events")
+
+@pytest.fixture
+def fetch_threads():
+    # A small shared pool, replaced afterwards so no thread keeps fakes alive
+    configure_fetch_threads(2)
+    yield 2
+    configure_fetch_threads(calendar_service.DEFAULT_FETCH_THREADS)
+
+def test_transports_are_reused_across_requests(monkeypatch, fetch_threads):
+    calendars = {
+        "work": [make_event("w1", "2025-03-01")],
+        "home": [make_event("h1", "2025-06-01")],
+        "team": [make_event("t1", "2025-09-01")],
+    }
+    created = []
+    get_discovery_document()
+    monkeypatch.setattr(google_client, "create_transport", lambda: FakeTransport(calendars, created=created))
+    credentials = make_credentials("token")
+    
+    for _ in range(3):
+        errors = {}
+        events = get_events_for_year(credentials, 2025, list(calendars), errors)
+        assert errors == {}
+        assert sum(len(day) for day in events.values()) == 3
+    
+    # Nine calendar loads over three requests, at most one connection per fetch thread
+    assert len(created) <= fetch_threads
+    assert sum(transport.requests for transport in created) == 9
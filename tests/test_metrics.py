@@ -0,0 +1,50 @@
+import threading
+from app.metrics import Registry, RequestTimings, start_request, stage, current_timings, METRIC_PREFIX
+
+def test_render_counter_and_histogram():
+    registry = Registry()
+    calls = registry.counter("calls", "Calls made.", ("method",))
+    latency = registry.histogram("latency_seconds", "Latency.", ("method",), buckets=(0.1, 1))
+
+    calls.inc(method="list")
+    calls.inc(2, method="list")
+    latency.observe(0.05, method="list")
+    latency.observe(0.5, method="list")
+    latency.observe(5, method="list")
+
+    lines = registry.render().splitlines()
+    assert f"# TYPE {METRIC_PREFIX}calls counter" in lines
+    assert f'{METRIC_PREFIX}calls_total{{method="list"}} 3' in lines
+    assert f'{METRIC_PREFIX}latency_seconds_bucket{{method="list",le="0.1"}} 1' in lines
+    assert f'{METRIC_PREFIX}latency_seconds_bucket{{method="list",le="1"}} 2' in lines
+    assert f'{METRIC_PREFIX}latency_seconds_bucket{{method="list",le="+Inf"}} 3' in lines
+    assert f'{METRIC_PREFIX}latency_seconds_sum{{method="list"}} 5.55' in lines
+    assert f'{METRIC_PREFIX}latency_seconds_count{{method="list"}} 3' in lines
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    registry.counter("errors", "Errors.", ("message",)).inc(message='say "hi"\n')
+    assert f'{METRIC_PREFIX}errors_total{{message="say \\"hi\\"\\n"}} 1' in registry.render()
+
+def test_stages_add_up_across_threads():
+    timings = start_request()
+
+    def work():
+        with stage("google"):
+            pass
+
+    threads = [threading.Thread(target=lambda: timings.add("google", 0.25)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    work()
+
+    assert current_timings() is timings
+    assert timings.stages["google"] >= 1.0
+    header = timings.server_timing()
+    assert header.startswith("google;dur=100")
+    assert header.split(", ")[-1].startswith("total;dur=")
+
+def test_server_timing_without_stages():
+    assert RequestTimings().server_timing().startswith("total;dur=")
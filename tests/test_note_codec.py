@@ -0,0 +1,38 @@
+import re
+import pytest
+from app.services.note_codec import NOTE_START, NOTE_END, extract_note, extract_notes, inject_note
+
+def original_extract(description):
+    # The regex the calendar service used before the codec
+    match = re.search(NOTE_START + "(.*?)" + NOTE_END, description or "", re.DOTALL)
+    return match.group(1) if match else None
+
+DESCRIPTIONS = [
+    None,
+    "",
+    "Plain description",
+    f"{NOTE_START}just a note{NOTE_END}",
+    f"Agenda\n\n{NOTE_START}multi\nline{NOTE_END}\ntrailer",
+    f"{NOTE_START}{NOTE_END}",
+    f"{NOTE_START}first{NOTE_END} and {NOTE_START}second{NOTE_END}",
+    f"{NOTE_END} before {NOTE_START}unterminated",
+    f"{NOTE_START}unterminated",
+]
+
+@pytest.mark.parametrize("description", DESCRIPTIONS)
+def test_extract_matches_original_regex(description):
+    assert extract_note(description) == original_extract(description)
+
+def test_extract_notes_in_one_call():
+    assert extract_notes(DESCRIPTIONS) == [original_extract(d) for d in DESCRIPTIONS]
+
+def test_inject_appends_or_replaces():
+    assert inject_note("", "hi") == f"{NOTE_START}hi{NOTE_END}"
+    assert inject_note("Agenda", "hi") == f"Agenda\n\n{NOTE_START}hi{NOTE_END}"
+    
+    description = f"Agenda\n\n{NOTE_START}old{NOTE_END} x {NOTE_START}older{NOTE_END}\nend"
+    assert inject_note(description, "new") == f"Agenda\n\n{NOTE_START}new{NOTE_END}\nend"
+
+def test_inject_keeps_backslashes_literal():
+    description = inject_note(f"{NOTE_START}old{NOTE_END}", r"C:\new\1")
+    assert extract_note(description) == r"C:\new\1"
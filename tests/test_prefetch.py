@@ -0,0 +1,109 @@
+import time
+import pytest
+from app.services import prefetch
+from app.services.prefetch import YearPrefetcher, create_prefetcher
+from app.services.event_cache import MemoryEventCache
+from tests.fake_calendar import FakeCalendarService, make_event
+
+@pytest.fixture
+def fake_service(monkeypatch):
+    """Fake Calendar API with events in several years"""
+    service = FakeCalendarService(calendars={
+        "work": [make_event("w24", "2024-06-01"), make_event("w25", "2025-06-01"),
+                 make_event("w26", "2026-06-01")],
+        "home": [make_event("h25", "2025-02-01")],
+    })
+    monkeypatch.setattr(prefetch, "get_calendar_service", lambda credentials: service)
+    return service
+
+def options(cache, **overrides):
+    return dict({"cache": cache, "user_key": "user", "sync_interval": 30}, **overrides)
+
+def wait_until_idle(prefetcher, timeout=5):
+    deadline = time.monotonic() + timeout
+    while prefetcher.pending() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert prefetcher.pending() == []
+
+def test_adjacent_years_are_warmed(fake_service):
+    cache = MemoryEventCache()
+    prefetcher = YearPrefetcher(max_workers=2)
+
+    prefetcher.year_viewed(None, 2025, ["work", "home"], options(cache))
+    wait_until_idle(prefetcher)
+
+    assert set(cache.get(("user", "work", 2024))["events"]) == {"w24"}
+    assert set(cache.get(("user", "work", 2026))["events"]) == {"w26"}
+    assert cache.get(("user", "home", 2024))["events"] == {}
+    # The year being viewed is left to the request that served it
+    assert cache.get(("user", "work", 2025)) is None
+    prefetcher.shutdown()
+
+def test_fresh_years_are_not_fetched_again(fake_service):
+    cache = MemoryEventCache()
+    prefetcher = YearPrefetcher()
+
+    prefetcher.year_viewed(None, 2025, ["work"], options(cache))
+    wait_until_idle(prefetcher)
+    fake_service.calls.clear()
+
+    prefetcher.year_viewed(None, 2025, ["work"], options(cache))
+    wait_until_idle(prefetcher)
+    assert fake_service.calls == []
+    prefetcher.shutdown()
+
+def test_navigating_away_cancels_queued_years(fake_service):
+    fake_service.latency = 0.1
+    cache = MemoryEventCache()
+    prefetcher = YearPrefetcher(max_workers=1)
+
+    prefetcher.year_viewed(None, 2025, ["work", "home"], options(cache))
+    prefetcher.year_viewed(None, 2030, ["work", "home"], options(cache))
+    assert len([key for key in prefetcher.pending() if key[2] not in (2029, 2031)]) <= 1
+    wait_until_idle(prefetcher)
+
+    # At most the job that was already running reached Google
+    fetched = {(call[1], call[2]["timeMin"][:4]) for call in fake_service.calls}
+    assert len([key for key in fetched if key[1] in ("2024", "2026")]) <= 1
+    assert cache.get(("user", "home", 2031)) is not None
+    prefetcher.shutdown()
+
+def test_viewed_year_is_refreshed_on_an_interval(fake_service):
+    cache = MemoryEventCache()
+    prefetcher = YearPrefetcher(adjacent_years=0, refresh_interval=0.05)
+
+    prefetcher.year_viewed(None, 2025, ["home"], options(cache))
+    deadline = time.monotonic() + 5
+    while cache.get(("user", "home", 2025)) is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    fake_service.update_event("home", make_event("h2", "2025-03-01"))
+    while "h2" not in cache.get(("user", "home", 2025))["events"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert set(cache.get(("user", "home", 2025))["events"]) == {"h25", "h2"}
+    prefetcher.shutdown()
+
+def test_idle_users_are_forgotten_without_a_refresher(fake_service):
+    cache = MemoryEventCache()
+    prefetcher = YearPrefetcher(adjacent_years=0, idle_timeout=0.05)
+
+    prefetcher.year_viewed(None, 2025, ["work"], options(cache, user_key="idle"))
+    prefetcher.year_viewed(None, 2025, ["work"], options(cache, user_key="active"))
+    time.sleep(0.1)
+    prefetcher.year_viewed(None, 2025, ["work"], options(cache, user_key="active"))
+    prefetcher.year_viewed(None, 2025, ["work"], options(cache, user_key="new"))
+
+    assert list(prefetcher._users) == ["active", "new"]
+    prefetcher.shutdown()
+
+def test_nothing_is_prefetched_without_a_cache(fake_service):
+    prefetcher = YearPrefetcher()
+    prefetcher.year_viewed(None, 2025, ["work"], options(None))
+    assert prefetcher.pending() == []
+    assert fake_service.calls == []
+    prefetcher.shutdown()
+
+def test_create_prefetcher():
+    assert create_prefetcher({"enabled": False}) is None
+    assert create_prefetcher({"adjacent_years": 2}).adjacent_years == 2
@@ -0,0 +1,202 @@
+import asyncio
+import threading
+import time
+import pytest
+from googleapiclient.errors import HttpError
+from app.services import calendar_service, scheduler
+from app.services.calendar_service import get_events_for_year
+from app.services.scheduler import GoogleScheduler, SingleFlight, TokenBucket, acting_for, is_retryable
+from tests.fake_calendar import FakeCalendarService, make_event, make_http_error, make_rate_limit_error
+
+@pytest.fixture
+def fast_scheduler(monkeypatch):
+    """Process-wide scheduler with millisecond backoff"""
+    fast = GoogleScheduler(base_delay=0.001, max_delay=0.01)
+    monkeypatch.setattr(scheduler, "_scheduler", fast)
+    return fast
+
+@pytest.fixture
+def fake_service(monkeypatch):
+    service = FakeCalendarService(calendars={"work": [make_event("w1", "2025-03-01")]})
+    monkeypatch.setattr(calendar_service, "get_calendar_service", lambda credentials: service)
+    return service
+
+@pytest.mark.parametrize("error", [
+    make_rate_limit_error(429),
+    make_rate_limit_error(403),
+    make_rate_limit_error(403, "userRateLimitExceeded"),
+    make_http_error(503),
+])
+def test_rate_limits_and_server_errors_are_retried(fast_scheduler, fake_service, error):
+    fake_service.transient_errors = {"work": [error, error]}
+    errors = {}
+
+    result = get_events_for_year(None, 2025, ["work"], errors=errors)
+
+    assert errors == {}
+    assert [event["id"] for event in result["2025-03-01"]] == ["w1"]
+    assert fake_service.transient_errors["work"] == []
+
+@pytest.mark.parametrize("error", [make_http_error(403, "forbidden"), make_http_error(404)])
+def test_other_errors_are_not_retried(fast_scheduler, fake_service, error):
+    fake_service.transient_errors = {"work": [error]}
+    errors = {}
+
+    get_events_for_year(None, 2025, ["work"], errors=errors)
+
+    # A retry would have succeeded
+    assert set(errors) == {"work"}
+
+def test_gives_up_after_max_retries(fast_scheduler, fake_service):
+    fake_service.transient_errors = {"work": [make_rate_limit_error(429)] * 10}
+    errors = {}
+
+    get_events_for_year(None, 2025, ["work"], errors=errors)
+
+    assert set(errors) == {"work"}
+    assert len(fake_service.transient_errors["work"]) == 10 - (fast_scheduler.max_retries + 1)
+
+def test_backoff_grows_with_jitter_and_honours_retry_after():
+    gate = GoogleScheduler(base_delay=1, max_delay=5)
+
+    delays = [gate.retry_delay(429, b"", 2) for _ in range(200)]
+    assert all(0 <= delay <= 4 for delay in delays)
+    assert len(set(delays)) > 1
+
+    assert all(gate.retry_delay(503, b"", 3) <= 5 for _ in range(50))
+    assert gate.retry_delay(429, b"", 0, retry_after="3") >= 3
+    assert gate.retry_delay(429, b"", 0, retry_after="60") == 5
+    assert gate.retry_delay(429, b"", gate.max_retries) is None
+    assert gate.retry_delay(400, b"", 0) is None
+
+def test_retryable_statuses():
+    assert is_retryable(429) and is_retryable(500)
+    assert is_retryable(403, '{"reason": "rateLimitExceeded"}')
+    assert not is_retryable(403, b'{"reason": "forbidden"}')
+    assert not is_retryable(410)
+
+def test_token_bucket_allows_a_burst_then_the_rate():
+    bucket = TokenBucket(rate=10, capacity=3)
+    now = bucket.updated
+
+    assert [bucket.reserve(now) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.reserve(now) == pytest.approx(0.1)
+    assert bucket.reserve(now) == pytest.approx(0.2)
+    # A second later the debt is paid and the bucket has refilled
+    assert bucket.reserve(now + 1) == 0.0
+
+def test_users_are_throttled_separately():
+    gate = GoogleScheduler(user_rate=20, user_burst=2)
+
+    def timed_calls(user_key, count):
+        started = time.monotonic()
+        with acting_for(user_key):
+            for _ in range(count):
+                gate.run(lambda: None)
+        return time.monotonic() - started
+
+    assert timed_calls("busy", 6) >= 0.15
+    assert timed_calls("quiet", 2) < 0.05
+    # Calls not charged to a user are never throttled
+    assert timed_calls(None, 20) < 0.05
+
+def test_concurrent_calls_are_capped():
+    gate = GoogleScheduler(max_concurrent=2)
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def call():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    threads = [threading.Thread(target=gate.run, args=(call,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak[0] == 2
+
+def test_backoff_does_not_hold_a_slot():
+    gate = GoogleScheduler(max_concurrent=1, base_delay=0.2, max_delay=0.2)
+    attempts = []
+
+    def failing():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise make_rate_limit_error(429, retry_after=0.2)
+
+    thread = threading.Thread(target=gate.run, args=(failing,))
+    thread.start()
+    time.sleep(0.05)
+
+    started = time.monotonic()
+    gate.run(lambda: None)
+    assert time.monotonic() - started < 0.1
+    thread.join()
+    assert len(attempts) == 2
+
+def test_single_flight_shares_one_call():
+    flights = SingleFlight()
+    calls = []
+    results = []
+
+    def load():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"events": []}
+
+    threads = [threading.Thread(target=lambda: results.append(flights.do("key", load))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len(results) == 5 and all(result is results[0] for result in results)
+
+    # Once the call is over the next one runs again
+    flights.do("key", load)
+    assert len(calls) == 2
+
+def test_single_flight_shares_errors():
+    flights = SingleFlight()
+    failures = []
+
+    def load():
+        time.sleep(0.1)
+        raise make_rate_limit_error(429)
+
+    def caller():
+        try:
+            flights.do("key", load)
+        except HttpError as e:
+            failures.append(e)
+
+    threads = [threading.Thread(target=caller) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(failures) == 3
+
+def test_single_flight_coalesces_coroutines():
+    flights = SingleFlight()
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(flights.do_async("key", load) for _ in range(4)))
+
+    assert asyncio.run(main()) == ["result"] * 4
+    assert len(calls) == 1
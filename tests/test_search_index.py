@@ -0,0 +1,193 @@
+import random
+import time
+from datetime import date, timedelta
+from app.services import calendar_service
+from app.services.bucketing import event_day_span
+from app.services.calendar_service import search_events, event_sort_key
+from app.services.event_cache import MemoryEventCache
+from app.services.note_codec import inject_note
+from app.services.search_index import SearchIndex, SearchIndexCache, tokenize, searchable_text
+from tests.fake_calendar import FakeCalendarService, make_event
+
+YEAR = (date(2025, 1, 1), date(2025, 12, 31))
+
+def ids(result):
+    return [event["id"] for event in result[0]]
+
+def test_text_is_split_into_casefolded_words():
+    assert tokenize("Team-Sync: Straße 42") == ["team", "sync", "strasse", "42"]
+    assert tokenize(None) == []
+
+    event = make_event("e1", "2025-03-01", summary="Dentist", location="Main St",
+                       description="<b>Bring</b> forms &amp; card" + inject_note("", "Ask about braces"))
+    assert tokenize(searchable_text(event)) == [
+        "dentist", "main", "st", "bring", "forms", "card", "ask", "about", "braces"
+    ]
+
+def test_every_word_is_matched_as_a_prefix():
+    index = SearchIndex({
+        "e1": make_event("e1", "2025-03-01", summary="Dentist appointment"),
+        "e2": make_event("e2", "2025-01-05", summary="Dental plan review"),
+        "e3": make_event("e3", "2025-02-01", summary="Team review", location="Dentons office"),
+    })
+
+    assert ids(index.search("dent", *YEAR)) == ["e2", "e3", "e1"]
+    assert ids(index.search("DENT review", *YEAR)) == ["e2", "e3"]
+    assert ids(index.search("dentistry", *YEAR)) == []
+    assert index.search("  --  ", *YEAR) == ([], set(), 0)
+
+def test_limit_keeps_the_first_matches_and_the_total():
+    index = SearchIndex({
+        f"e{day}": make_event(f"e{day}", f"2025-03-{day:02d}", summary="Standup") for day in range(1, 11)
+    })
+
+    events, dates, total = index.search("standup", *YEAR, limit=3)
+    assert [event["id"] for event in events] == ["e1", "e2", "e3"]
+    assert total == 10
+    assert len(dates) == 10
+
+def test_dates_cover_multi_day_events_within_the_window():
+    index = SearchIndex({
+        "trip": make_event("trip", "2024-12-30", "2025-01-03", summary="Ski trip"),
+        "nodate": {"id": "nodate", "summary": "Ski wax", "start": {}, "end": {}},
+    })
+
+    # Events without a date are never matched
+    events, dates, total = index.search("ski", *YEAR)
+    assert [event["id"] for event in events] == ["trip"] and total == 1
+    assert sorted(dates) == [date(2025, 1, 1), date(2025, 1, 2)]
+
+def test_only_events_within_the_window_are_matched():
+    index = SearchIndex({
+        "before": make_event("before", "2024-12-20", summary="Standup"),
+        "newyear": make_event("newyear", "2024-12-31", "2025-01-02", summary="Standup"),
+        "inside": make_event("inside", "2025-06-01", summary="Standup"),
+        "sabbatical": make_event("sabbatical", "2024-11-01", "2026-02-01", summary="Standup"),
+        "after": make_event("after", "2026-01-05", summary="Standup"),
+    })
+
+    events, dates, total = index.search("standup", *YEAR, limit=2)
+    assert [event["id"] for event in events] == ["sabbatical", "newyear"]
+    assert total == 3
+    assert len(dates) == 365
+
+def test_update_only_reindexes_changed_events():
+    events = {f"e{i}": make_event(f"e{i}", "2025-03-01", summary="Standup") for i in range(100)}
+    index = SearchIndex(events)
+    assert index.update(events) == 0
+
+    # A sync hands out a new dict holding the unchanged event objects
+    synced = dict(events)
+    synced["e1"] = make_event("e1", "2025-03-01", summary="Retro", etag='"2"')
+    del synced["e2"]
+    synced["new"] = make_event("new", "2025-04-01", summary="Retro planning")
+    assert index.update(synced) == 3
+
+    assert index.search("standup", *YEAR)[2] == 98
+    assert ids(index.search("retro", *YEAR)) == ["e1", "new"]
+    # Words no longer used by any event are gone
+    assert index.update({}) == 100
+    assert index._words == [] and index._postings.sets == {}
+
+def test_matches_agree_with_a_full_scan_across_updates():
+    rng = random.Random(0)
+    words = ["alpha", "alps", "beta", "bet", "gamma", "game", "delta"]
+
+    def random_event(event_id, version):
+        day = date(2025, 1, 1) + timedelta(days=rng.randint(-10, 364))
+        end = day + timedelta(days=rng.choice([1, 1, 3, 40]))
+        return make_event(event_id, day.isoformat(), end.isoformat(), etag=f'"{version}"',
+                          summary=" ".join(rng.sample(words, 2)))
+
+    events = {f"e{i}": random_event(f"e{i}", 1) for i in range(300)}
+    index = SearchIndex(events)
+
+    for version in range(2, 6):
+        # Replace, remove and add a few events, reusing freed slots
+        events = dict(events)
+        for event_id in rng.sample(sorted(events), 20):
+            del events[event_id]
+        for event_id in rng.sample(sorted(events), 20):
+            events[event_id] = random_event(event_id, version)
+        for i in range(20):
+            events[f"v{version}_{i}"] = random_event(f"v{version}_{i}", version)
+        index.update(events)
+
+        for query in ("al", "alps", "bet gam", "d", "game alpha"):
+            terms = tokenize(query)
+            expected = sorted(
+                (event for event in events.values()
+                 if all(any(word.startswith(term) for word in tokenize(event["summary"])) for term in terms)
+                 and event_day_span(event)[1] >= YEAR[0] and event_day_span(event)[0] <= YEAR[1]),
+                key=event_sort_key
+            )
+            found, dates, total = index.search(query, *YEAR)
+            assert [event["id"] for event in found] == [event["id"] for event in expected]
+            assert total == len(expected)
+            assert dates == {
+                day for event in expected for day in daterange(*event_day_span(event)) if YEAR[0] <= day <= YEAR[1]
+            }
+
+def daterange(first, last):
+    return [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+
+def test_copies_with_the_same_etag_are_not_reindexed():
+    event = make_event("e1", "2025-03-01", summary="Standup")
+    index = SearchIndex({"e1": event})
+
+    # The sqlite backend returns new objects on every read
+    assert index.update({"e1": dict(event)}) == 0
+    assert index.update({"e1": dict(event, summary="Retro", etag='"2"')}) == 1
+    assert ids(index.search("retro", *YEAR)) == ["e1"]
+
+def test_index_cache_updates_indexes_in_place():
+    cache = SearchIndexCache(max_entries=1)
+    entry = {"events": {"e1": make_event("e1", "2025-01-01", summary="Dentist")}}
+
+    index = cache.get(("user", "work", 2025), entry)
+    updated = {"events": dict(entry["events"], e2=make_event("e2", "2025-01-02", summary="Dentist"))}
+    assert cache.get(("user", "work", 2025), updated) is index
+    assert len(index) == 2
+
+    cache.get(("user", "home", 2025), entry)
+    assert len(cache) == 1
+
+def test_search_reads_synced_years_and_notes(monkeypatch):
+    service = FakeCalendarService(calendars={
+        "work": [make_event("w1", "2025-03-01", summary="Planning",
+                            description=inject_note("Agenda", "Budget review"))],
+        "home": [make_event("h1", "2025-06-01", summary="Budget meeting"), make_event("h2", "2025-06-02")],
+    })
+    monkeypatch.setattr(calendar_service, "get_calendar_service", lambda credentials: service)
+    cache = MemoryEventCache()
+    search_cache = SearchIndexCache()
+    options = dict(cache=cache, user_key="alice", sync_interval=60, search_cache=search_cache)
+
+    result = search_events(None, 2025, ["work", "home"], "budg", **options)
+    assert [(event["calendarId"], event["id"]) for event in result["events"]] == [("work", "w1"), ("home", "h1")]
+    assert result["events"][0]["note"] == "Budget review"
+    assert result["events"][1]["span"] == [151, 151]
+    assert result["dates"] == [date(2025, 3, 1), date(2025, 6, 1)]
+    assert result["total"] == 2
+
+    # Fresh cached years are searched without asking Google
+    service.calls.clear()
+    assert search_events(None, 2025, ["work", "home"], "agenda", **options)["total"] == 1
+    assert service.calls == []
+
+    # Without a cache the year is fetched and indexed for the call
+    assert search_events(None, 2025, ["home"], "meeting")["total"] == 1
+
+def test_search_counts_only_events_within_the_year():
+    cache = MemoryEventCache()
+    events = [make_event("old", "2024-03-01", summary="Budget"), make_event("new", "2025-03-01", summary="Budget"),
+              make_event("next", "2026-03-01", summary="Budget")]
+    cache.set(("alice", "work", 2025), {
+        "events": {event["id"]: event for event in events}, "sync_token": "token", "synced_at": time.time()
+    })
+
+    result = search_events(None, 2025, ["work"], "budget", cache=cache, user_key="alice", sync_interval=60)
+
+    assert [event["id"] for event in result["events"]] == ["new"]
+    assert result["total"] == 1
+    assert result["dates"] == [date(2025, 3, 1)]
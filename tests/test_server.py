@@ -0,0 +1,100 @@
+import pytest
+import yaml
+from flask import Flask, request
+from app import server
+from app.server import server_settings, prepare_app, serve_production, DEFAULT_SERVER_SETTINGS, SERVE_MODES
+import run
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    
+    @app.route("/")
+    def index():
+        return request.scheme
+    
+    return app
+
+def test_command_line_overrides_config():
+    settings = server_settings(
+        {"mode": "production", "workers": 3, "threads": 4},
+        {"mode": None, "workers": 6, "threads": None}
+    )
+    assert settings["mode"] == "production"
+    assert settings["workers"] == 6
+    assert settings["threads"] == 4
+    assert settings["port"] == DEFAULT_SERVER_SETTINGS["port"]
+
+def test_invalid_settings_are_rejected():
+    with pytest.raises(ValueError):
+        server_settings({"mode": "staging"})
+    with pytest.raises(ValueError):
+        server_settings({}, {"threads": 0})
+
+def test_command_line_accepts_every_serve_mode():
+    parser = run.create_parser()
+    for mode in SERVE_MODES:
+        assert parser.parse_args(["--serve", mode]).serve == mode
+    
+    args = parser.parse_args(["--config", "config.yaml", "--google-client", "client.json", "--info"])
+    assert (args.config, args.google_client, args.info) == ("config.yaml", "client.json", True)
+    
+    with pytest.raises(SystemExit):
+        parser.parse_args(["--serve", "staging"])
+
+def test_command_line_values_override_the_server_config(tmp_path):
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(yaml.dump({"server": {"mode": "production", "port": 8000, "workers": 3, "threads": 4}}))
+    
+    args = run.create_parser().parse_args([
+        "--config", str(config_path), "--serve", "asgi", "--port", "9000", "--threads", "16"
+    ])
+    settings = run.command_line_settings(args)
+    assert (settings["mode"], settings["port"], settings["threads"]) == ("asgi", 9000, 16)
+    # Values not given on the command line come from the config, then the defaults
+    assert settings["workers"] == 3
+    assert settings["host"] == DEFAULT_SERVER_SETTINGS["host"]
+    
+    args = run.create_parser().parse_args(["--config", str(tmp_path / "missing.yaml"), "--workers", "5"])
+    assert run.command_line_settings(args) == dict(DEFAULT_SERVER_SETTINGS, workers=5)
+
+def test_prepare_app_disables_debug_and_trusts_proxy(app):
+    app.config["DEBUG"] = True
+    prepare_app(app, server_settings({"proxy_fix": True}))
+    assert app.config["DEBUG"] is False
+
+    response = app.test_client().get("/", headers={"X-Forwarded-Proto": "https"})
+    assert response.get_data(as_text=True) == "https"
+
+def test_production_needs_a_server(monkeypatch):
+    monkeypatch.setattr(server, "gunicorn", None)
+    monkeypatch.setattr(server, "waitress", None)
+    with pytest.raises(RuntimeError):
+        serve_production(lambda: None, server_settings({"mode": "production"}))
+
+@pytest.mark.parametrize("mode, missing", [("production", "gunicorn"), ("asgi", "uvicorn and httpx")])
+def test_run_reports_missing_server_packages(monkeypatch, capsys, mode, missing):
+    for name in ("gunicorn", "waitress", "uvicorn", "httpx"):
+        monkeypatch.setattr(server, name, None)
+    monkeypatch.setattr(server.sys, "platform", "linux")
+    monkeypatch.setattr("sys.argv", ["run.py", f"--serve={mode}"])
+
+    with pytest.raises(SystemExit) as exit_info:
+        run.main()
+
+    assert exit_info.value.code == 1
+    assert f"{mode} mode needs {missing}" in capsys.readouterr().out
+
+def test_waitress_serves_the_factory_app(monkeypatch, app):
+    served = {}
+
+    class FakeWaitress:
+        @staticmethod
+        def serve(wsgi_app, host, port, threads):
+            served.update(app=wsgi_app, host=host, port=port, threads=threads)
+
+    monkeypatch.setattr(server, "gunicorn", None)
+    monkeypatch.setattr(server, "waitress", FakeWaitress)
+    serve_production(lambda: app, server_settings({"mode": "production", "threads": 12}))
+
+    assert served == {"app": app, "host": "127.0.0.1", "port": 5000, "threads": 12}
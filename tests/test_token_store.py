@@ -0,0 +1,116 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+import google.auth.exceptions
+import google.oauth2.credentials
+import pytest
+from app.services.token_store import (
+    CredentialManager, TokenStore, MemoryTokenStore, SQLiteTokenStore, credentials_from_dict, credentials_to_dict
+)
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def make_credentials(token="token-0", expires_in=3600):
+    credentials = google.oauth2.credentials.Credentials(
+        token=token,
+        refresh_token="refresh",
+        token_uri="https://oauth2.googleapis.com/token",
+        client_id="client",
+        client_secret="secret",
+        scopes=["https://www.googleapis.com/auth/calendar.readonly"]
+    )
+    credentials.expiry = utcnow() + timedelta(seconds=expires_in)
+    return credentials
+
+@pytest.fixture
+def refreshes(monkeypatch):
+    """Count token refreshes instead of calling Google"""
+    calls = []
+    
+    def refresh(credentials, request):
+        time.sleep(0.05)
+        calls.append(credentials.token)
+        credentials.token = f"token-{len(calls)}"
+        credentials.expiry = utcnow() + timedelta(hours=1)
+    
+    monkeypatch.setattr(google.oauth2.credentials.Credentials, "refresh", refresh)
+    return calls
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_store_round_trip(backend, tmp_path):
+    store = MemoryTokenStore() if backend == "memory" else SQLiteTokenStore(str(tmp_path / "tokens.db"))
+    credentials = make_credentials()
+    data = credentials_to_dict(credentials)
+    
+    store.set("key", data)
+    assert store.get("key") == data
+    assert credentials_from_dict(store.get("key")).expiry == credentials.expiry
+    
+    store.delete("key")
+    assert store.get("key") is None
+
+def test_backends_must_implement_every_method():
+    class ReadOnlyStore(TokenStore):
+        def get(self, key):
+            return None
+    
+    with pytest.raises(TypeError):
+        ReadOnlyStore()
+
+def test_session_ids_are_not_stored():
+    store = MemoryTokenStore()
+    session_id = CredentialManager(store).login(make_credentials())
+    
+    assert session_id not in store._entries
+    assert len(store._entries) == 1
+
+def test_concurrent_requests_share_one_refresh(refreshes):
+    manager = CredentialManager(MemoryTokenStore())
+    session_id = manager.login(make_credentials(expires_in=60))
+    
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(manager.get(session_id).token))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert refreshes == ["token-0"]
+    assert results == ["token-1"] * 8
+    assert manager.store.get(next(iter(manager.store._entries)))["token"] == "token-1"
+
+def test_token_refreshed_by_another_process_is_adopted(refreshes, tmp_path):
+    path = str(tmp_path / "tokens.db")
+    first = CredentialManager(SQLiteTokenStore(path))
+    second = CredentialManager(SQLiteTokenStore(path))
+    session_id = first.login(make_credentials(expires_in=60))
+    second.get(session_id)
+    
+    first.get(session_id)
+    
+    assert second.get(session_id).token == "token-1"
+    assert refreshes == ["token-0"]
+
+def test_logout_elsewhere_ends_live_session(tmp_path):
+    path = str(tmp_path / "tokens.db")
+    first = CredentialManager(SQLiteTokenStore(path), recheck_interval=0)
+    second = CredentialManager(SQLiteTokenStore(path), recheck_interval=0)
+    session_id = first.login(make_credentials())
+    assert second.get(session_id) is not None
+    
+    first.logout(session_id)
+    
+    assert second.get(session_id) is None
+
+def test_revoked_grant_logs_out(monkeypatch):
+    def refresh(credentials, request):
+        raise google.auth.exceptions.RefreshError("invalid_grant")
+    
+    monkeypatch.setattr(google.oauth2.credentials.Credentials, "refresh", refresh)
+    manager = CredentialManager(MemoryTokenStore())
+    session_id = manager.login(make_credentials(expires_in=0))
+    
+    assert manager.get(session_id) is None
+    assert manager.get(session_id) is None